@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.checksum
+@file mi/core/checksum.py
+@brief Checksums shared by the port agent client and the instrument drivers.
+
+Each function accepts any buffer (str, bytearray, memoryview). Short inputs are
+handled in pure python, longer ones are reduced with numpy.
+"""
+import struct
+
+import numpy as np
+
+__license__ = 'Apache 2.0'
+
+
+# below this many bytes the numpy call overhead outweighs the vectorized loop
+SMALL = 256
+
+NORTEK_SEED = 0xb58c
+
+# CRC-16/KERMIT, reflected polynomial 0x8408
+KERMIT_POLY = 0x8408
+# number of byte positions held in each block of the kermit position table
+KERMIT_BLOCK = 1024
+
+
+def _as_array(data, dtype=np.uint8):
+    if isinstance(data, memoryview):
+        # python 2 memoryviews only expose the new buffer protocol
+        data = np.asarray(data)
+    return np.frombuffer(data, dtype=dtype, count=len(data) // np.dtype(dtype).itemsize)
+
+
+def lrc(data, seed=0):
+    """
+    Longitudinal redundancy check, the XOR of every byte
+    @param data buffer
+    @param seed LRC of the preceding data
+    @retval LRC (0-255)
+    """
+    if len(data) >= SMALL:
+        # XOR whole 64 bit words, then fold the word and the remaining bytes
+        words = _as_array(data, np.uint64)
+        seed ^= int(np.bitwise_xor.reduce(words))
+        data = bytearray(struct.pack('<Q', seed)) + bytearray(data[len(words) * 8:])
+        seed = 0
+    for val in bytearray(data):
+        seed ^= val
+    return seed
+
+
+def sum16(data):
+    """
+    Sum of every byte, modulo 2^16 (Teledyne PD0, WET Labs AC-S)
+    @param data buffer
+    @retval checksum (0-65535)
+    """
+    if len(data) < SMALL:
+        return sum(bytearray(data)) & 0xffff
+    return int(_as_array(data).sum(dtype=np.uint64)) & 0xffff
+
+
+def nortek_sum(data, words=None):
+    """
+    Nortek checksum, 0xb58c plus the sum of the little endian 16 bit words, modulo 2^16
+    @param data buffer, a trailing odd byte is ignored
+    @param words number of leading words to sum, all by default
+    @retval checksum (0-65535)
+    @throws ValueError if data holds fewer words
+    """
+    if words is not None:
+        if len(data) < words * 2:
+            raise ValueError('Nortek checksum over %d words, only %d bytes' % (words, len(data)))
+        data = data[:words * 2]
+    if len(data) < SMALL:
+        total = sum(struct.unpack_from('<%dH' % (len(data) // 2), data))
+    else:
+        total = int(_as_array(data, np.dtype('<u2')).sum(dtype=np.uint64))
+    return (NORTEK_SEED + total) & 0xffff
+
+
+def _kermit_table():
+    table = np.arange(256, dtype=np.uint16)
+    for _ in range(8):
+        table = np.where(table & 1, (table >> 1) ^ KERMIT_POLY, table >> 1).astype(np.uint16)
+    return table
+
+KERMIT_TABLE = _kermit_table()
+_kermit_table_list = KERMIT_TABLE.tolist()
+_kermit_positions = None
+_KERMIT_OFFSETS = np.arange(KERMIT_BLOCK, dtype=np.intp) * 256
+
+
+def _kermit_position_table():
+    """
+    The CRC is linear in the message, so the CRC of a block is the XOR of the contributions
+    of each byte. Row r holds the CRC of each byte value followed by KERMIT_BLOCK - 1 - r
+    zero bytes, so a block of n bytes uses the last n rows.
+    @retval flattened array (KERMIT_BLOCK * 256) of uint16
+    """
+    global _kermit_positions
+    if _kermit_positions is None:
+        positions = np.empty((KERMIT_BLOCK, 256), dtype=np.uint16)
+        positions[KERMIT_BLOCK - 1] = KERMIT_TABLE
+        for d in range(KERMIT_BLOCK - 2, -1, -1):
+            following = positions[d + 1]
+            positions[d] = (following >> 8) ^ KERMIT_TABLE[following & 0xff]
+        _kermit_positions = positions.ravel()
+    return _kermit_positions
+
+
+def crc_kermit(data, crc=0):
+    """
+    CRC-16/KERMIT as used by the UW HPIES
+    @param data buffer
+    @param crc CRC of the preceding data
+    @retval CRC (0-65535)
+    """
+    if len(data) < SMALL:
+        table = _kermit_table_list
+        for val in bytearray(data):
+            crc = (crc >> 8) ^ table[(crc ^ val) & 0xff]
+        return crc
+
+    positions = _kermit_position_table()
+    array = _as_array(data)
+    for start in range(0, len(array), KERMIT_BLOCK):
+        block = array[start:start + KERMIT_BLOCK]
+        if len(block) < 2:
+            return crc_kermit(block.tostring(), crc)
+        # feeding in a starting CRC is the same as XORing it into the first two bytes
+        block = block.copy()
+        block[0] ^= crc & 0xff
+        block[1] ^= crc >> 8
+        offsets = _KERMIT_OFFSETS[KERMIT_BLOCK - len(block):] + block
+        crc = int(np.bitwise_xor.reduce(positions.take(offsets)))
+    return crc
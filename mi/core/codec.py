@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.codec
+@file mi/core/codec.py
+@brief Serialization codecs for particle, event and command transport
+
+A codec encodes single messages and joins already encoded messages into a
+batch payload without re-encoding them. The content type travels with each
+message so consumers can tell which codec produced it.
+
+    json     stdlib json, the default (text/plain, as published historically)
+    ujson    ujson, same JSON format encoded faster
+    msgpack  MessagePack, smaller binary payloads (application/x-msgpack)
+
+Batch payloads may additionally be compressed (zlib, lz4 or zstd). QPID
+messages carry the compressor name as their content encoding. AMQP brokers
+read the content encoding as a charset, so those messages keep the codec
+encoding and name the compressor in the COMPRESSION_HEADER header instead.
+"""
+__license__ = 'Apache 2.0'
+
+import json
+import struct
+import zlib
+
+from mi.core.exceptions import NotImplementedException
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+DEFAULT_CODEC = 'json'
+COMPRESSION_HEADER = 'x-compression'
+
+
+class Codec(object):
+    name = None
+    content_type = None
+    content_encoding = 'utf-8'
+
+    def encode(self, obj):
+        raise NotImplementedException('encode() not implemented')
+
+    def decode(self, data):
+        raise NotImplementedException('decode() not implemented')
+
+    def join(self, fragments):
+        """
+        Combine encoded messages into the encoding of a list of those messages
+        @param fragments list of encoded messages
+        @retval encoded list
+        """
+        raise NotImplementedException('join() not implemented')
+
+
+class JsonCodec(Codec):
+    name = 'json'
+    content_type = 'text/plain'
+    _encoder = json.JSONEncoder(check_circular=False)
+
+    def encode(self, obj):
+        return self._encoder.encode(obj)
+
+    def decode(self, data):
+        return json.loads(data)
+
+    def join(self, fragments):
+        # matches the separator json.dumps uses for lists
+        return '[%s]' % ', '.join(fragments)
+
+
+class UjsonCodec(JsonCodec):
+    name = 'ujson'
+
+    def encode(self, obj):
+        return ujson.dumps(obj)
+
+    def decode(self, data):
+        return ujson.loads(data)
+
+
+class MsgpackCodec(Codec):
+    name = 'msgpack'
+    content_type = 'application/x-msgpack'
+    content_encoding = 'binary'
+
+    def encode(self, obj):
+        # python 2 str is packed as the msgpack str type, not bin
+        return msgpack.packb(obj, use_bin_type=False)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+    def join(self, fragments):
+        count = len(fragments)
+        if count < 16:
+            header = chr(0x90 | count)
+        elif count < 0x10000:
+            header = struct.pack('>BH', 0xdc, count)
+        else:
+            header = struct.pack('>BI', 0xdd, count)
+        return header + ''.join(fragments)
+
+
+CODECS = {
+    JsonCodec.name: (JsonCodec, json),
+    UjsonCodec.name: (UjsonCodec, ujson),
+    MsgpackCodec.name: (MsgpackCodec, msgpack),
+}
+
+
+def get_codec(name=None):
+    """
+    @param name codec name, None for the default
+    @retval codec instance
+    @raise ValueError if the codec is unknown or its library is not installed
+    """
+    name = name or DEFAULT_CODEC
+    if name not in CODECS:
+        raise ValueError('Unknown codec: %r, expected one of %r' % (name, sorted(CODECS)))
+
+    klass, module = CODECS[name]
+    if module is None:
+        raise ValueError('Codec %r is not available, library not installed' % name)
+    return klass()
+
+
+def detect_codec(data):
+    """
+    Identify the codec of an encoded message. Any JSON encoder decodes as the default json codec.
+    @param data encoded message
+    @retval codec instance
+    """
+    if data.lstrip()[:1] in ('{', '[', '"') or not data:
+        return get_codec(JsonCodec.name)
+    return get_codec(MsgpackCodec.name)
+
+
+class Compressor(object):
+    name = None
+
+    def compress(self, data):
+        raise NotImplementedException('compress() not implemented')
+
+    def decompress(self, data):
+        raise NotImplementedException('decompress() not implemented')
+
+
+class ZlibCompressor(Compressor):
+    name = 'zlib'
+    level = 6
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class Lz4Compressor(Compressor):
+    name = 'lz4'
+
+    def compress(self, data):
+        return lz4.frame.compress(data)
+
+    def decompress(self, data):
+        return lz4.frame.decompress(data)
+
+
+class ZstdCompressor(Compressor):
+    name = 'zstd'
+    level = 3
+
+    # zstandard contexts are not thread safe, create one per call
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data):
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+COMPRESSORS = {
+    ZlibCompressor.name: (ZlibCompressor, zlib),
+    Lz4Compressor.name: (Lz4Compressor, lz4),
+    ZstdCompressor.name: (ZstdCompressor, zstandard),
+}
+
+
+def get_compressor(name):
+    """
+    @param name compressor name, None for no compression
+    @retval compressor instance or None
+    @raise ValueError if the compressor is unknown or its library is not installed
+    """
+    if not name:
+        return None
+    if name not in COMPRESSORS:
+        raise ValueError('Unknown compression: %r, expected one of %r' % (name, sorted(COMPRESSORS)))
+
+    klass, module = COMPRESSORS[name]
+    if module is None:
+        raise ValueError('Compression %r is not available, library not installed' % name)
+    return klass()
@@ -11,10 +11,87 @@
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+import re
+import sre_constants
+import sre_parse
+from bisect import bisect_right
+from collections import deque
+
 from mi.core.log import get_logger
 log = get_logger()
 
 
+def _parsed_first_chars(pattern):
+    """
+    @param pattern parsed regex, see sre_parse
+    @retval set of the characters a match of pattern can start with, None if unknown
+    """
+    if not len(pattern):
+        return None
+    op, av = pattern[0]
+    if op == sre_constants.LITERAL:
+        return {chr(av) if av < 256 else unichr(av)}
+    if op == sre_constants.IN:
+        chars = set()
+        for item_op, item_av in av:
+            if item_op == sre_constants.LITERAL:
+                chars.add(chr(item_av) if item_av < 256 else unichr(item_av))
+            elif item_op == sre_constants.RANGE and item_av[1] < 256:
+                chars.update(chr(c) for c in range(item_av[0], item_av[1] + 1))
+            else:
+                return None
+        return chars
+    if op == sre_constants.SUBPATTERN:
+        return _parsed_first_chars(av[1])
+    if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] > 0:
+        return _parsed_first_chars(av[2])
+    if op == sre_constants.BRANCH:
+        chars = set()
+        for branch in av[1]:
+            branch_chars = _parsed_first_chars(branch)
+            if branch_chars is None:
+                return None
+            chars |= branch_chars
+        return chars
+    return None
+
+
+def _first_chars(regex):
+    """
+    @param regex compiled regex
+    @retval (literal prefix every match of regex starts with, frozenset of the characters
+             a match can start with or None if unknown)
+    """
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except (re.error, sre_constants.error):
+        return '', None
+
+    prefix = ''
+    if not regex.flags & re.IGNORECASE:
+        for op, av in parsed:
+            if op != sre_constants.LITERAL or av >= 256:
+                break
+            prefix += chr(av)
+
+    chars = _parsed_first_chars(parsed)
+    if chars is not None and regex.flags & re.IGNORECASE:
+        chars |= set(c.lower() for c in chars) | set(c.upper() for c in chars)
+    return prefix, frozenset(chars) if chars is not None else None
+
+
+def _may_overlap(first, second):
+    """
+    @param first (prefix, chars) of a regex, see _first_chars
+    @param second (prefix, chars) of another regex
+    @retval False if the regexes can never match at the same position
+    """
+    (prefix, chars), (other_prefix, other_chars) = first, second
+    if not (prefix.startswith(other_prefix) or other_prefix.startswith(prefix)):
+        return False
+    return chars is None or other_chars is None or bool(chars & other_chars)
+
+
 class StringChunker(object):
     """
     A great big buffer that ingests incoming data from an instrument, then
@@ -53,6 +130,19 @@ class StringChunker(object):
         @param raw_data Input data (string)
         @param timestamp The time (in NTP4 float format) that the data was collected at the port agent
         """
+        self._append(raw_data, timestamp)
+        self._make_chunks()
+
+    def add_chunks(self, blocks):
+        """
+        Adds several chunks of data to the end of the buffer, sieving once after the last
+        @param blocks list of (raw_data, timestamp)
+        """
+        for raw_data, timestamp in blocks:
+            self._append(raw_data, timestamp)
+        self._make_chunks()
+
+    def _append(self, raw_data, timestamp):
         start_index = len(self.buffer)
         end_index = start_index + len(raw_data)
 
@@ -69,14 +159,21 @@ class StringChunker(object):
 
         self.timestamps.append((start_index, end_index, timestamp))
         self.buffer += raw_data
-        self._make_chunks()
 
     def get_next_data(self):
         """
         Yield a chunk (timestamp, data) if there are any available
         """
+        timestamp, chunk, _ = self.get_next_match()
+        return timestamp, chunk
+
+    def get_next_match(self):
+        """
+        Yield a chunk (timestamp, data, pattern_id) if there are any available.
+        pattern_id is supplied by sieves returning (start, end, pattern_id), otherwise None.
+        """
         if len(self.chunks) == 0:
-            return None, None
+            return None, None, None
 
         return self.chunks.pop(0)
 
@@ -96,8 +193,8 @@ class StringChunker(object):
         remove_indices = []
 
         for index in xrange(len(results)-1):
-            s1, e1 = results[index]
-            s2, e2 = results[index+1]
+            e1 = results[index][1]
+            s2 = results[index+1][0]
             if s2 < e1:
                 remove_indices.append(index+1)
 
@@ -142,10 +239,12 @@ class StringChunker(object):
         results = self._prune_overlaps(results)
 
         end = 0
-        for start, end in results:
+        for result in results:
+            start, end = result[:2]
+            pattern_id = result[2] if len(result) > 2 else None
             chunk = self.buffer[start:end]
             timestamp = self._find_timestamp(start)
-            self.chunks.append((timestamp, chunk))
+            self.chunks.append((timestamp, chunk, pattern_id))
 
         if end > 0:
             self._rebase_times(end)
@@ -168,3 +267,205 @@ class StringChunker(object):
                     return_list.append((match.start(), match.end()))
 
         return return_list
+
+    @staticmethod
+    def compile_regex_sieve(regex_list, overlap=None):
+        """
+        Generate a sieve function which finds matches for all regexes in a single pass.
+        The regexes are combined into one alternation of named groups (one per set of
+        regex flags), so the buffer is traversed once rather than once per regex. Where
+        more than one regex matches at the same position the shortest match wins, then
+        the first in regex_list, as when each regex is searched separately and the
+        results sorted. Only the regexes after the one the alternation took, which can
+        start with the same literal prefix and character, are tried again for a shorter
+        match. Regexes using backreferences cannot be combined and are searched individually.
+        @param regex_list a list of pre-compiled regexes, or a dict of pattern_id: regex
+            (ordered by pattern_id)
+        @param overlap longest record any regex can match, see IncrementalChunker
+        @retval A function returning (start, end, pattern_id) tuples, where pattern_id
+            is the index of the matching regex in regex_list, or its key
+        """
+        if isinstance(regex_list, dict):
+            patterns = sorted(regex_list.iteritems())
+        else:
+            patterns = list(enumerate(regex_list))
+
+        by_flags = {}
+        single = []
+        for pattern_id, regex in patterns:
+            if re.search(r'\\\d|\(\?P=', regex.pattern):
+                single.append((pattern_id, regex))
+            else:
+                by_flags.setdefault(regex.flags, []).append((pattern_id, regex))
+
+        def strip(pattern):
+            # named groups inside each pattern would collide, make them non-capturing
+            # inline flags are left in place, every pattern in a combined regex has the same flags
+            return re.sub(r'(?<!\\)\(\?P<\w+>', '(?:', pattern)
+
+        def alternative(index, regex):
+            # terminate verbose patterns with a newline in case they end in a comment
+            pattern = strip(regex.pattern) + ('\n' if regex.flags & re.VERBOSE else '')
+            name = '_sieve%d' % index
+            # an empty group after the pattern marks it without hiding its first character from
+            # the regex engine, which then skips ahead to positions an alternative can start at
+            marked = '%s(?P<%s>)' % (pattern, name)
+            try:
+                parsed = sre_parse.parse(marked, regex.flags)
+                op, av = parsed[-1]
+                if op == sre_constants.SUBPATTERN and av[0] == parsed.pattern.groupdict[name]:
+                    return marked
+            except (re.error, sre_constants.error):
+                pass
+            # the pattern has a top level alternation, the group has to enclose it
+            return '(?P<%s>%s)' % (name, pattern)
+
+        combined = []
+        for flags, regexes in by_flags.iteritems():
+            pattern = '|'.join(alternative(index, regex) for index, (_, regex) in enumerate(regexes))
+            try:
+                matcher = re.compile(pattern, flags)
+            except re.error:
+                single.extend(regexes)
+                continue
+            candidates = [(pattern_id, regex) + _first_chars(regex) for pattern_id, regex in regexes]
+            groups = {}
+            for index, (pattern_id, _, prefix, chars) in enumerate(candidates):
+                # the regexes before the one the alternation took did not match at its position,
+                # of the others only those able to start the same way could match there as well
+                later = [candidate for candidate in candidates[index + 1:]
+                         if _may_overlap((prefix, chars), candidate[2:])]
+                groups['_sieve%d' % index] = (pattern_id, later)
+            combined.append((matcher, groups))
+
+        def sieve(raw_data):
+            return_list = []
+            for matcher, groups in combined:
+                position = 0
+                while position is not None:
+                    matches, position = matcher.finditer(raw_data, position), None
+                    for match in matches:
+                        start, end = match.span()
+                        pattern_id, later = groups[match.lastgroup]
+                        for other_id, regex, prefix, chars in later:
+                            if chars is not None and raw_data[start:start + 1] not in chars or \
+                                    prefix and not raw_data.startswith(prefix, start):
+                                continue
+                            # keep the shortest match, ties go to the earlier regex
+                            other = regex.match(raw_data, start)
+                            if other and other.end() < end:
+                                end, pattern_id = other.end(), other_id
+                                # search again from the end of the shorter match
+                                position = max(end, start + 1)
+                        return_list.append((start, end, pattern_id))
+                        if position is not None:
+                            break
+            for pattern_id, matcher in single:
+                for match in matcher.finditer(raw_data):
+                    return_list.append((match.start(), match.end(), pattern_id))
+            return return_list
+
+        sieve.regex_list = [regex for _, regex in patterns]
+        sieve.overlap = overlap
+        return sieve
+
+
+class IncrementalChunker(StringChunker):
+    """
+    A StringChunker which avoids rescanning data it has already sieved.
+
+    Data is held in a bytearray with a read offset, timestamps are located by
+    bisecting the (absolute) start index of each added block, and the sieve is
+    only run over the unconsumed data added since the last pass plus a bounded
+    overlap. The overlap is the longest record the sieve can match, declared
+    either with the overlap argument or as an overlap attribute on the sieve
+    function. Without an overlap all unconsumed data is sieved on every pass.
+    """
+    def __init__(self, data_sieve_fn, max_buff_size=8192, overlap=None):
+        super(IncrementalChunker, self).__init__(data_sieve_fn, max_buff_size)
+        if overlap is None:
+            overlap = getattr(data_sieve_fn, 'overlap', None)
+        self.overlap = overlap
+        self.clean()
+
+    def _append(self, raw_data, timestamp):
+        self._starts.append(self._base + len(self.buffer))
+        self._times.append(timestamp)
+        self.buffer.extend(raw_data)
+
+        # check the size of the buffer. If we have exceeded max_buff_size then drop the oldest data.
+        oversize = len(self.buffer) - self._offset - self.max_buff_size
+        if oversize > 0:
+            log.warn('Chunker buffer has grown beyond specified limit (%d), truncating %d bytes',
+                     self.max_buff_size, oversize)
+            self._offset += oversize
+
+    def get_next_match(self):
+        """
+        Yield a chunk (timestamp, data, pattern_id) if there are any available
+        """
+        if not self.chunks:
+            return None, None, None
+
+        return self.chunks.popleft()
+
+    def clean(self):
+        self.chunks = deque()
+        self.buffer = bytearray()
+        self._base = 0
+        self._offset = 0
+        self._scanned = 0
+        self._starts = []
+        self._times = []
+
+    def _find_timestamp(self, index):
+        """
+        Given an index into the buffer, find the corresponding timestamp
+        """
+        position = bisect_right(self._starts, self._base + index) - 1
+        if position < 0:
+            log.error('Failed to find timestamp for chunk!')
+            return 0
+        return self._times[position]
+
+    def _rebase_times(self, index):
+        """
+        Discard consumed data ahead of index, along with timestamps which no longer cover the buffer
+        """
+        del self.buffer[:index]
+        self._base += index
+        self._offset -= index
+        self._scanned = max(0, self._scanned - index)
+
+        position = bisect_right(self._starts, self._base) - 1
+        if not self.buffer:
+            position = len(self._starts)
+        if position > 0:
+            del self._starts[:position]
+            del self._times[:position]
+
+    def _make_chunks(self):
+        """
+        Run any unscanned data through our sieve function. Generate a chunk (timestamp, data)
+        for each non-overlapping result found and advance the read offset past the last one.
+        """
+        scan_start = self._offset
+        if self.overlap is not None:
+            scan_start = max(scan_start, self._scanned - self.overlap)
+
+        data = str(self.buffer[scan_start:])
+        results = self._prune_overlaps(sorted(self.sieve(data)))
+        self._scanned = len(self.buffer)
+
+        end = 0
+        for result in results:
+            start, end = result[:2]
+            pattern_id = result[2] if len(result) > 2 else None
+            self.chunks.append((self._find_timestamp(scan_start + start), data[start:end], pattern_id))
+
+        if end > 0:
+            self._offset = scan_start + end
+
+        # compact once the consumed portion dominates the buffer
+        if self._offset > len(self.buffer) / 2:
+            self._rebase_times(self._offset)
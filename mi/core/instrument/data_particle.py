@@ -12,6 +12,8 @@ import time
 import ntplib
 import base64
 
+import numpy as np
+
 from mi.core.common import BaseEnum
 from mi.core.exceptions import SampleException, ReadOnlyException, NotImplementedException, InstrumentParameterException
 from mi.core.log import get_logger
@@ -214,6 +216,18 @@ class DataParticle(object):
         #    if  not self._check_timestamp(self.contents[time]):
         #        raise SampleException("Invalid port agent timestamp in raw packet")
 
+        values = self._generate_values()
+
+        result = self._build_base_structure()
+        result[DataParticleKey.STREAM_NAME] = self.data_particle_type()
+        result[DataParticleKey.VALUES] = values
+        return result
+
+    def _generate_values(self):
+        """
+        Build the values list and settle the preferred timestamp
+        @retval list of {value_id, value} dictionaries
+        """
         # verify preferred timestamp exists in the structure...
         if not self._check_preferred_timestamps():
             raise SampleException("Preferred timestamp not in particle!")
@@ -227,10 +241,54 @@ class DataParticle(object):
                 self.contents[DataParticleKey.INTERNAL_TIMESTAMP] is not None]):
             self.contents[DataParticleKey.PREFERRED_TIMESTAMP] = DataParticleKey.INTERNAL_TIMESTAMP
 
-        result = self._build_base_structure()
-        result[DataParticleKey.STREAM_NAME] = self.data_particle_type()
-        result[DataParticleKey.VALUES] = values
-        return result
+        return values
+
+    @classmethod
+    def build_columns(cls, records, **kwargs):
+        """
+        Generate particles for a batch of records as columns instead of one dictionary per
+        sample. Records which fail to generate are logged and skipped. Subclasses producing
+        high rate streams may override this with a vectorized implementation, which must
+        return the same columns.
+
+        @param records list of (raw_data, port_timestamp) tuples
+        @param kwargs passed on to every particle, e.g. quality_flag
+        @retval dict of numpy arrays keyed by particle key or value_id, one row per particle
+        """
+        columns = {}
+        rows = 0
+        for raw_data, port_timestamp in records:
+            try:
+                particle = cls(raw_data, port_timestamp=port_timestamp, **kwargs)
+                values = particle._generate_values()
+                row = [(key, value) for key, value in particle.contents.iteritems()]
+                row.append((DataParticleKey.STREAM_NAME, particle.data_particle_type()))
+                row.extend((each[DataParticleKey.VALUE_ID], each[DataParticleKey.VALUE]) for each in values)
+            except Exception as e:
+                log.error('Unable to generate %s particle from %r: %r', cls.__name__, raw_data, e)
+                continue
+
+            for key, value in row:
+                # keys first seen part way through the batch are back filled with None
+                columns.setdefault(key, [None] * rows).append(value)
+            rows += 1
+            for column in columns.itervalues():
+                if len(column) < rows:
+                    column.append(None)
+
+        return {key: cls._column_array(column) for key, column in columns.iteritems()}
+
+    @staticmethod
+    def _column_array(column):
+        """
+        Convert a column list to a numpy array, missing numeric values become NaN
+        """
+        if any(value is None for value in column):
+            present = [value for value in column if value is not None]
+            if present and all(isinstance(value, (int, long, float)) for value in present):
+                return np.array([np.nan if value is None else value for value in column], dtype=float)
+            return np.array(column, dtype=object)
+        return np.array(column)
 
     def generate(self, sorted=False):
         """
@@ -329,6 +387,50 @@ class DataParticle(object):
         return self._encoding_errors
 
 
+class ParticleBatch(object):
+    """
+    Collects raw records per particle class so they can be generated as
+    columns with DataParticle.build_columns instead of one at a time.
+    """
+    def __init__(self):
+        self._records = {}
+        self._order = []
+
+    def __len__(self):
+        return sum(len(records) for records in self._records.itervalues())
+
+    def add(self, particle_class, raw_data, port_timestamp, **kwargs):
+        """
+        Defer generation of a particle until the next flush
+        @param particle_class DataParticle subclass to generate
+        @param raw_data raw data for the particle
+        @param port_timestamp port agent timestamp for the raw data
+        @param kwargs passed on to the particle, e.g. quality_flag
+        """
+        # records with different particle arguments are generated separately
+        key = (particle_class, tuple(sorted(kwargs.iteritems())))
+        if key not in self._records:
+            self._records[key] = []
+            self._order.append(key)
+        self._records[key].append((raw_data, port_timestamp))
+
+    def flush(self):
+        """
+        Generate all collected records and reset the batch
+        @retval list of column dictionaries, one per particle class and arguments in the order first seen
+        """
+        records, order = self._records, self._order
+        self._records, self._order = {}, []
+
+        columns = []
+        for key in order:
+            particle_class, kwargs = key
+            result = particle_class.build_columns(records[key], **dict(kwargs))
+            if result:
+                columns.append(result)
+        return columns
+
+
 class RawDataParticleKey(BaseEnum):
     PAYLOAD = "raw"
     LENGTH = "length"
@@ -8,6 +8,7 @@ Release notes:
 initial release
 """
 import cPickle as pickle
+import itertools
 import json
 
 import numpy as np
@@ -18,26 +19,29 @@ from mi.core.instrument.publisher import Publisher
 from ooi.logging import log
 
 
-class CountPublisher(Publisher):
-    def __init__(self, allowed):
-        super(CountPublisher, self).__init__(allowed)
-        self.total = 0
-
-    def _publish(self, events, headers):
-        for e in events:
-            try:
-                json.dumps(e)
-            except (ValueError, UnicodeDecodeError) as err:
-                log.exception('Unable to publish event: %r %r', e, err)
-        count = len(events)
-        self.total += count
-        log.info('Publish %d events (%d total)', count, self.total)
-
-
 class FilePublisher(Publisher):
+    """
+    Accumulates particles per stream and writes one output file per stream at the end.
+    If flush_rows or flush_mb is given, each stream is instead flushed to a numbered
+    part file whenever it reaches that many rows or (estimated) megabytes.
+    """
+    ENCODE_EVENTS = False
     def __init__(self, *args, **kwargs):
+        flush_rows = kwargs.pop('flush_rows', None)
+        flush_mb = kwargs.pop('flush_mb', None)
         super(FilePublisher, self).__init__(*args, **kwargs)
         self.samples = {}
+        self.columns = {}
+        self.flush_rows = int(flush_rows) if flush_rows else None
+        self.flush_bytes = float(flush_mb) * 1024 * 1024 if flush_mb else None
+        self._rows = {}
+        self._bytes = {}
+        self._row_bytes = {}
+        self._parts = {}
+
+    @property
+    def streaming(self):
+        return bool(self.flush_rows or self.flush_bytes)
 
     @staticmethod
     def _flatten(sample):
@@ -57,26 +61,159 @@ class FilePublisher(Publisher):
             if stream:
                 particle = self._flatten(particle)
                 self.samples.setdefault(stream, []).append(particle)
+                if self.streaming:
+                    if stream not in self._row_bytes:
+                        # rough per row size, taken once per stream
+                        self._row_bytes[stream] = self._row_size(particle)
+                    self._track(stream, 1, self._row_bytes[stream])
+
+    @staticmethod
+    def _row_size(particle):
+        """
+        Estimate the size of a flattened particle from its JSON form. Values JSON can't
+        encode (numpy scalars, binary strings) are counted by their string form.
+        """
+        try:
+            return len(json.dumps(particle, default=str))
+        except (TypeError, ValueError):
+            return len(repr(particle))
+
+    def enqueue_columns(self, columns):
+        """
+        Add particles generated as columns (see DataParticle.build_columns), bypassing
+        the event queue. Rows are split by stream name and filtered by the allowed list.
+        @param columns dict of numpy arrays, one row per particle
+        """
+        streams = columns.get('stream_name')
+        if streams is None or not len(streams):
+            return
+
+        for stream in np.unique(streams):
+            if isinstance(self._allowed, list) and stream not in self._allowed:
+                continue
+            mask = streams == stream
+            if mask.all():
+                block = columns
+            else:
+                block = {key: value[mask] for key, value in columns.iteritems()}
+            self.columns.setdefault(stream, []).append(block)
+            if self.streaming:
+                self._track(stream, len(block['stream_name']), sum(value.nbytes for value in block.itervalues()))
+
+    def _track(self, stream, rows, nbytes):
+        """
+        Count rows held for a stream, flushing it once a threshold is reached
+        """
+        self._rows[stream] = self._rows.get(stream, 0) + rows
+        self._bytes[stream] = self._bytes.get(stream, 0) + nbytes
+        if self.flush_rows and self._rows[stream] >= self.flush_rows:
+            self._flush_stream(stream)
+        elif self.flush_bytes and self._bytes[stream] >= self.flush_bytes:
+            self._flush_stream(stream)
+
+    def _flush_stream(self, stream):
+        """
+        Write the rows held for a stream to the next part file and release them
+        """
+        if not self._rows.get(stream):
+            return
+        dataset = self._to_dataset(stream)
+        self.samples.pop(stream, None)
+        self.columns.pop(stream, None)
+        part = self._parts.get(stream, 0)
+        log.info('Flushing %d %s rows to part %d', self._rows[stream], stream, part)
+        self._rows[stream] = self._bytes[stream] = 0
+        self._parts[stream] = part + 1
+        self._write_part(stream, dataset, part)
+
+    @classmethod
+    def columns_to_dataset(cls, blocks):
+        """
+        Concatenate column blocks into a dataset laid out as fix_arrays would produce
+        @param blocks list of column dictionaries for a single stream
+        """
+        lengths = [len(block['stream_name']) for block in blocks]
+        keys = set().union(*blocks)
+        new_ds = xr.Dataset(coords={'dim_0': np.arange(sum(lengths))})
+        for key in keys:
+            columns = [block[key] if key in block else np.full(length, np.nan)
+                       for block, length in zip(blocks, lengths)]
+            if len(set(column.shape[1:] for column in columns)) > 1:
+                # array widths differ between blocks, stack as ragged rows
+                data = cls.stack_rows(list(itertools.chain.from_iterable(columns)))
+            else:
+                data = np.concatenate(columns)
+                if data.dtype == object and len(data) and isinstance(data[0], list):
+                    data = cls.stack_rows(data)
+
+            if data is None:
+                log.error('Unable to stack array column %s, skipping', key)
+            elif data.ndim == 1:
+                new_ds[key] = ('dim_0', data)
+            else:
+                new_ds[key] = xr.DataArray(data)
+        return new_ds
 
     def to_dataframes(self):
-        data_frames = {}
-        for particle_type in self.samples:
-            data_frames[particle_type] = self.fix_arrays(pd.DataFrame(self.samples[particle_type]))
-        return data_frames
+        return {particle_type: dataset.to_dataframe() for particle_type, dataset in self.to_datasets().iteritems()}
 
     def to_datasets(self):
-        datasets = {}
-        for particle_type in self.samples:
-            datasets[particle_type] = self.fix_arrays(pd.DataFrame(self.samples[particle_type]), return_as_xr=True)
-        return datasets
+        return {particle_type: self._to_dataset(particle_type)
+                for particle_type in set(self.samples).union(self.columns)}
+
+    def _to_dataset(self, particle_type):
+        parts = []
+        if particle_type in self.samples:
+            parts.append(self.fix_arrays(pd.DataFrame(self.samples[particle_type]), return_as_xr=True))
+        if particle_type in self.columns:
+            parts.append(self.columns_to_dataset(self.columns[particle_type]))
+        return parts[0] if len(parts) == 1 else xr.concat(parts, dim='dim_0')
 
     @staticmethod
-    def fix_arrays(data_frame, return_as_xr=False):
+    def stack_rows(rows):
+        """
+        Stack a column of 1-D rows (lists or arrays) into a 2-D array. All values are
+        converted in a single pass into a preallocated array instead of row by row.
+        Ragged rows are padded and masked, which xarray stores as NaN.
+        @param rows sequence of rows, anything other than a list or array counts as empty
+        @retval 2-D array, or None if the rows are not 1-D
+        """
+        rows = [row if isinstance(row, (list, np.ndarray)) else () for row in rows]
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.intp, count=len(rows))
+        dtype = np.asarray(next((row for row in rows if len(row)), ())).dtype
+
+        try:
+            if dtype.kind in 'iuf':
+                # integers are filled as float so a later non-integer value is not truncated
+                fill_dtype = dtype if dtype.kind == 'f' else np.float64
+                flat = np.fromiter(itertools.chain.from_iterable(rows), dtype=fill_dtype, count=lengths.sum())
+                if fill_dtype is not dtype and np.array_equal(flat, np.round(flat)):
+                    flat = flat.astype(dtype)
+            else:
+                raise TypeError
+        except (TypeError, ValueError):
+            flat = np.array(list(itertools.chain.from_iterable(rows)))
+        if flat.ndim != 1:
+            return None
+
+        width = lengths.max() if len(rows) else 0
+        if (lengths == width).all():
+            return flat.reshape(len(rows), width)
+
+        mask = np.arange(width) < lengths[:, None]
+        data = np.zeros((len(rows), width), dtype=flat.dtype)
+        data[mask] = flat
+        return np.ma.masked_array(data, mask=~mask)
+
+    @classmethod
+    def fix_arrays(cls, data_frame, return_as_xr=False):
         # round-trip the dataframe through xray to get the multidimensional indexing correct
         new_ds = xr.Dataset()
         for each in data_frame:
             if data_frame[each].dtype == 'object' and isinstance(data_frame[each].values[0], list):
-                data = np.array([np.array(x) for x in data_frame[each].values])
+                data = cls.stack_rows(data_frame[each].values)
+                if data is None:
+                    data = np.array([np.array(x) for x in data_frame[each].values])
                 new_ds[each] = xr.DataArray(data)
             else:
                 new_ds[each] = data_frame[each]
@@ -86,12 +223,19 @@ class FilePublisher(Publisher):
 
     def write(self):
         log.info('Writing output files...')
-        self._write()
+        if self.streaming:
+            for stream in self._rows.keys():
+                self._flush_stream(stream)
+        else:
+            self._write()
         log.info('Done writing output files...')
 
     def _write(self):
         raise NotImplemented
 
+    def _write_part(self, particle_type, dataset, part):
+        raise NotImplemented
+
 
 class CsvPublisher(FilePublisher):
     def _write(self):
@@ -100,6 +244,9 @@ class CsvPublisher(FilePublisher):
             file_path = '%s.csv' % particle_type
             dataframes[particle_type].to_csv(file_path)
 
+    def _write_part(self, particle_type, dataset, part):
+        dataset.to_dataframe().to_csv('%s_%d.csv' % (particle_type, part))
+
 
 class PandasPublisher(FilePublisher):
     def _write(self):
@@ -120,6 +267,9 @@ class PandasPublisher(FilePublisher):
                 file_path = '%s.pd' % particle_type
                 dataframes[particle_type].to_pickle(file_path)
 
+    def _write_part(self, particle_type, dataset, part):
+        dataset.to_dataframe().to_pickle('%s_%d.pd' % (particle_type, part))
+
 
 class XarrayPublisher(FilePublisher):
     def _write(self):
@@ -128,3 +278,7 @@ class XarrayPublisher(FilePublisher):
             file_path = '%s.xr' % particle_type
             with open(file_path, 'w') as fh:
                 pickle.dump(datasets[particle_type], fh, protocol=-1)
+
+    def _write_part(self, particle_type, dataset, part):
+        with open('%s_%d.xr' % (particle_type, part), 'w') as fh:
+            pickle.dump(dataset, fh, protocol=-1)
@@ -1147,9 +1147,12 @@ class SingleConnectionInstrumentDriver(InstrumentDriver):
             addr = config['addr']
             port = config['port']
             cmd_port = config.get('cmd_port')
+            # deliver the packets received together as one batch
+            batch_callback = self._got_data_batch if config.get('coalesce') else None
 
             if isinstance(addr, basestring) and isinstance(port, int) and len(addr) > 0:
-                return PortAgentClient(addr, port, cmd_port, self._got_data, self._lost_connection_callback)
+                return PortAgentClient(addr, port, cmd_port, self._got_data, self._lost_connection_callback,
+                                       batch_callback=batch_callback)
             else:
                 raise InstrumentParameterException('Invalid comms config dict.')
 
@@ -1211,6 +1214,32 @@ class SingleConnectionInstrumentDriver(InstrumentDriver):
                     # queue this data up for once the protocol has been started
                     self._data_buffer.append(port_agent_packet)
 
+    def _got_data_batch(self, port_agent_packets):
+        """
+        Hand runs of instrument data packets to the protocol as batches, exceptions and
+        other packets are handled one at a time in order by _got_data.
+        """
+        batch = []
+        for port_agent_packet in port_agent_packets:
+            if not isinstance(port_agent_packet, PortAgentPacket) or \
+                    port_agent_packet.get_header_type() in (PortAgentPacket.PORT_AGENT_CONFIG,
+                                                            PortAgentPacket.PORT_AGENT_STATUS):
+                self._got_data_batch_flush(batch)
+                batch = []
+                self._got_data(port_agent_packet)
+            else:
+                batch.append(port_agent_packet)
+        self._got_data_batch_flush(batch)
+
+    def _got_data_batch_flush(self, batch):
+        if not batch:
+            return
+        if self._protocol:
+            self._protocol.got_data_batch(batch)
+        else:
+            # queue this data up for once the protocol has been started
+            self._data_buffer.extend(batch)
+
     def _lost_connection_callback(self):
         """
         A callback invoked by the port agent client when it loses
@@ -69,6 +69,12 @@ class InstrumentProtocol(object):
     """
     __metaclass__ = get_logging_metaclass('trace')
 
+    # Declarative chunk dispatch, a dict of pattern_id: (regex, particle_class, post_hook) where
+    # post_hook is the name of a protocol method called with each generated sample, or None. When
+    # the chunker sieve is StringChunker.compile_regex_sieve over {pattern_id: regex}, each chunk
+    # is passed directly to its particle class by _got_particle_chunk, not _got_chunk.
+    _particle_handlers = None
+
     def __init__(self, driver_event):
         """
         Base constructor.
@@ -91,6 +97,10 @@ class InstrumentProtocol(object):
         # Dictionary to store recently generated particles
         self._particle_dict = {}
 
+        # When set to a ParticleBatch, particles from _particle_handlers are collected
+        # for columnar generation instead of being generated and published one at a time
+        self._particle_batch = None
+
         # The spot to stash a configuration before going into direct access mode
         self._pre_direct_access_config = None
 
@@ -194,9 +204,49 @@ class InstrumentProtocol(object):
         """
         raise NotImplementedException()
 
+    def got_data_batch(self, port_agent_packets):
+        """
+        Called by the instrument connection with all the packets received together.
+        Hands them to got_data one at a time, subclasses may process them at once.
+
+        :param port_agent_packets: list of packets, oldest first
+        """
+        for port_agent_packet in port_agent_packets:
+            self.got_data(port_agent_packet)
+
     def _got_chunk(self, data, timestamp):
         raise NotImplementedException()
 
+    def _got_particle_chunk(self, chunk, timestamp, pattern_id):
+        """
+        Generate the particle registered in _particle_handlers for a chunk, then run its post hook.
+        @param chunk data matched by the handler's regex
+        @param timestamp port agent timestamp to include with the particle
+        @param pattern_id key of the matching handler
+        @retval the parsed sample, None if the particle was deferred to the batch
+        @throws InstrumentProtocolException if no handler is registered for pattern_id
+        """
+        _, particle_class, post_hook = self._get_particle_handler(chunk, pattern_id)
+        if self._particle_batch is not None:
+            # no sample exists until the batch is flushed, so post hooks are skipped
+            self._particle_batch.add(particle_class, chunk, timestamp, **self._particle_kwargs(particle_class))
+            return None
+        sample = self._generate_particle(particle_class, chunk, timestamp)
+        if post_hook:
+            getattr(self, post_hook)(sample)
+        return sample
+
+    def _get_particle_handler(self, chunk, pattern_id):
+        """
+        @retval the (regex, particle_class, post_hook) registered for pattern_id
+        @throws InstrumentProtocolException if there is none
+        """
+        try:
+            return self._particle_handlers[pattern_id]
+        except KeyError:
+            raise InstrumentProtocolException(u'unhandled chunk received by _got_particle_chunk: [{0!r:s}]'
+                                              .format(chunk))
+
     def _get_param_result(self, param_list, expire_time):
         """
         return a dictionary of the parameters and values
@@ -265,17 +315,38 @@ class InstrumentProtocol(object):
         """
 
         if regex.match(line):
+            return self._generate_particle(particle_class, line, timestamp, publish)
+
+    def _generate_particle(self, particle_class, line, timestamp, publish=True, **kwargs):
+        """
+        Generate and publish a particle from a line already known to match particle_class
+
+        @param particle_class The class to instantiate for this specific data particle
+        @param line string to build the sample from
+        @param timestamp port agent timestamp to include with the particle
+        @param publish boolean to publish samples (default True)
+        @param kwargs passed on to the particle, e.g. quality_flag
+        @retval the parsed sample
+        """
+        kwargs = dict(self._particle_kwargs(particle_class), **kwargs)
+        particle = particle_class(line, port_timestamp=timestamp, **kwargs)
+        parsed_sample = particle.generate()
 
-            particle = particle_class(line, port_timestamp=timestamp)
-            parsed_sample = particle.generate()
+        # Add an entry to the particle dictionary, with the particle class as the key
+        self._particle_dict[particle.data_particle_type()] = parsed_sample
 
-            # Add an entry to the particle dictionary, with the particle class as the key
-            self._particle_dict[particle.data_particle_type()] = parsed_sample
+        if publish and self._driver_event:
+            self._driver_event(DriverAsyncEvent.SAMPLE, parsed_sample)
 
-            if publish and self._driver_event:
-                self._driver_event(DriverAsyncEvent.SAMPLE, parsed_sample)
+        return parsed_sample
 
-            return parsed_sample
+    def _particle_kwargs(self, particle_class):
+        """
+        Extra arguments for particles of particle_class, both generated one at a time
+        and in a particle batch. Subclasses override this to set e.g. a quality flag.
+        @retval dict of keyword arguments for the particle constructor
+        """
+        return {}
 
     def get_current_state(self):
         """
@@ -1116,10 +1187,44 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
             self.add_to_buffer(data)
 
             self._chunker.add_chunk(data, timestamp)
-            (timestamp, chunk) = self._chunker.get_next_data()
-            while chunk:
+            self._process_chunks()
+
+    def got_data_batch(self, port_agent_packets):
+        """
+        Called by the instrument connection with all the packets received together.
+        The buffers are extended and the chunker sieved once for the whole batch.
+        Subclasses changing how got_data handles a packet must override this as well,
+        InstrumentProtocol.got_data_batch hands the packets to got_data one at a time.
+
+        :param port_agent_packets: list of packets, oldest first
+        """
+        blocks = [(packet.get_data(), packet.get_timestamp()) for packet in port_agent_packets
+                  if packet.get_data_length() > 0]
+        if not blocks:
+            return
+
+        data = ''.join(block for block, _ in blocks)
+        log.debug("Got Data: %r", data)
+
+        if self.get_current_state() == DriverProtocolState.DIRECT_ACCESS:
+            self._driver_event(DriverAsyncEvent.DIRECT_ACCESS, data)
+
+        self.add_to_buffer(data)
+
+        self._chunker.add_chunks(blocks)
+        self._process_chunks()
+
+    def _process_chunks(self):
+        """
+        Dispatch every chunk the chunker has matched
+        """
+        (timestamp, chunk, pattern_id) = self._chunker.get_next_match()
+        while chunk:
+            if pattern_id is not None and self._particle_handlers:
+                self._got_particle_chunk(chunk, timestamp, pattern_id)
+            else:
                 self._got_chunk(chunk, timestamp)
-                (timestamp, chunk) = self._chunker.get_next_data()
+            (timestamp, chunk, pattern_id) = self._chunker.get_next_match()
 
     ########################################################################
     # Incoming raw data callback.
@@ -7,10 +7,10 @@ Release notes:
 
 initial release
 """
-import json
 import time
 import kombu
 
+from mi.core.codec import COMPRESSION_HEADER
 from mi.core.instrument.publisher import Publisher
 from ooi.logging import log
 
@@ -33,9 +33,14 @@ class KombuPublisher(Publisher):
 
         now = time.time()
         try:
+            payload, content_encoding = self._payload(events)
+            if self._compressor is not None:
+                # kombu treats the content encoding as a charset
+                msg_headers[COMPRESSION_HEADER] = content_encoding
+                content_encoding = self._codec.content_encoding
             publish = self.connection.ensure(self.producer, self.producer.publish, max_retries=4)
-            publish(json.dumps(events), headers=msg_headers, user_id=self.username,
-                    declare=[self._queue], content_type='text/plain')
+            publish(payload, headers=msg_headers, user_id=self.username, declare=[self._queue],
+                    content_type=self._codec.content_type, content_encoding=content_encoding)
             log.info('Published %d messages using KOMBU in %.2f secs with headers %r',
                      len(events), time.time() - now, msg_headers)
         except Exception as e:
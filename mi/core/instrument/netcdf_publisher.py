@@ -0,0 +1,174 @@
+"""
+@package mi.core.instrument.publisher
+@file /mi-instrument/mi/core/instrument/netcdf_publisher.py
+@brief NetCDF4 file publisher
+Release notes:
+
+initial release
+"""
+import os
+from contextlib import closing
+
+import netCDF4
+import numpy as np
+
+from mi.core.instrument.file_publisher import FilePublisher
+from ooi.logging import log
+
+
+class NetcdfPublisher(FilePublisher):
+    """
+    Writes one typed, compressed and chunked NetCDF4 file per stream, <stream>.nc.
+    The schema of each stream (variables, dtypes and array widths) is taken from the
+    first rows written with a value for each variable, variables with only missing
+    values are put off until a later write. Every later write, including streaming
+    flushes and later runs, is appended along the unlimited dim_0 dimension of the
+    same file, so single variables can be read back without loading the rest. Values which can't
+    be stored in the schema dtype without loss are logged and left missing.
+    """
+    DEFAULT_COMPLEVEL = 4
+    DEFAULT_CHUNK_ROWS = 4096
+
+    def __init__(self, *args, **kwargs):
+        complevel = kwargs.pop('complevel', None)
+        chunk_rows = kwargs.pop('chunk_rows', None)
+        super(NetcdfPublisher, self).__init__(*args, **kwargs)
+        self.complevel = int(complevel) if complevel else self.DEFAULT_COMPLEVEL
+        self.chunk_rows = int(chunk_rows) if chunk_rows else self.DEFAULT_CHUNK_ROWS
+        self.schemas = {}
+
+    def _write(self):
+        for particle_type, dataset in self.to_datasets().iteritems():
+            self._append(particle_type, dataset)
+
+    def _write_part(self, particle_type, dataset, part):
+        self._append(particle_type, dataset)
+
+    def _append(self, particle_type, dataset):
+        """
+        Append a dataset to the file for its stream, creating the file if it doesn't exist yet
+        """
+        file_path = '%s.nc' % particle_type
+        schema = self.schemas.get(particle_type)
+        exists = os.path.exists(file_path)
+
+        with closing(netCDF4.Dataset(file_path, 'a' if exists else 'w')) as nc:
+            if not exists:
+                nc.createDimension('dim_0', None)
+                nc.stream_name = particle_type
+            if schema is None:
+                # the variables of a file written by an earlier publisher make the schema
+                schema = self.schemas[particle_type] = {name: True for name in nc.variables}
+            start = len(nc.dimensions['dim_0'])
+            rows = dataset.dims['dim_0']
+
+            for name, variable in dataset.data_vars.iteritems():
+                data = self._typed(variable.values)
+                if data is None:
+                    if name not in schema:
+                        log.debug('Deferring %s in %s until it has a value', name, particle_type)
+                    continue
+                data = self._netcdf_values(data)
+                if name not in schema:
+                    if start:
+                        log.info('New variable %s in %s after %d rows', name, particle_type, start)
+                    schema[name] = self._create_variable(nc, name, data) is not None
+                if not schema[name]:
+                    continue
+                nc_variable = nc.variables[name]
+                if not self._compatible(data.dtype, nc_variable.dtype):
+                    log.error('Unable to append %s to %s: dtype changed from %s to %s',
+                              name, file_path, nc_variable.dtype, data.dtype)
+                    continue
+                try:
+                    data = self._fit(name, data, nc_variable.shape[1:])
+                except ValueError as e:
+                    log.error('Unable to append %s to %s: %s', name, file_path, e)
+                    continue
+                nc_variable[start:start + rows] = data
+
+    def _create_variable(self, nc, name, data):
+        """
+        Create a variable from the first data seen for it
+        @retval the netCDF4 variable, None if it can't be represented
+        """
+        if 0 in data.shape[1:]:
+            log.warn('Skipping empty array variable %s', name)
+            return None
+
+        dims = ['dim_0']
+        for axis, size in enumerate(data.shape[1:], 1):
+            dim = '%s_dim_%d' % (name, axis)
+            nc.createDimension(dim, size)
+            dims.append(dim)
+
+        if data.dtype == object:
+            # variable length strings can't be compressed
+            return nc.createVariable(name, str, dims)
+
+        chunks = (self.chunk_rows,) + data.shape[1:]
+        # an explicit fill value marks rows not written, or left out, as missing when read back
+        fill_value = netCDF4.default_fillvals.get(data.dtype.str[1:])
+        return nc.createVariable(name, data.dtype, dims, zlib=True, complevel=self.complevel, chunksizes=chunks,
+                                 fill_value=fill_value)
+
+    @staticmethod
+    def _typed(data):
+        """
+        Give an object column holding only numbers and missing values (None) a numeric dtype
+        @retval masked array for numeric values, data unchanged otherwise, None if every value is missing
+        """
+        if data.dtype != object:
+            return data
+        flat = data.ravel()
+        missing = np.fromiter((value is None or isinstance(value, float) and value != value for value in flat),
+                              dtype=bool, count=len(flat))
+        if missing.all():
+            return None
+        values = np.array(list(flat[~missing]))
+        if values.dtype.kind not in 'biuf' or values.ndim != 1:
+            return data
+        typed = np.zeros(len(flat), dtype=values.dtype)
+        typed[~missing] = values
+        return np.ma.masked_array(typed, mask=missing).reshape(data.shape)
+
+    @staticmethod
+    def _compatible(dtype, schema_dtype):
+        """
+        @retval True if values of dtype can be stored in a variable of schema_dtype without loss
+        """
+        if schema_dtype is str or dtype == object:
+            # variable length strings
+            return schema_dtype is str and dtype == object
+        return np.can_cast(dtype, schema_dtype, 'safe')
+
+    @staticmethod
+    def _netcdf_values(data):
+        """
+        Convert a column to a type netCDF can store, strings become variable length and booleans bytes
+        """
+        if data.dtype.kind == 'b':
+            return data.astype('i1')
+        if data.dtype.kind in 'SUO':
+            values = ['' if value is None or value != value else str(value) for value in data.ravel()]
+            return np.array(values, dtype=object).reshape(data.shape)
+        return data
+
+    @staticmethod
+    def _fit(name, data, shape):
+        """
+        Pad or truncate the trailing dimensions of an array column to the stream schema
+        """
+        if data.shape[1:] == shape:
+            return data
+        if len(shape) != 1 or data.ndim != 2:
+            raise ValueError('Shape of %s changed from %r to %r' % (name, shape, data.shape[1:]))
+
+        width = shape[0]
+        if data.shape[1] > width:
+            log.warn('Truncating %s from width %d to schema width %d', name, data.shape[1], width)
+            return data[:, :width]
+
+        padded = np.ma.masked_all((data.shape[0], width), dtype=data.dtype)
+        padded[:, :data.shape[1]] = data
+        return padded
@@ -6,22 +6,34 @@
 @brief Playback process using ZMQ messaging.
 
 Usage:
-    playback datalog <module> <refdes> <event_url> <particle_url> [--allowed=<particles>] <files>...
-    playback ascii <module> <refdes> <event_url> <particle_url> [--allowed=<particles>] <files>...
-    playback chunky <module> <refdes> <event_url> <particle_url> [--allowed=<particles>] <files>...
+    playback datalog <module> <refdes> <event_url> <particle_url> [--allowed=<particles>] [--workers=<n>] [--columnar] <files>...
+    playback block <module> <refdes> <event_url> <particle_url> [--allowed=<particles>] [--workers=<n>] [--columnar] <files>...
+    playback ascii <module> <refdes> <event_url> <particle_url> [--allowed=<particles>] [--workers=<n>] [--columnar] <files>...
+    playback chunky <module> <refdes> <event_url> <particle_url> [--allowed=<particles>] [--workers=<n>] [--columnar] <files>...
 
 Options:
     -h, --help          Show this screen
     --allowed=<particles> Comma-separated list of publishable particles
+    --workers=<n>       Number of worker processes, one file per worker [default: 1]
+    --columnar          Generate particles in batches as columns, file publishers only,
+                        not supported with workers
+
+    File publisher urls (csv, pandas, xarray, netcdf) accept flush_rows=<n> and/or
+    flush_mb=<m> to stream each particle type to disk as it arrives, e.g.
+    csv://?flush_rows=100000. netcdf appends to one compressed file per particle
+    type and also accepts complevel=<n> and chunk_rows=<n>.
 
     To run without installing:
     python -m mi.core.instrument.playback ...
 """
+import cPickle as pickle
 import importlib
 import glob
+import multiprocessing
 import sys
 import os
 import re
+import tempfile
 import time
 from datetime import datetime
 
@@ -34,7 +46,8 @@ from ooi_port_agent.common import PacketType
 from wrapper import EventKeys, encode_exception, DriverWrapper
 from mi.core.instrument.instrument_driver import DriverAsyncEvent
 from mi.core.instrument.publisher import Publisher
-from mi.core.instrument.data_particle import DataParticleKey
+from mi.core.exceptions import NotImplementedException
+from mi.core.instrument.data_particle import ParticleBatch
 from mi.core.instrument.instrument_protocol import \
     MenuInstrumentProtocol,\
     CommandResponseInstrumentProtocol, \
@@ -126,31 +139,27 @@ class PlaybackPacket(Packet):
                     return packet
 
 
-class PlaybackWrapper(object):
-    def __init__(self, module, refdes, event_url, particle_url, reader_klass, allowed, files):
-        version = DriverWrapper.get_version(module)
-        headers = {'sensor': refdes, 'deliveryType': 'streamed', 'version': version, 'module': module}
-        self.event_publisher = Publisher.from_url(event_url, headers)
-        self.particle_publisher = Publisher.from_url(particle_url, headers, allowed)
+def playback_file(args):
+    """
+    Worker process entry point, play back a single file and return the path of its spooled events
+    """
+    module, reader_klass, filename = args
+    return PlaybackWorker(module, reader_klass, filename).playback()
 
-        self.protocol = self.construct_protocol(module)
-        self.reader = reader_klass(files, self.got_data)
 
-    def set_header_filename(self, filename):
-        self.event_publisher.set_source(filename)
-        self.particle_publisher.set_source(filename)
+class PlaybackBase(object):
+    """
+    Feeds packets from a datalog reader to the playback protocol of a driver module
+    """
+    def __init__(self, module, reader_klass, files, construct=True):
+        self.module = module
+        self.reader_klass = reader_klass
+        self.reader = reader_klass(files, self.got_data)
+        self.protocol = self.construct_protocol(module) if construct else None
 
-    def playback(self):
-        for index, filename in enumerate(self.reader.read()):
-            if filename is not None:
-                self.set_header_filename(filename)
-                if hasattr(self.protocol, 'got_filename'):
-                    self.protocol.got_filename(filename)
-            if index % 1000 == 0:
-                self.publish()
-        self.publish()
-        if hasattr(self.particle_publisher, 'write'):
-            self.particle_publisher.write()
+    def got_filename(self, filename):
+        if hasattr(self.protocol, 'got_filename'):
+            self.protocol.got_filename(filename)
 
     def got_data(self, packet):
         try:
@@ -176,16 +185,16 @@ class PlaybackWrapper(object):
         log.error('Unable to import and create playback protocol from module: %r', module)
         sys.exit(1)
 
-    def publish(self):
-        self.event_publisher.publish()
-        self.particle_publisher.publish()
-
     def handle_event(self, event_type, val=None):
-        """
-        Construct and send an asynchronous driver event.
-        @param event_type a DriverAsyncEvent type specifier.
-        @param val event value for sample and test result events.
-        """
+        raise NotImplementedException('handle_event() not implemented')
+
+    @staticmethod
+    def is_raw(event):
+        return event[EventKeys.TYPE] == DriverAsyncEvent.SAMPLE and \
+            event[EventKeys.VALUE].get('stream_name') == 'raw'
+
+    @staticmethod
+    def build_event(event_type, val=None):
         event = {
             'type': event_type,
             'value': val,
@@ -198,14 +207,165 @@ class PlaybackWrapper(object):
         if event[EventKeys.TYPE] == DriverAsyncEvent.ERROR:
             log.error(event)
 
+        return event
+
+
+class PlaybackWrapper(PlaybackBase):
+    def __init__(self, module, refdes, event_url, particle_url, reader_klass, allowed, files, workers=1,
+                 columnar=False):
+        version = DriverWrapper.get_version(module)
+        headers = {'sensor': refdes, 'deliveryType': 'streamed', 'version': version, 'module': module}
+        self.event_publisher = Publisher.from_url(event_url, headers)
+        self.particle_publisher = Publisher.from_url(particle_url, headers, allowed)
+        self.workers = workers
+
+        if columnar:
+            if not hasattr(self.particle_publisher, 'enqueue_columns'):
+                log.error('Columnar playback requires a file publisher, got: %r', particle_url)
+                sys.exit(1)
+            if workers > 1:
+                log.error('Columnar playback is not supported with workers')
+                sys.exit(1)
+
+        # with workers each process builds its own protocol
+        super(PlaybackWrapper, self).__init__(module, reader_klass, files, construct=workers <= 1)
+        if columnar:
+            if not getattr(self.protocol, '_particle_handlers', None):
+                # particles are only deferred to the batch from _got_particle_chunk
+                log.error('Columnar playback requires a protocol with _particle_handlers, %s has none', module)
+                sys.exit(1)
+            self.protocol._particle_batch = ParticleBatch()
+
+    def set_header_filename(self, filename):
+        self.event_publisher.set_source(filename)
+        self.particle_publisher.set_source(filename)
+
+    def got_filename(self, filename):
+        # events queued from the previous file go out with its source
+        self.publish()
+        self.set_header_filename(filename)
+        super(PlaybackWrapper, self).got_filename(filename)
+
+    def playback(self):
+        if self.workers > 1:
+            self.parallel_playback()
+        else:
+            for index, filename in enumerate(self.reader.read()):
+                if filename is not None:
+                    self.got_filename(filename)
+                if index % 1000 == 0:
+                    self.publish()
+            self.publish()
+        if hasattr(self.particle_publisher, 'write'):
+            self.particle_publisher.write()
+
+    def parallel_playback(self):
+        """
+        Play back each file in a pool of worker processes, each with its own protocol.
+        Results are published in file order as the workers finish them, the same order
+        as a serial playback.
+        """
+        log.info('Playing back %d files with %d workers', len(self.reader.files), self.workers)
+        tasks = [(self.module, self.reader_klass, filename) for filename in self.reader.files]
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            for filename, path in pool.imap(playback_file, tasks):
+                self.publish_spool(filename, path)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def publish_spool(self, filename, path):
+        """
+        Publish the events a worker spooled for one file, one chunk at a time, then remove the spool
+        @param filename source file name
+        @param path spool file written by PlaybackWorker
+        """
+        self.set_header_filename(filename)
+        try:
+            with open(path, 'rb') as fh:
+                while True:
+                    try:
+                        chunk = pickle.load(fh)
+                    except EOFError:
+                        break
+                    for event in chunk:
+                        self.enqueue_event(event)
+                    self.publish()
+        finally:
+            os.remove(path)
+
+    def publish(self):
+        batch = getattr(self.protocol, '_particle_batch', None)
+        if batch:
+            for columns in batch.flush():
+                self.particle_publisher.enqueue_columns(columns)
+        self.event_publisher.publish()
+        self.particle_publisher.publish()
+
+    def handle_event(self, event_type, val=None):
+        """
+        Construct and send an asynchronous driver event.
+        @param event_type a DriverAsyncEvent type specifier.
+        @param val event value for sample and test result events.
+        """
+        self.enqueue_event(self.build_event(event_type, val))
+
+    def enqueue_event(self, event):
         if event[EventKeys.TYPE] == DriverAsyncEvent.SAMPLE:
-            if event[EventKeys.VALUE].get('stream_name') != 'raw':
+            if not self.is_raw(event):
                 # don't publish raw
                 self.particle_publisher.enqueue(event)
         else:
             self.event_publisher.enqueue(event)
 
 
+class PlaybackWorker(PlaybackBase):
+    """
+    Plays back a single file inside a worker process. Events are spooled to a temporary
+    file in chunks of at most CHUNK_SIZE, so memory use does not grow with the file, and
+    read back and published by the parent.
+    """
+    CHUNK_SIZE = 1000
+
+    def __init__(self, module, reader_klass, filename):
+        super(PlaybackWorker, self).__init__(module, reader_klass, [filename])
+        self.filename = filename
+        self.chunk = []
+        self._spool = None
+
+    def playback(self):
+        """
+        @retval (filename, spool file path)
+        """
+        fd, path = tempfile.mkstemp(prefix='playback_', suffix='.spool')
+        try:
+            with os.fdopen(fd, 'wb') as self._spool:
+                for filename in self.reader.read():
+                    if filename is not None:
+                        self.got_filename(filename)
+                self.flush()
+        except:
+            os.remove(path)
+            raise
+        return self.filename, path
+
+    def flush(self):
+        if self.chunk:
+            pickle.dump(self.chunk, self._spool, protocol=-1)
+            self.chunk = []
+
+    def handle_event(self, event_type, val=None):
+        event = self.build_event(event_type, val)
+        if not self.is_raw(event):
+            self.chunk.append(event)
+            if len(self.chunk) >= self.CHUNK_SIZE:
+                self.flush()
+
+
 class DatalogReader(object):
     def __init__(self, files, callback):
         self.callback = callback
@@ -231,14 +391,20 @@ class DatalogReader(object):
                 log.info('Begin reading: %r', name)
                 # yield the filename so we can pass it through to the driver
                 yield name
-                self._filehandle = open(name, 'r')
+                self._open_file(name)
 
             if not self._process_packet():
-                self._filehandle.close()
-                self._filehandle = None
+                self._close_file()
 
             yield
 
+    def _open_file(self, name):
+        self._filehandle = open(name, 'r')
+
+    def _close_file(self):
+        self._filehandle.close()
+        self._filehandle = None
+
     def _process_packet(self):
         packet = PlaybackPacket.packet_from_fh(self._filehandle)
         if packet is None:
@@ -248,6 +414,108 @@ class DatalogReader(object):
         return True
 
 
+class BlockDatalogReader(DatalogReader):
+    """
+    Port agent datalog reader which fills a reusable buffer in large blocks and locates
+    each packet with a single find() for the sync bytes, rather than reading the file
+    one byte at a time. Each payload is copied out of the block once, as a string.
+
+    A packet is accepted only if its length is valid and it is followed by the sync
+    bytes of the next packet (or the end of the file). Otherwise the header is treated
+    as corrupt and the reader resynchronizes on the next sync bytes. A truncated packet
+    at the end of a file is logged and discarded.
+    """
+    BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, files, callback, block_size=BLOCK_SIZE):
+        super(BlockDatalogReader, self).__init__(files, callback)
+        self.block_size = block_size
+        self._buffer = bytearray(block_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._eof = False
+
+    def _open_file(self, name):
+        self._filehandle = open(name, 'rb')
+        self._start = self._end = 0
+        self._eof = False
+
+    def _fill(self, required):
+        """
+        Discard consumed data, then read from the file until at least required bytes
+        are buffered or the end of the file is reached.
+        @param required number of unconsumed bytes needed
+        @retval True if required bytes are available
+        """
+        remaining = self._end - self._start
+        if remaining >= required:
+            return True
+        if required > len(self._buffer):
+            # a single packet larger than the block, grow the buffer
+            new_buffer = bytearray(max(required, len(self._buffer) * 2))
+            new_buffer[:remaining] = self._buffer[self._start:self._end]
+            self._buffer = new_buffer
+            self._view = memoryview(new_buffer)
+        elif self._start:
+            self._buffer[:remaining] = self._buffer[self._start:self._end]
+        self._start, self._end = 0, remaining
+
+        while self._end < required and not self._eof:
+            bytes_read = self._filehandle.readinto(self._view[self._end:])
+            if not bytes_read:
+                self._eof = True
+            self._end += bytes_read or 0
+
+        return self._end >= required
+
+    def _next_packet(self):
+        sync = PacketHeader.sync
+        while True:
+            index = self._buffer.find(sync, self._start, self._end)
+            if index == -1:
+                # keep a possible partial sync sequence at the end of the block
+                self._start = max(self._start, self._end - len(sync) + 1)
+                if self._eof:
+                    return None
+                self._fill(self._end - self._start + self.block_size / 2)
+                continue
+
+            self._start = index
+            if not self._fill(PacketHeader.header_size):
+                break
+
+            header = PacketHeader.from_buffer(self._buffer, self._start)
+            packet_size = PacketHeader.header_size + header.payload_size
+            if header.payload_size >= 0 and self._fill(packet_size):
+                # a valid packet is followed by the next sync, or a partial one at the end of the file
+                self._fill(packet_size + len(sync))
+                following = self._start + packet_size
+                if sync.startswith(str(self._buffer[following:min(following + len(sync), self._end)])):
+                    payload_start = self._start + PacketHeader.header_size
+                    self._start = following
+                    return PlaybackPacket(payload=self._view[payload_start:following].tobytes(), header=header)
+            elif header.payload_size >= 0 and self._buffer.find(sync, self._start + 1, self._end) == -1:
+                break
+
+            log.warn('Invalid packet header in %r, resynchronizing', self._filehandle.name)
+            self._start += 1
+
+        if self._end > self._start:
+            log.warn('Discarding truncated packet (%d bytes) at end of %r',
+                     self._end - self._start, self._filehandle.name)
+        self._start = self._end
+        return None
+
+    def _process_packet(self):
+        packet = self._next_packet()
+        if packet is None:
+            return False
+        if packet.header.packet_type in self.target_types:
+            self.callback(packet)
+        return True
+
+
 class DigiDatalogAsciiReader(DatalogReader):
     def __init__(self, files, callback):
         self.ooi_ts_regex = re.compile(r'<OOI-TS (.+?) [TX][NS]>\r\n(.*?)<\\OOI-TS>', re.DOTALL)
@@ -319,6 +587,8 @@ def main():
     particle_url = options['<particle_url>']
     files = options.get('<files>')
     allowed = options.get('--allowed')
+    workers = int(options.get('--workers') or 1)
+    columnar = options.get('--columnar')
     if allowed is not None:
         allowed = [_.strip() for _ in allowed.split(',')]
 
@@ -329,6 +599,8 @@ def main():
 
     if options['datalog']:
         reader = DatalogReader
+    elif options['block']:
+        reader = BlockDatalogReader
     elif options['ascii']:
         reader = DigiDatalogAsciiReader
     elif options['chunky']:
@@ -336,7 +608,7 @@ def main():
     else:
         reader = None
 
-    wrapper = PlaybackWrapper(module, refdes, event_url, particle_url, reader, allowed, files)
+    wrapper = PlaybackWrapper(module, refdes, event_url, particle_url, reader, allowed, files, workers, columnar)
     wrapper.playback()
 
 if __name__ == '__main__':
@@ -7,6 +7,8 @@ from datetime import datetime, timedelta
 import sys
 from tqdm import tqdm
 
+from mi.core.checksum import lrc
+
 __author__ = 'petercable'
 
 datere = re.compile('(\d{8}T\d{4}_UTC)')
@@ -14,12 +16,6 @@ binary_sync = '\xa3\x9d\x7a'
 file_scan_depth = 256000
 
 
-def lrc(data, seed=0):
-    for b in bytearray(data):
-        seed ^= b
-    return seed
-
-
 def find_sensor(filename):
     if '_' in filename:
         return filename.split('_')[0]
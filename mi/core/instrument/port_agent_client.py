@@ -8,6 +8,7 @@
 and logging.
 """
 import errno
+import select
 import socket
 import struct
 import threading
@@ -22,22 +23,17 @@ __license__ = 'Apache 2.0'
 
 log = get_logger()
 
-
-# pure python LRC in case we don't have ooi_port_agent
-def py_lrc(data, seed=0):
-    for val in bytearray(data):
-        seed ^= val
-    return seed
-
 try:
     from ooi_port_agent.lrc import lrc
 except ImportError:
-    log.error('Unable to import compiled LRC function, falling back to pure python implementation (SLOW!)')
-    lrc = py_lrc
+    log.warn('Unable to import compiled LRC function, falling back to mi.core.checksum.lrc')
+    from mi.core.checksum import lrc
 
 
 HEADER_FORMAT = '>4BHHII'
 HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+HEADER = struct.Struct(HEADER_FORMAT)
+SYNC = '\xa3\x9d\x7a'
 OFFSET_P_CHECKSUM_LOW = 6
 OFFSET_P_CHECKSUM_HIGH = 7
 
@@ -91,9 +87,13 @@ class PortAgentPacket:
         self.__checksum = None
         self.__isValid = False
 
-    def unpack_header(self, header):
-        self.__header = header
-        variable_tuple = struct.unpack_from(HEADER_FORMAT, header)
+    def unpack_header(self, header, offset=0):
+        """
+        @param header buffer holding the packed header
+        @param offset position of the header in the buffer
+        """
+        variable_tuple = HEADER.unpack_from(header, offset)
+        self.__header = HEADER.pack(*variable_tuple)
         # change offset to index.
         self.__type = variable_tuple[TYPE_INDEX]
         self.__length = int(variable_tuple[LENGTH_INDEX]) - HEADER_SIZE
@@ -137,7 +137,7 @@ class PortAgentPacket:
         return checksum
 
     def verify_checksum(self):
-        checksum = lrc(self.__header, lrc(self.__data))
+        checksum = lrc(self.__header, lrc(self.get_data()))
         self.__isValid = checksum == 0
 
     def get_header(self):
@@ -152,8 +152,19 @@ class PortAgentPacket:
         self.__header = header
 
     def get_data(self):
+        if isinstance(self.__data, memoryview):
+            # copy once, releasing the receive buffer
+            self.__data = self.__data.tobytes()
         return self.__data
 
+    def get_data_view(self):
+        """
+        Return the payload without copying
+        """
+        if isinstance(self.__data, memoryview):
+            return self.__data
+        return memoryview(self.__data)
+
     def get_timestamp(self):
         return self.__port_agent_timestamp
 
@@ -205,9 +216,12 @@ class PortAgentClient(object):
     GET_CONFIG_COMMAND = "get_config"
     GET_STATE_COMMAND = "get_state"
 
-    def __init__(self, host, port, cmd_port, callback, error_callback, heartbeat=10, max_missed_heartbeats=5):
+    def __init__(self, host, port, cmd_port, callback, error_callback, heartbeat=10, max_missed_heartbeats=5,
+                 batch_callback=None):
         """
         PortAgentClient constructor.
+        @param batch_callback If given, all packets already received are passed together
+                              to this callback as a list (coalescing mode)
         """
         self.host = host
         self.port = port
@@ -219,6 +233,7 @@ class PortAgentClient(object):
         self.max_missed_heartbeats = max_missed_heartbeats
         self.send_attempts = MAX_SEND_ATTEMPTS
         self.callback = callback
+        self.batch_callback = batch_callback
         self.error_callback = error_callback
         self.last_retry_time = None
 
@@ -233,7 +248,7 @@ class PortAgentClient(object):
             # start the listener thread
             ###
             self.listener_thread = Listener(self.sock, self.callback, self.error_callback,
-                                            self.heartbeat, self.max_missed_heartbeats)
+                                            self.heartbeat, self.max_missed_heartbeats, self.batch_callback)
             self.listener_thread.start()
             self.send_get_state()
             self.send_get_config()
@@ -370,12 +385,20 @@ class Listener(threading.Thread):
     """
     A listener thread to monitor the client socket data incoming from
     the port agent process.
+
+    Data is received into a block buffer, as much as the socket has available
+    per recv. Headers are parsed in place and payloads are attached to their
+    packets as memoryviews of the block. A full block is replaced, never
+    overwritten, so a payload view stays valid for as long as it is referenced.
     """
     MAX_HEARTBEAT_INTERVAL = 20  # Max, for range checking parameter
     MAX_MISSED_HEARTBEATS = 5  # Max number we can miss
     HEARTBEAT_FUDGE = 1  # Fudge factor to account for delayed heartbeat
+    BLOCK_SIZE = 65536  # Receive buffer size, larger packets get a block of their own
+    POLL_TIMEOUT = 1  # Seconds to wait for data before checking if we are done
+    MAX_BATCH = 1000  # Max packets per batch in coalescing mode
 
-    def __init__(self, sock, callback, error_callback, heartbeat, max_missed_heartbeats):
+    def __init__(self, sock, callback, error_callback, heartbeat, max_missed_heartbeats, batch_callback=None):
         """
         Listener thread constructor.
         @param sock The socket to listen on.
@@ -383,6 +406,7 @@ class Listener(threading.Thread):
         @param error_callback The callback on error
         @param heartbeat The heartbeat interval in which to expect heartbeat messages from the Port Agent.
         @param max_missed_heartbeats The number of allowable missed heartbeats before attempting recovery.
+        @param batch_callback The callback on data arrival in coalescing mode, with a list of packets.
         """
         threading.Thread.__init__(self)
         self.sock = sock
@@ -393,7 +417,12 @@ class Listener(threading.Thread):
         self.heartbeat_missed_count = self.max_missed_heartbeats
         self.heartbeat = min(heartbeat + self.HEARTBEAT_FUDGE, self.MAX_HEARTBEAT_INTERVAL)
         self.callback = callback
+        self.batch_callback = batch_callback
         self.error_callback = error_callback
+        self._rx_block = bytearray(self.BLOCK_SIZE)
+        self._rx_view = memoryview(self._rx_block)
+        self._rx_start = 0  # first unparsed byte
+        self._rx_end = 0  # end of received data
 
     def heartbeat_timeout(self):
         self.heartbeat_missed_count -= 1
@@ -440,34 +469,126 @@ class Listener(threading.Thread):
         else:
             self.callback(pa_packet)
 
-    def _receive_n_bytes(self, count):
-        data_buffer = bytearray(count)
-        data_view = memoryview(data_buffer)
-        bytes_left = count
-        while bytes_left and not self._done:
-            try:
-                bytes_rx = self.sock.recv_into(data_view[-bytes_left:], bytes_left)
-                log.trace('RX BYTES %d LEFT %d SOCK %r', bytes_rx, bytes_left, self.sock)
-                if bytes_rx <= 0:
-                    raise SocketClosed()
-                bytes_left -= bytes_rx
-            except socket.error as e:
-                if e.errno == errno.EWOULDBLOCK:
-                    time.sleep(.1)
-                else:
-                    raise
+    def handle_packets(self, pa_packets):
+        """
+        Handle heartbeats and pass the remaining packets to the batch callback
+        """
+        batch = []
+        for pa_packet in pa_packets:
+            if pa_packet.get_header_type() == PortAgentPacket.HEARTBEAT:
+                self.handle_packet(pa_packet)
+            else:
+                batch.append(pa_packet)
+        if batch:
+            self.batch_callback(batch)
+
+    def _new_block(self, size):
+        """
+        Move the unparsed bytes to a new block with room for at least size bytes
+        """
+        pending = self._rx_end - self._rx_start
+        block = bytearray(max(self.BLOCK_SIZE, size))
+        block[:pending] = self._rx_view[self._rx_start:self._rx_end]
+        self._rx_block = block
+        self._rx_view = memoryview(block)
+        self._rx_start = 0
+        self._rx_end = pending
+
+    def _fill(self, timeout=POLL_TIMEOUT):
+        """
+        Wait for data and receive all the socket has available, up to the end of the block
+        @retval number of bytes received
+        """
+        if self._rx_end == len(self._rx_block):
+            self._new_block(self._rx_end - self._rx_start + HEADER_SIZE)
+
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        if not readable:
+            return 0
+
+        try:
+            bytes_rx = self.sock.recv_into(self._rx_view[self._rx_end:])
+        except socket.error as e:
+            if e.errno == errno.EWOULDBLOCK:
+                return 0
+            raise
+
+        log.trace('RX BYTES %d SOCK %r', bytes_rx, self.sock)
+        if bytes_rx <= 0:
+            raise SocketClosed()
+        self._rx_end += bytes_rx
+        return bytes_rx
+
+    def _buffered_packet(self):
+        """
+        @retval the next complete packet in the buffer, with the payload attached as a memoryview,
+                None if it has not been fully received
+        """
+        while True:
+            available = self._rx_end - self._rx_start
+            if available < HEADER_SIZE:
+                if len(self._rx_block) - self._rx_start < HEADER_SIZE:
+                    self._new_block(HEADER_SIZE)
+                return None
+
+            length = HEADER.unpack_from(self._rx_block, self._rx_start)[LENGTH_INDEX]
+            if self._rx_block.startswith(SYNC, self._rx_start) and length >= HEADER_SIZE:
+                break
+            self._resync()
+
+        if available < length:
+            if self._rx_start + length > len(self._rx_block):
+                self._new_block(length)
+            return None
+
+        pa_packet = PortAgentPacket()
+        pa_packet.unpack_header(self._rx_block, self._rx_start)
+        pa_packet.attach_data(self._rx_view[self._rx_start + HEADER_SIZE:self._rx_start + length])
+        self._rx_start += length
+        return pa_packet
+
+    def _resync(self):
+        """
+        Skip a corrupt header, up to the next sync bytes received
+        """
+        index = self._rx_block.find(SYNC, self._rx_start + 1, self._rx_end)
+        if index == -1:
+            # keep a possible partial sync sequence at the end of the data
+            index = max(self._rx_start + 1, self._rx_end - len(SYNC) + 1)
+        log.error('Invalid port agent packet header, skipping %d bytes to resynchronize', index - self._rx_start)
+        self._rx_start = index
+
+    def _next_packet(self):
+        """
+        Receive until a complete packet is buffered
+        @retval PortAgentPacket
+        """
+        while not self._done:
+            pa_packet = self._buffered_packet()
+            if pa_packet is not None:
+                return pa_packet
+            self._fill()
 
-        if self._done:
-            raise Done()
+        raise Done()
 
-        return str(data_buffer)
+    def _next_packets(self):
+        """
+        Wait for a packet, then take every complete packet the socket already holds
+        @retval list of PortAgentPacket
+        """
+        pa_packets = [self._next_packet()]
+        while len(pa_packets) < self.MAX_BATCH:
+            pa_packet = self._buffered_packet()
+            if pa_packet is not None:
+                pa_packets.append(pa_packet)
+            elif not self._fill(0):
+                break
+        return pa_packets
 
     def run(self):
         """
-        Listener thread processing loop. Block on receive from port agent.
-        Receive HEADER_SIZE bytes to receive the entire header.  From that,
-        get the length of the whole packet (including header); compute the
-        length of the remaining data and read that.
+        Listener thread processing loop. Block on receive from port agent,
+        handing each complete packet to the callback as soon as it is buffered.
         """
         self.thread_name = threading.current_thread().name
         log.info('PortAgentClient listener thread: %s started.', self.thread_name)
@@ -477,14 +598,10 @@ class Listener(threading.Thread):
 
         while not self._done:
             try:
-                header = self._receive_n_bytes(HEADER_SIZE)
-                pa_packet = PortAgentPacket()
-                pa_packet.unpack_header(header)
-                data_size = pa_packet.get_data_length()
-                data = self._receive_n_bytes(data_size)
-                # Should have complete port agent packet.
-                pa_packet.attach_data(data)
-                self.handle_packet(pa_packet)
+                if self.batch_callback is None:
+                    self.handle_packet(self._next_packet())
+                else:
+                    self.handle_packets(self._next_packets())
 
             except Done:
                 pass
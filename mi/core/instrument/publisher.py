@@ -13,11 +13,13 @@ import json
 import urllib
 import urlparse
 from collections import deque
-from threading import Thread
+from threading import Thread, Event, Lock
 
 import datetime
 
+from mi.core.codec import get_codec, get_compressor
 from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.instrument.spill_queue import SpillQueue
 from ooi.logging import log
 
 
@@ -35,29 +37,78 @@ def extract_param(param, query):
     return return_value, urllib.urlencode(new_params)
 
 
+class EventBatch(list):
+    """
+    A batch of events along with the encoding of each, captured once at enqueue
+    """
+    def __init__(self, codec, events=(), fragments=()):
+        super(EventBatch, self).__init__(events)
+        self.codec = codec
+        self.fragments = list(fragments)
+
+    def payload(self):
+        """
+        @retval the batch encoded as a list by the publisher codec, for json identical to json.dumps(events)
+        """
+        return self.codec.join(self.fragments)
+
+
 class Publisher(object):
     DEFAULT_MAX_EVENTS = 500
     DEFAULT_PUBLISH_INTERVAL = 5
+    DEFAULT_SPILL_THRESHOLD = 50000
     SOURCE = 'source'
+    # publishers which never send encoded events skip encoding (and validation) at enqueue
+    ENCODE_EVENTS = True
 
-    def __init__(self, allowed, max_events=None, publish_interval=None):
+    def __init__(self, allowed, max_events=None, publish_interval=None, codec=None, compress=None,
+                 spill_dir=None, spill_threshold=None):
         self._allowed = allowed
+        self._codec = get_codec(codec)
+        self._compressor = get_compressor(compress)
         self._deque = deque()
+        # once the in memory backlog reaches spill_threshold new events go to disk until it has been replayed
+        self._spill = SpillQueue(spill_dir) if spill_dir else None
+        self._spill_threshold = int(spill_threshold) if spill_threshold else self.DEFAULT_SPILL_THRESHOLD
+        self._spill_lock = Lock()
+        # (read position, ids of the events read up to it not yet settled) for each read from the spill
+        self._spill_reads = deque()
         self._max_events = max_events if max_events else self.DEFAULT_MAX_EVENTS
         self._publish_interval = publish_interval if publish_interval else self.DEFAULT_PUBLISH_INTERVAL
         self._running = False
         self._headers = {}
-        log.info('Publisher: max_events: %d publish_interval: %d', self._max_events, self._publish_interval)
+        # set to wake the publishing thread before the publish interval expires
+        self._wakeup = Event()
+        # set while the last publish failed, size triggered wakeups wait for the interval instead
+        self._retrying = False
+        self._metrics = {
+            'published': 0,
+            'failed': 0,
+            'batches': 0,
+            'publish_time': 0.0,
+            'last_latency': 0.0,
+            'max_latency': 0.0,
+            'payload_bytes': 0,
+            'sent_bytes': 0,
+        }
+        log.info('Publisher: max_events: %d publish_interval: %d codec: %s compress: %s',
+                 self._max_events, self._publish_interval, self._codec.name, compress)
 
     def _run(self):
+        """
+        Publish whenever max_events are queued, flush() is called or the publish interval expires
+        """
         self._running = True
-        last_publish = time.time()
+        next_publish = time.time() + self._publish_interval
         while self._running:
-            now = time.time()
-            if now > last_publish + self._publish_interval:
-                last_publish = now
-                self.publish()
-            time.sleep(.1)
+            self._wakeup.wait(max(0, next_publish - time.time()))
+            self._wakeup.clear()
+            next_publish = time.time() + self._publish_interval
+            self.publish()
+
+            depth = len(self._deque)
+            if depth >= self._max_events:
+                log.warn('Publisher backlog: %d events queued', depth)
 
     def _merge_headers(self, headers):
         msg_headers = copy.deepcopy(self._headers)
@@ -78,63 +129,214 @@ class Publisher(object):
 
     def stop(self):
         self._running = False
+        self._wakeup.set()
+
+    def flush(self):
+        """
+        Ask the publishing thread to publish now rather than at the end of the interval
+        """
+        self._wakeup.set()
+
+    def _encode(self, event):
+        if self.ENCODE_EVENTS:
+            return self._codec.encode(event)
+
+    def _payload(self, events):
+        """
+        Encode a batch for sending, compressing it if configured
+        @param events EventBatch
+        @retval (payload, content encoding)
+        """
+        payload = events.payload()
+        self._metrics['payload_bytes'] += len(payload)
+        if self._compressor is None:
+            encoding = self._codec.content_encoding
+        else:
+            payload = self._compressor.compress(payload)
+            encoding = self._compressor.name
+        self._metrics['sent_bytes'] += len(payload)
+        return payload, encoding
 
     def enqueue(self, event):
+        instance = None
+        if 'instance' in event:
+            # the instance goes in the headers, not the payload, leave the caller's event as it was
+            event = dict(event)
+            instance = event.pop('instance')
         try:
-            json.dumps(event)
-            self._deque.append(event)
+            item = (instance, event, self._encode(event))
         except Exception as e:
-            log.error('Unable to encode event as JSON: %r', e)
+            log.error('Unable to encode event as %s: %r', self._codec.name, e)
+            return
 
-    def requeue(self, events):
-        self._deque.extendleft(reversed(events))
-
-    @staticmethod
-    def group_events(events):
-        group_dict = {}
-        for event in events:
-            group = event.pop('instance', None)
-            group_dict.setdefault(group, []).append(event)
-        return group_dict
+        if self._spill is None:
+            self._deque.append(item)
+        else:
+            self._spill_or_append(item)
+
+        if len(self._deque) >= self._max_events and not self._retrying:
+            self._wakeup.set()
+
+    def get_metrics(self):
+        """
+        @retval dictionary of queue depth, event counts, payload sizes before and after
+        compression (bytes) and publish latency (seconds)
+        """
+        metrics = dict(self._metrics)
+        spilled = len(self._spill) if self._spill is not None else 0
+        metrics['queue_depth'] = len(self._deque) + spilled
+        metrics['spilled'] = spilled
+        return metrics
+
+    def _spill_or_append(self, item):
+        """
+        Queue an item in memory, or on disk while the backlog is over the threshold or not yet replayed
+        """
+        with self._spill_lock:
+            if len(self._spill) or len(self._deque) >= self._spill_threshold:
+                try:
+                    if not len(self._spill):
+                        log.warn('Publisher backlog reached %d events, spilling to %s',
+                                 len(self._deque), self._spill.path)
+                    self._spill.append(item)
+                    return
+                except (IOError, OSError) as e:
+                    log.error('Unable to spill event to disk, keeping in memory: %r', e)
+            self._deque.append(item)
+
+    def _unspill(self):
+        """
+        Called with the in memory queue empty, moves the next batch from disk into memory
+        """
+        with self._spill_lock:
+            items = self._spill.read(self._max_events)
+            if items:
+                self._deque.extend(items)
+                self._spill_reads.append((self._spill.position(), set(id(event) for _, event, _ in items)))
+
+    def _settled(self, events):
+        """
+        Called once events are delivered (or filtered out) for good. Commits the spill read
+        position once every event read from the spill up to it is settled.
+        """
+        if not self._spill_reads:
+            return
+        for _, pending in self._spill_reads:
+            pending.difference_update(id(event) for event in events)
+
+        position = None
+        while self._spill_reads and not self._spill_reads[0][1]:
+            position = self._spill_reads.popleft()[0]
+        if position is not None:
+            with self._spill_lock:
+                self._spill.commit(position)
+
+    def _published(self, events):
+        """
+        Called for each batch _publish sent without failure, publishers which only learn about
+        delivery later call _settled themselves
+        """
+        self._settled(events)
+
+    def requeue(self, events, instance=None):
+        fragments = getattr(events, 'fragments', None) or [self._encode(event) for event in events]
+        self._deque.extendleft(reversed([(instance, event, fragment) for event, fragment in zip(events, fragments)]))
 
     def publish(self):
-        events = []
-        for _ in xrange(self._max_events):
-            try:
-                events.append(self._deque.popleft())
-            except IndexError:
+        """
+        Publish the events queued at the time of the call, max_events per batch. Stops at
+        the first batch with failures, which are requeued for the next cycle.
+        @retval number of events published
+        """
+        remaining = len(self._deque)
+        if self._spill is not None:
+            remaining += len(self._spill)
+        published = 0
+        self._retrying = False
+        while remaining > 0:
+            if self._spill is not None and not self._deque:
+                self._unspill()
+
+            items = []
+            for _ in xrange(min(self._max_events, remaining)):
+                try:
+                    items.append(self._deque.popleft())
+                except IndexError:
+                    break
+
+            if not items:
+                break
+            remaining -= len(items)
+
+            failed = self._publish_batch(items)
+            published += len(items) - failed
+            if failed:
+                self._retrying = True
                 break
 
-        if events:
-            events = self.filter_events(events)
-            groups = self.group_events(events)
-            for instance in groups:
-                if instance is None:
-                    failed = self._publish(groups[instance], instance)
-                    if failed:
-                        self.requeue(failed)
-                else:
-                    failed = self._publish(groups[instance], {'sensor': instance})
-                    if failed:
-                        self.requeue(failed)
+        return published
+
+    def _publish_batch(self, items):
+        """
+        Publish one batch of queued (instance, event, fragment) items, requeueing any failures.
+        _publish returns the failed events, or the number of its events it failed and requeued itself.
+        @retval number of failed events
+        """
+        start = time.time()
+        oldest = min(event.get('time') for _, event, _ in items)
+
+        if self._allowed is not None and isinstance(self._allowed, list):
+            log.info('Filtering %d events with: %r', len(items), self._allowed)
+            count = len(items)
+            dropped = [event for _, event, _ in items if not self._is_allowed(event)]
+            items = [item for item in items if self._is_allowed(item[1])]
+            log.info('Dropped %d unallowed particles', count - len(items))
+            self._settled(dropped)
+
+        groups = {}
+        for instance, event, fragment in items:
+            batch = groups.setdefault(instance, EventBatch(self._codec))
+            batch.append(event)
+            batch.fragments.append(fragment)
+
+        failed_count = 0
+        for instance in groups:
+            if instance is None:
+                failed = self._publish(groups[instance], instance)
+            else:
+                failed = self._publish(groups[instance], {'sensor': instance})
+            if isinstance(failed, (int, long)):
+                failed_count += failed
+            elif failed:
+                failed_count += len(failed)
+                self.requeue(failed, instance)
+            else:
+                self._published(groups[instance])
+
+        now = time.time()
+        metrics = self._metrics
+        metrics['batches'] += 1
+        metrics['published'] += len(items) - failed_count
+        metrics['failed'] += failed_count
+        metrics['publish_time'] += now - start
+        if isinstance(oldest, float):
+            metrics['last_latency'] = now - oldest
+            metrics['max_latency'] = max(metrics['max_latency'], metrics['last_latency'])
+        return failed_count
 
     def _publish(self, events, headers):
         raise NotImplemented
 
+    def _is_allowed(self, event):
+        if event.get('type') == DriverAsyncEvent.SAMPLE:
+            return event.get('value', {}).get('stream_name') in self._allowed
+        return True
+
     def filter_events(self, events):
         if self._allowed is not None and isinstance(self._allowed, list):
             log.info('Filtering %d events with: %r', len(events), self._allowed)
-            new_events = []
-            dropped = 0
-            for event in events:
-                if event.get('type') == DriverAsyncEvent.SAMPLE:
-                    if event.get('value', {}).get('stream_name') in self._allowed:
-                        new_events.append(event)
-                    else:
-                        dropped += 1
-                else:
-                    new_events.append(event)
-            log.info('Dropped %d unallowed particles', dropped)
+            new_events = [event for event in events if self._is_allowed(event)]
+            log.info('Dropped %d unallowed particles', len(events) - len(new_events))
             return new_events
         return events
 
@@ -145,6 +347,17 @@ class Publisher(object):
 
         result = urlparse.urlsplit(url)
         queue, query = extract_param('queue', result.query)
+        # a codec in the url overrides any default passed by the caller
+        codec, query = extract_param('codec', query)
+        if codec:
+            kwargs['codec'] = codec
+        compress, query = extract_param('compress', query)
+        if compress:
+            kwargs['compress'] = compress
+        spill_dir, query = extract_param('spill_dir', query)
+        if spill_dir:
+            spill_threshold, query = extract_param('spill_threshold', query)
+            kwargs.update(spill_dir=spill_dir, spill_threshold=spill_threshold)
         url = result.scheme + '://' + result.netloc + result.path
 
         username = password = 'guest'
@@ -161,6 +374,10 @@ class Publisher(object):
             from qpid_publisher import QpidPublisher
             publisher = QpidPublisher
 
+            # batches in flight without waiting for each to be acknowledged
+            window, query = extract_param('window', query)
+            kwargs['window'] = window
+
         elif result.scheme == 'amqp' or result.scheme == 'pyamqp':
             from kombu_publisher import KombuPublisher
             publisher = KombuPublisher
@@ -171,17 +388,29 @@ class Publisher(object):
         elif result.scheme == 'count':
             return CountPublisher(allowed, **kwargs)
 
-        elif result.scheme == 'csv':
-            from file_publisher import CsvPublisher
-            return CsvPublisher(allowed, **kwargs)
+        elif result.scheme in ('csv', 'pandas', 'xarray', 'netcdf'):
+            # file publishers stream to part files when given a flush threshold
+            flush_rows, query = extract_param('flush_rows', query)
+            flush_mb, query = extract_param('flush_mb', query)
+            kwargs.update(flush_rows=flush_rows, flush_mb=flush_mb)
+
+            if result.scheme == 'csv':
+                from file_publisher import CsvPublisher
+                return CsvPublisher(allowed, **kwargs)
+
+            elif result.scheme == 'pandas':
+                from file_publisher import PandasPublisher
+                return PandasPublisher(allowed, **kwargs)
 
-        elif result.scheme == 'pandas':
-            from file_publisher import PandasPublisher
-            return PandasPublisher(allowed, **kwargs)
+            elif result.scheme == 'xarray':
+                from file_publisher import XarrayPublisher
+                return XarrayPublisher(allowed, **kwargs)
 
-        elif result.scheme == 'xarray':
-            from file_publisher import XarrayPublisher
-            return XarrayPublisher(allowed, **kwargs)
+            elif result.scheme == 'netcdf':
+                from netcdf_publisher import NetcdfPublisher
+                complevel, query = extract_param('complevel', query)
+                chunk_rows, query = extract_param('chunk_rows', query)
+                return NetcdfPublisher(allowed, complevel=complevel, chunk_rows=chunk_rows, **kwargs)
 
         if publisher:
             if queue is None:
@@ -202,6 +431,7 @@ class CountPublisher(Publisher):
         self.total = 0
 
     def _publish(self, events, headers):
+        # events were encoded at enqueue, report the payload size instead of re-encoding
         count = len(events)
         self.total += count
-        log.info('Publish %d events (%d total)', count, self.total)
+        log.info('Publish %d events, %d bytes (%d total)', count, len(events.payload()), self.total)
@@ -7,39 +7,136 @@ Release notes:
 
 initial release
 """
-import json
 import time
+from collections import deque
 
 import qpid.messaging as qm
 
 from mi.core.instrument.publisher import Publisher
 from ooi.logging import log
 
+# qpid.messaging maps this property to the AMQP 0-10 content-encoding
+CONTENT_ENCODING = 'x-amqp-0-10.content-encoding'
+
 
 class QpidPublisher(Publisher):
+    """
+    Publishes batches over a persistent QPID connection. By default each batch blocks until
+    the broker acknowledges it. With a window, up to that many batches are sent without
+    waiting; settlement is tracked in send order and only unsettled batches are requeued
+    when the connection fails. The connection does not reconnect by itself, qpid.messaging
+    would resend the unsettled messages which are requeued here, it is reopened on the next
+    publish instead.
+    """
+    SEND_TIMEOUT = 30
+
     def __init__(self, url, queue, headers, allowed, username='guest', password='guest', **kwargs):
+        window = kwargs.pop('window', None)
         super(QpidPublisher, self).__init__(allowed, **kwargs)
-        self.connection = qm.Connection(url, reconnect=True, username=username, password=password)
+        self.url = url
+        self.username = username
+        self.password = password
+        self.window = int(window) if window else 0
+        self.connection = None
         self.queue = queue
         self.session = None
         self.sender = None
         self._headers = headers
-        self.connect()
+        # (events, instance) sent but not yet settled, oldest first
+        self._in_flight = deque()
+        self._metrics['requeued'] = 0
+        try:
+            self.connect()
+        except qm.MessagingError as e:
+            log.error('Unable to connect to QPID, retrying on publish: %r', e)
+            self.disconnect()
 
     def connect(self):
+        self.connection = qm.Connection(self.url, reconnect=False, username=self.username, password=self.password)
         self.connection.open()
         self.session = self.connection.session()
         self.sender = self.session.sender('%s; {create: always, node: {type: queue, durable: true}}' % self.queue)
+        if self.window:
+            self.sender.capacity = self.window
+
+    def disconnect(self):
+        connection, self.connection, self.session, self.sender = self.connection, None, None, None
+        if connection is not None:
+            try:
+                connection.close(timeout=1)
+            except Exception as e:
+                log.debug('Error closing QPID connection: %r', e)
+
+    def _settle(self):
+        """
+        Drop the batches the broker has acknowledged, settlement follows send order
+        """
+        unsettled = self.sender.unsettled()
+        while len(self._in_flight) > unsettled:
+            self._settled(self._in_flight.popleft()[0])
+
+    def _published(self, events):
+        # in flight batches are settled by _settle
+        if not self.window:
+            self._settled(events)
+
+    def _requeue_in_flight(self):
+        """
+        Requeue the unsettled batches ahead of anything queued since they were sent. They were
+        counted as published when sent and are counted again once resent.
+        """
+        count = 0
+        while self._in_flight:
+            events, instance = self._in_flight.pop()
+            self.requeue(events, instance)
+            count += len(events)
+        self._metrics['requeued'] += count
+
+    def get_metrics(self):
+        metrics = super(QpidPublisher, self).get_metrics()
+        metrics['in_flight'] = sum(len(events) for events, _ in self._in_flight)
+        return metrics
+
+    def publish(self):
+        published = super(QpidPublisher, self).publish()
+        if self._in_flight:
+            try:
+                self._settle()
+            except qm.MessagingError as e:
+                log.error('QPID connection failed with %d batches in flight: %r', len(self._in_flight), e)
+                self.disconnect()
+                self._requeue_in_flight()
+        return published
 
     def _publish(self, events, headers):
         msg_headers = self._merge_headers(headers)
 
-        # HACK!
-        self.connection.error = None
-
         now = time.time()
-        message = qm.Message(content=json.dumps(events), content_type='text/plain', durable=True,
+        payload, content_encoding = self._payload(events)
+        if self._compressor is not None:
+            msg_headers[CONTENT_ENCODING] = content_encoding
+        message = qm.Message(content=payload, content_type=self._codec.content_type, durable=True,
                              properties=msg_headers, user_id='guest')
-        self.sender.send(message, sync=True)
+        try:
+            if self.sender is None:
+                self.connect()
+            if self.window:
+                self.sender.send(message, sync=False, timeout=self.SEND_TIMEOUT)
+                self._in_flight.append((events, headers.get('sensor') if headers else None))
+                self._settle()
+            else:
+                self.sender.send(message, sync=True, timeout=self.SEND_TIMEOUT)
+        except qm.MessagingError as e:
+            log.error('Exception attempting to publish events to QPID: %r', e)
+            self.disconnect()
+            if not self.window:
+                return events
+            # the current batch may already be in flight, in any case it goes after the older ones
+            if self._in_flight and self._in_flight[-1][0] is events:
+                self._in_flight.pop()
+            self.requeue(events, headers.get('sensor') if headers else None)
+            self._requeue_in_flight()
+            return len(events)
+
         elapsed = time.time() - now
         log.info('Published %d messages to QPID in %.2f secs', len(events), elapsed)
@@ -0,0 +1,165 @@
+"""
+@package mi.core.instrument.spill_queue
+@file /mi-instrument/mi/core/instrument/spill_queue.py
+@brief Disk backed overflow queue for the publisher
+Release notes:
+
+initial release
+"""
+import cPickle as pickle
+import io
+import os
+import struct
+
+from ooi.logging import log
+
+
+class SpillQueue(object):
+    """
+    Append-only log of queued publisher items, split into numbered segment files.
+    Items are read back in order, a checkpoint file records the position of the
+    first item not yet committed so a restarted publisher replays the remainder.
+    Items read but not committed before a crash are replayed again.
+    """
+    HEADER = struct.Struct('>I')
+    SEGMENT_BYTES = 64 * 1024 * 1024
+    CHECKPOINT = 'checkpoint'
+    SUFFIX = '.seg'
+
+    def __init__(self, path, segment_bytes=None):
+        self.path = path
+        self.segment_bytes = segment_bytes if segment_bytes else self.SEGMENT_BYTES
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self._read_seq, self._read_offset = self._load_checkpoint()
+        self._reader = None
+        self._remove_segments(self._read_seq)
+
+        segments = self._segments() or [self._read_seq]
+        self._write_seq = segments[-1]
+        # number of items not yet read
+        self.count = self._recover(segments)
+        self._writer = open(self._segment_path(self._write_seq), 'ab')
+
+        if self.count:
+            log.info('Spill queue %s: %d items to replay', path, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def _segment_path(self, seq):
+        return os.path.join(self.path, '%012d%s' % (seq, self.SUFFIX))
+
+    def _segments(self):
+        return sorted(int(name[:-len(self.SUFFIX)]) for name in os.listdir(self.path) if name.endswith(self.SUFFIX))
+
+    def _remove_segments(self, before):
+        for seq in self._segments():
+            if seq < before:
+                os.remove(self._segment_path(seq))
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.path, self.CHECKPOINT)) as fh:
+                seq, offset = fh.read().split()
+                return int(seq), int(offset)
+        except (IOError, ValueError):
+            segments = self._segments()
+            return (segments[0] if segments else 0), 0
+
+    def _recover(self, segments):
+        """
+        Count the items after the checkpoint, truncating a partial item left by a crash
+        @retval number of items
+        """
+        count = 0
+        for seq in segments:
+            if not os.path.exists(self._segment_path(seq)):
+                continue
+            offset = self._read_offset if seq == self._read_seq else 0
+            with io.open(self._segment_path(seq), 'rb') as fh:
+                fh.seek(offset)
+                while True:
+                    header = fh.read(self.HEADER.size)
+                    if len(header) < self.HEADER.size:
+                        break
+                    size, = self.HEADER.unpack(header)
+                    if len(fh.read(size)) < size:
+                        break
+                    offset += self.HEADER.size + size
+                    count += 1
+
+            if os.path.getsize(self._segment_path(seq)) > offset:
+                log.warn('Truncating partial item in spill segment %d at offset %d', seq, offset)
+                with open(self._segment_path(seq), 'r+b') as fh:
+                    fh.truncate(offset)
+        return count
+
+    def append(self, item):
+        """
+        @param item picklable item
+        """
+        if self._writer.tell() >= self.segment_bytes:
+            self._writer.close()
+            self._write_seq += 1
+            self._writer = open(self._segment_path(self._write_seq), 'ab')
+
+        data = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        self._writer.write(self.HEADER.pack(len(data)) + data)
+        self._writer.flush()
+        self.count += 1
+
+    def read(self, n):
+        """
+        Read the next items, the position is only persisted by commit
+        @param n maximum number of items
+        @retval list of items
+        """
+        items = []
+        while len(items) < n and self.count:
+            if self._reader is None:
+                self._reader = io.open(self._segment_path(self._read_seq), 'rb')
+                self._reader.seek(self._read_offset)
+
+            header = self._reader.read(self.HEADER.size)
+            if not header and self._read_seq < self._write_seq:
+                self._reader.close()
+                self._reader = None
+                self._read_seq += 1
+                self._read_offset = 0
+                continue
+            if len(header) < self.HEADER.size:
+                log.error('Spill queue %s: expected %d more items, found end of segment %d',
+                          self.path, self.count, self._read_seq)
+                break
+
+            size, = self.HEADER.unpack(header)
+            items.append(pickle.loads(self._reader.read(size)))
+            self._read_offset += self.HEADER.size + size
+            self.count -= 1
+        return items
+
+    def position(self):
+        """
+        @retval the current read position, for a later commit
+        """
+        return self._read_seq, self._read_offset
+
+    def commit(self, position=None):
+        """
+        Persist a read position and remove the segments before it
+        @param position from position(), None for the current read position
+        """
+        seq, offset = position if position is not None else self.position()
+        checkpoint = os.path.join(self.path, self.CHECKPOINT)
+        with open(checkpoint + '.tmp', 'w') as fh:
+            fh.write('%d %d\n' % (seq, offset))
+        os.rename(checkpoint + '.tmp', checkpoint)
+        self._remove_segments(seq)
+
+    def close(self):
+        self._writer.close()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.benchmark_chunker
+@file mi/core/instrument/test/benchmark_chunker.py
+@brief Compare the single pass compiled regex sieve with searching each regex separately
+
+Usage:
+    python -m mi.core.instrument.test.benchmark_chunker [<copies>]
+
+Each sieve runs over <copies> of its sample records (default 1000), the chunks
+kept from the results of both sieves must be the same:
+    botpt   the five BOTPT sample regexes over the BOTPT firehose samples
+    nmea    twelve NMEA sentence regexes sharing a $GP prefix, the combined
+            sieve gains most as the number of regexes grows
+"""
+
+__license__ = 'Apache 2.0'
+
+import re
+import sys
+import timeit
+
+from mi.core.instrument.chunker import StringChunker
+from mi.instrument.noaa.botpt.ooicore.driver import Protocol
+from mi.instrument.noaa.botpt.ooicore.test import test_samples as samples
+
+NMEA_IDS = ['GGA', 'GLL', 'GSA', 'GSV', 'RMC', 'VTG', 'ZDA', 'HDT', 'DBT', 'MTW', 'VHW', 'XDR']
+
+
+def botpt(copies):
+    data = (samples.BOTPT_FIREHOSE_01 + samples.BOTPT_FIREHOSE_02 + samples.LEVELING_STATUS + samples.NEWLINE +
+            samples.INVALID_SAMPLE) * copies
+    return [regex for regex, _, _ in Protocol._particle_handlers.itervalues()], data
+
+
+def nmea(copies):
+    regex_list = [re.compile(r'\$GP%s,(?P<fields>[^*\r\n]*)\*(?P<checksum>[0-9A-F]{2})\r\n' % sentence)
+                  for sentence in NMEA_IDS]
+    data = ''.join('$GP%s,%d,4916.45,N,12311.12,W,1,08,0.9*4F\r\n' % (sentence, index)
+                   for index in range(copies) for sentence in NMEA_IDS)
+    return regex_list, data
+
+
+def compare(name, regex_list, data, number=5):
+    combined = StringChunker.compile_regex_sieve(regex_list)
+
+    def separate(raw_data):
+        return StringChunker.regex_sieve_function(raw_data, regex_list)
+
+    # the separate regexes report every overlapping match, compare the chunks a chunker keeps
+    results = StringChunker._prune_overlaps(sorted(combined(data)))
+    if [result[:2] for result in results] != StringChunker._prune_overlaps(sorted(separate(data))):
+        sys.exit('%s: compiled sieve results differ from the separate regexes' % name)
+
+    separate_time = timeit.timeit(lambda: separate(data), number=number) / number
+    combined_time = timeit.timeit(lambda: combined(data), number=number) / number
+    print '%s: %d bytes, %d chunks, %d regexes' % (name, len(data), len(results), len(regex_list))
+    print '    separate finditer: %8.1f ms' % (separate_time * 1e3)
+    print '    compiled sieve:    %8.1f ms (x%.2f)' % (combined_time * 1e3, separate_time / combined_time)
+
+
+def main():
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    for name, build in (('botpt', botpt), ('nmea', nmea)):
+        regex_list, data = build(copies)
+        compare(name, regex_list, data)
+
+
+if __name__ == '__main__':
+    main()
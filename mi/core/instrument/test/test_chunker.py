@@ -19,7 +19,7 @@ from mi.core.unit_test import IonUnitTestCase
 from ooi.logging import log
 
 from mi.core.exceptions import SampleException
-from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import StringChunker, IncrementalChunker, _first_chars
 
 @attr('UNIT', group='mi')
 class UnitTestStringChunker(MiUnitTestCase):
@@ -90,6 +90,72 @@ class UnitTestStringChunker(MiUnitTestCase):
         self.assertEquals([(0,31), (33, 64)],
                           self._chunker.regex_sieve_function(self.MULTI_SAMPLE_1, [regex]))
 
+    def test_compiled_regex_sieve(self):
+        """
+        The compiled sieve finds all regexes in one pass and reports which one matched
+        """
+        par = re.compile(r'SATPAR(?P<sernum>\d{4}),(?P<timer>\d{1,7}.\d\d),(?P<counts>\d{10}),(?P<checksum>\d{1,3})')
+        foo = re.compile(r"""
+            (?x)    # verbose
+            (?P<checksum>Foo|Bat)   # named group also used above""")
+        bar = re.compile(r'(B)ar\1', re.I)
+        sieve = StringChunker.compile_regex_sieve([par, foo, bar])
+        sample_string = "Foo%sbarB%sBat" % (self.SAMPLE_1, self.SAMPLE_2)
+
+        self.assertEquals([(0, 3, 1), (3, 34, 0), (34, 38, 2), (38, 69, 0), (69, 72, 1)], sorted(sieve(sample_string)))
+        self.assertEquals([], sieve(self.FRAGMENT_1))
+
+        self._chunker = StringChunker(sieve)
+        self._chunker.add_chunk(sample_string, self.TIMESTAMP_1)
+        self.assertEquals((self.TIMESTAMP_1, 'Foo', 1), self._chunker.get_next_match())
+        self.assertEquals((self.TIMESTAMP_1, self.SAMPLE_1), self._chunker.get_next_data())
+        self.assertEquals((self.TIMESTAMP_1, 'barB', 2), self._chunker.get_next_match())
+
+    def test_compiled_regex_sieve_tie_break(self):
+        """
+        Where regexes match at the same position the shortest match wins, then the first regex,
+        the same chunks as separate regexes sorted and pruned
+        """
+        long_match = re.compile(r'AB\d+;\d+;')
+        short_match = re.compile(r'AB\d+;')
+        same = re.compile(r'AB\d+;')
+        sieve = StringChunker.compile_regex_sieve([long_match, short_match, same])
+        data = 'AB1;2;xAB3;'
+        self.assertEquals([(0, 4, 1), (7, 11, 1)], sieve(data))
+
+        separate = partial(StringChunker.regex_sieve_function, regex_list=[long_match, short_match, same])
+        for sieve_fn in (sieve, separate):
+            chunker = StringChunker(sieve_fn)
+            chunker.add_chunk(data, self.TIMESTAMP_1)
+            self.assertEquals([chunk[1] for chunk in chunker.chunks], ['AB1;', 'AB3;'])
+
+    def test_first_chars(self):
+        """
+        Only regexes able to start at a match position are tried again for a shorter match
+        """
+        self.assertEquals(_first_chars(re.compile(r'SATPAR\d{4}')), ('SATPAR', frozenset('S')))
+        self.assertEquals(_first_chars(re.compile(r'(?:LILY|NANO),\d+')), ('', frozenset('LN')))
+        self.assertEquals(_first_chars(re.compile(r'[a-c]+x', re.I)), ('', frozenset('abcABC')))
+        self.assertEquals(_first_chars(re.compile(r'(?P<id>#|\$)+')), ('', frozenset('#$')))
+        self.assertEquals(_first_chars(re.compile(r'(?x) AB C # comment')), ('ABC', frozenset('A')))
+        for pattern in (r'\d+', r'x?y', r'^AB', r'.B', r'[^A]B', ''):
+            self.assertEquals(_first_chars(re.compile(pattern)), ('', None))
+
+        # both regexes start with the same character, only the one with a matching prefix is tried again
+        long_match = re.compile(r'AB\d+;\d+;')
+        other = re.compile(r'AC\d+;')
+        sieve = StringChunker.compile_regex_sieve([long_match, other])
+        self.assertEquals(sieve('AB1;2;AC3;'), [(0, 6, 0), (6, 10, 1)])
+
+    def test_compiled_regex_sieve_inline_flags(self):
+        """
+        Inline flags apply only to their own regex
+        """
+        upper = re.compile(r'FOO\d')
+        any_case = re.compile(r'(?i)bar\d')
+        sieve = StringChunker.compile_regex_sieve([upper, any_case])
+        self.assertEquals([(0, 4, 0), (8, 12, 1)], sorted(sieve('FOO1foo2BAR3')))
+
     def test_make_chunks(self):
         sample_string = "Foo%sBar%sBat" % (self.SAMPLE_1, self.SAMPLE_2)
         self._chunker.add_chunk(sample_string, self.TIMESTAMP_1)
@@ -197,8 +263,70 @@ class UnitTestStringChunker(MiUnitTestCase):
         self.assertEquals(result, "Foo")
         self.assertEquals(time, self.TIMESTAMP_1)
 
+    def test_add_chunks(self):
+        """
+        A batch of blocks is sieved once, samples keep the timestamp of the block they start in
+        """
+        self._chunker.add_chunks([(self.SAMPLE_1 + "\r\n", self.TIMESTAMP_1),
+                                  (self.FRAGMENT_1, self.TIMESTAMP_2),
+                                  (self.FRAGMENT_2, self.TIMESTAMP_3)])
+        self.assertEqual(self._chunker.get_next_data(), (self.TIMESTAMP_1, self.SAMPLE_1))
+        self.assertEqual(self._chunker.get_next_data(), (self.TIMESTAMP_2, self.FRAGMENT_SAMPLE))
+        self.assertEqual(self._chunker.get_next_data(), (None, None))
+
     def test_overlap(self):
         self.assertEqual([(0, 5)], StringChunker._prune_overlaps([(0, 5)]))
         self.assertEqual([], StringChunker._prune_overlaps([]))
         self.assertEqual([(0, 5)], StringChunker._prune_overlaps([(0, 5), (3, 6)]))
         self.assertEqual([(0, 5), (5, 7)], StringChunker._prune_overlaps([(0, 5), (5, 7), (6, 8)]))
+
+
+@attr('UNIT', group='mi')
+class UnitTestIncrementalChunker(UnitTestStringChunker):
+    """
+    Run the StringChunker tests against the incremental chunker, plus resume behavior
+    """
+    def setUp(self):
+        self._chunker = IncrementalChunker(UnitTestStringChunker.sieve_function)
+
+    def test_rebase_timestamps(self):
+        self._chunker.add_chunk(self.SAMPLE_1, self.TIMESTAMP_1)
+        self._chunker.add_chunk("BLEH", self.TIMESTAMP_2)
+        self._chunker.get_next_data()
+
+        self.assertEqual(self._chunker.buffer, "BLEH")
+        self.assertEqual(self._chunker._times, [self.TIMESTAMP_2])
+        self.assertEqual(self._chunker._find_timestamp(0), self.TIMESTAMP_2)
+
+    def test_resume_overlap(self):
+        """
+        With an overlap declared only new data plus the overlap is sieved
+        """
+        scanned = []
+
+        def sieve(raw_data):
+            scanned.append(len(raw_data))
+            return UnitTestStringChunker.sieve_function(raw_data)
+        sieve.overlap = len(self.SAMPLE_1)
+
+        self._chunker = IncrementalChunker(sieve, max_buff_size=1024)
+        for _ in xrange(20):
+            self._chunker.add_chunk("NOISE" * 10, self.TIMESTAMP_1)
+        self._chunker.add_chunk(self.FRAGMENT_1, self.TIMESTAMP_2)
+        self._chunker.add_chunk(self.FRAGMENT_2, self.TIMESTAMP_3)
+
+        self.assertTrue(max(scanned) <= 50 + len(self.SAMPLE_1))
+        (time, result) = self._chunker.get_next_data()
+        self.assertEquals(result, self.FRAGMENT_SAMPLE)
+        self.assertEquals(time, self.TIMESTAMP_2)
+
+    def test_truncate(self):
+        """
+        Data beyond max_buff_size is dropped from the front of the buffer
+        """
+        self._chunker = IncrementalChunker(UnitTestStringChunker.sieve_function, max_buff_size=40)
+        self._chunker.add_chunk("X" * 30, self.TIMESTAMP_1)
+        self._chunker.add_chunk(self.SAMPLE_1, self.TIMESTAMP_2)
+        (time, result) = self._chunker.get_next_data()
+        self.assertEquals(result, self.SAMPLE_1)
+        self.assertEquals(time, self.TIMESTAMP_2)
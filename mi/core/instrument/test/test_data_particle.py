@@ -15,6 +15,7 @@ import json
 import base64
 import time
 import ntplib
+import numpy as np
 
 from nose.plugins.attrib import attr
 from mi.core.unit_test import MiUnitTestCase
@@ -22,7 +23,7 @@ from mi.core.unit_test import MiUnitTestCase
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.exceptions import SampleException, ReadOnlyException, NotImplementedException, InstrumentParameterException
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, DataParticleValue
-from mi.core.instrument.data_particle import RawDataParticle, CommonDataParticleType
+from mi.core.instrument.data_particle import RawDataParticle, CommonDataParticleType, ParticleBatch
 from mi.core.instrument.port_agent_client import PortAgentPacket
 
 TEST_PARTICLE_VERSION = 1
@@ -232,3 +233,43 @@ class TestUnitDataParticle(MiUnitTestCase):
 
         with self.assertRaises(NotImplementedException):
             particle.data_particle_type()
+
+    def test_build_columns(self):
+        """
+        Test that a batch of records generates one column per particle key and value id
+        """
+        records = [(self.sample_raw_data, self.sample_port_timestamp),
+                   (self.sample_raw_data, None)]
+        columns = self.TestDataParticle.build_columns(records)
+
+        expected = self.parsed_test_particle.generate_dict()
+        values = expected.pop(DataParticleKey.VALUES)
+        expected.update({each[DataParticleKey.VALUE_ID]: each[DataParticleKey.VALUE] for each in values})
+        self.assertEqual(set(columns), set(expected) | {DataParticleKey.INTERNAL_TIMESTAMP})
+
+        for key in columns:
+            self.assertEqual(len(columns[key]), 2)
+        self.assertEqual(list(columns['temp']), ['23.45', '23.45'])
+        self.assertEqual(columns[DataParticleKey.STREAM_NAME][0], TEST_PARTICLE_TYPE)
+        self.assertEqual(columns[DataParticleKey.PORT_TIMESTAMP][0], self.sample_port_timestamp)
+        self.assertTrue(np.isnan(columns[DataParticleKey.PORT_TIMESTAMP][1]))
+
+        # records which fail to generate are skipped
+        self.assertEqual(self.BadDataParticle.build_columns(records), {})
+
+    def test_particle_batch(self):
+        """
+        Test that a particle batch generates columns per particle class and resets on flush
+        """
+        batch = ParticleBatch()
+        self.assertFalse(batch)
+        batch.add(self.TestDataParticle, self.sample_raw_data, self.sample_port_timestamp)
+        batch.add(self.BadDataParticle, self.sample_raw_data, self.sample_port_timestamp)
+        batch.add(self.TestDataParticle, self.sample_raw_data, self.sample_port_timestamp)
+        self.assertEqual(len(batch), 3)
+
+        columns = batch.flush()
+        self.assertEqual(len(columns), 1)
+        self.assertEqual(len(columns[0][DataParticleKey.STREAM_NAME]), 2)
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(batch.flush(), [])
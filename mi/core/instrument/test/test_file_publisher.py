@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_file_publisher
+@file mi/core/instrument/test/test_file_publisher.py
+@brief Test cases for the file publishers
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTestCase
+from mi.core.instrument.publisher import Publisher
+from mi.core.instrument.file_publisher import FilePublisher
+
+
+def sample_event(index):
+    return {'type': 'DRIVER_ASYNC_EVENT_SAMPLE',
+            'time': 0,
+            'value': {'stream_name': 'test_stream',
+                      'port_timestamp': 3600000000.0 + index,
+                      'preferred_timestamp': 'port_timestamp',
+                      'values': [{'value_id': 'temp', 'value': index},
+                                 {'value_id': 'velocity', 'value': [index] * 4}]}}
+
+
+@attr('UNIT', group='mi')
+class TestUnitFilePublisher(MiUnitTestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def test_stack_rows(self):
+        """
+        Test stacking of regular, ragged and mixed type array columns
+        """
+        data = FilePublisher.stack_rows([[1, 2], [3, 4]])
+        self.assertEqual(data.dtype.kind, 'i')
+        self.assertEqual(data.tolist(), [[1, 2], [3, 4]])
+
+        data = FilePublisher.stack_rows([[1, 2], [3, 4.5]])
+        self.assertEqual(data.tolist(), [[1, 2], [3, 4.5]])
+
+        data = FilePublisher.stack_rows([[1, 2, 3], None, [4]])
+        self.assertIsInstance(data, np.ma.MaskedArray)
+        self.assertEqual(data.tolist(), [[1, 2, 3], [None, None, None], [4, None, None]])
+
+        self.assertIsNone(FilePublisher.stack_rows([[[1], [2]], [[3], [4]]]))
+
+    def test_fix_arrays_ragged(self):
+        """
+        Test ragged array columns are padded with NaN instead of stored as objects
+        """
+        dataset = FilePublisher.fix_arrays(pd.DataFrame([{'a': [1, 2, 3]}, {'a': [4]}]), return_as_xr=True)
+        self.assertEqual(dataset.a.shape, (2, 3))
+        self.assertTrue(np.isnan(dataset.a.values[1, 1:]).all())
+
+    def test_streaming(self):
+        """
+        Test a flush threshold writes numbered part files as rows arrive
+        """
+        publisher = Publisher.from_url('csv://?flush_rows=4')
+        for index in range(10):
+            publisher.enqueue(sample_event(index))
+            publisher.publish()
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['test_stream_0.csv', 'test_stream_1.csv'])
+        self.assertEqual(sum(len(x) for x in publisher.samples.itervalues()), 2)
+
+        publisher.write()
+        self.assertIn('test_stream_2.csv', os.listdir(self.tmpdir))
+        frames = [pd.read_csv('test_stream_%d.csv' % part) for part in range(3)]
+        self.assertEqual(sorted(pd.concat(frames).temp.unique()), range(10))
+
+    def test_streaming_size(self):
+        """
+        Test the size threshold with values JSON can't encode
+        """
+        publisher = Publisher.from_url('csv://?flush_mb=0.0001')
+        for index in range(10):
+            event = sample_event(index)
+            event['value']['values'].extend([{'value_id': 'count', 'value': np.int64(index)},
+                                             {'value_id': 'raw', 'value': '\xff\x00'}])
+            publisher.enqueue(event)
+            publisher.publish()
+        self.assertGreater(publisher._row_bytes['test_stream'], 0)
+        self.assertIn('test_stream_0.csv', os.listdir(self.tmpdir))
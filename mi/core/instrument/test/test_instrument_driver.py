@@ -16,6 +16,7 @@ from mi.core.exceptions import NotImplementedException
 from mi.core.instrument.instrument_driver import SingleConnectionInstrumentDriver
 from mi.core.instrument.instrument_driver import ConfigMetadataKey
 from mi.core.instrument.instrument_protocol import InstrumentProtocol
+from mi.core.instrument.port_agent_client import PortAgentPacket
 from mi.core.instrument.driver_dict import DriverDictKey
 
 __author__ = 'Bill French'
@@ -87,6 +88,20 @@ class TestUnitInstrumentDriver(MiUnitTestCase):
         if self.driver._protocol._scheduler:
             self.driver._protocol._scheduler._scheduler.shutdown()
 
+    def test_got_data_batch(self):
+        """
+        Test a coalesced batch reaches a protocol without its own batching one packet at a time,
+        exceptions in the batch go to _got_exception in order
+        """
+        self.driver._protocol.got_data = Mock()
+        self.driver._got_exception = Mock()
+        packets = [PortAgentPacket(PortAgentPacket.DATA_FROM_INSTRUMENT) for _ in range(3)]
+        error = IOError('port agent gone')
+        self.driver._got_data_batch(packets[:2] + [error] + packets[2:])
+
+        self.assertEqual([c[0][0] for c in self.driver._protocol.got_data.call_args_list], packets)
+        self.driver._got_exception.assert_called_once_with(error)
+
     def test_test_mode(self):
         """
         Test driver test mode.
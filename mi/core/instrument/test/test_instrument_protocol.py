@@ -24,6 +24,8 @@ from mi.core.instrument.instrument_protocol import InstrumentProtocol
 from mi.core.instrument.instrument_protocol import MenuInstrumentProtocol
 from mi.core.instrument.instrument_protocol import CommandResponseInstrumentProtocol
 from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
+from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.data_particle import ParticleBatch
 from mi.core.instrument.instrument_driver import ConfigMetadataKey
 from mi.instrument.satlantic.par_ser_600m.driver import SAMPLE_REGEX
 from mi.instrument.satlantic.par_ser_600m.driver import SatlanticPARDataParticle
@@ -613,6 +615,68 @@ class TestUnitCommandInstrumentProtocol(MiUnitTestCase):
                           self.protocol._do_cmd_resp,
                           self.TestEvent.TEST, expected_prompt=">", response_regex=regex1)
 
+    def test_particle_dispatch(self):
+        """
+        Chunks from a sieve built on _particle_handlers go straight to the registered particle class
+        """
+        self.protocol._particle_handlers = {'foo': (re.compile(r'foobar'), Mock(), None),
+                                            'par': (SAMPLE_REGEX, SatlanticPARDataParticle, '_post_hook')}
+        self.protocol._chunker = StringChunker(StringChunker.compile_regex_sieve(
+            {pattern_id: regex for pattern_id, (regex, _, _) in self.protocol._particle_handlers.iteritems()}))
+        self.protocol._got_chunk = Mock()
+        self.protocol._post_hook = Mock()
+        self.protocol.add_to_buffer = Mock()
+
+        packet = Mock()
+        packet.get_data.return_value = "SATPAR0229,10.01,2206748544,234\r\n"
+        packet.get_data_length.return_value = len(packet.get_data.return_value)
+        packet.get_timestamp.return_value = 3569168821.102485
+        self.protocol.got_data(packet)
+
+        self.assertFalse(self.protocol._got_chunk.called)
+        self.assertFalse(self.protocol._particle_handlers['foo'][1].called)
+        self.assertEqual(self._events, ['DRIVER_ASYNC_EVENT_SAMPLE'])
+        sample = self.protocol._post_hook.call_args[0][0]
+        self.assertEqual(sample['stream_name'], SatlanticPARDataParticle.type())
+        self.assertEqual(sample['port_timestamp'], 3569168821.102485)
+
+        # while batching, particles are deferred to the batch and post hooks are skipped
+        self._events = []
+        self.protocol._post_hook.reset_mock()
+        self.protocol._particle_batch = ParticleBatch()
+        self.protocol.got_data(packet)
+
+        self.assertEqual(self._events, [])
+        self.assertFalse(self.protocol._post_hook.called)
+        columns = self.protocol._particle_batch.flush()
+        self.assertEqual(list(columns[0]['stream_name']), [SatlanticPARDataParticle.type()])
+
+        # a chunk without a registered handler is an error, not silently dropped
+        self.assertRaises(InstrumentProtocolException, self.protocol._got_particle_chunk, 'baz', 0, 'baz')
+
+    def test_got_data_batch(self):
+        """
+        A batch of packets is buffered and sieved together, samples split across packets are found
+        """
+        self.protocol._chunker = StringChunker(StringChunker.compile_regex_sieve([SAMPLE_REGEX]))
+        self.protocol._chunker.add_chunks = Mock(wraps=self.protocol._chunker.add_chunks)
+        self.protocol._got_chunk = Mock()
+
+        sample = "SATPAR0229,10.01,2206748544,234\r\n"
+        packets = []
+        for index, data in enumerate([sample[:10], sample[10:], '', sample]):
+            packet = Mock()
+            packet.get_data.return_value = data
+            packet.get_data_length.return_value = len(data)
+            packet.get_timestamp.return_value = 3569168821.0 + index
+            packets.append(packet)
+        self.protocol.got_data_batch(packets)
+
+        self.assertEqual(self.protocol._chunker.add_chunks.call_count, 1)
+        self.assertEqual([c[0] for c in self.protocol._got_chunk.call_args_list],
+                         [(sample, 3569168821.0), (sample, 3569168824.0)])
+        self.assertTrue(self.protocol._linebuf.endswith(sample + sample))
+
 
 @attr('UNIT', group='mi')
 class TestUnitMenuInstrumentProtocol(MiUnitTestCase):
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_netcdf_publisher
+@file mi/core/instrument/test/test_netcdf_publisher.py
+@brief Test cases for the NetCDF file publisher
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import xarray as xr
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTestCase
+from mi.core.instrument.publisher import Publisher
+from mi.core.instrument.test.test_file_publisher import sample_event
+
+
+@attr('UNIT', group='mi')
+class TestUnitNetcdfPublisher(MiUnitTestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def publish(self, events, url='netcdf://?flush_rows=4&chunk_rows=2'):
+        publisher = Publisher.from_url(url)
+        for event in events:
+            publisher.enqueue(event)
+            publisher.publish()
+        publisher.write()
+        dataset = xr.open_dataset('test_stream.nc')
+        self.addCleanup(dataset.close)
+        return dataset
+
+    @staticmethod
+    def set_value(event, value_id, value):
+        values = event['value']['values']
+        for each in values:
+            if each['value_id'] == value_id:
+                each['value'] = value
+                return event
+        values.append({'value_id': value_id, 'value': value})
+        return event
+
+    def test_netcdf(self):
+        """
+        Test streaming flushes append to a single NetCDF file per stream
+        """
+        events = [sample_event(index) for index in range(10)]
+        # wider than the schema taken from the first rows
+        self.set_value(events[9], 'velocity', [9] * 6)
+        dataset = self.publish(events)
+
+        self.assertEqual(os.listdir(self.tmpdir), ['test_stream.nc'])
+        self.assertEqual(list(dataset.temp.values), range(10))
+        self.assertEqual(dataset.velocity.shape, (10, 4))
+        self.assertEqual(dataset.preferred_timestamp.values[0], 'port_timestamp')
+        self.assertEqual(dataset.attrs['stream_name'], 'test_stream')
+
+    def test_append_runs(self):
+        """
+        Test a new publisher appends to the file left by an earlier one
+        """
+        events = [sample_event(index) for index in range(10)]
+        self.publish(events[:6]).close()
+        self.set_value(events[8], 'salinity', 1.5)
+        dataset = self.publish(events[6:])
+
+        self.assertEqual(list(dataset.temp.values), range(10))
+        self.assertEqual(dataset.velocity.shape, (10, 4))
+        self.assertEqual(np.isnan(dataset.salinity.values).tolist(), [True] * 8 + [False, True])
+
+    def test_dtype_change(self):
+        """
+        Test values which don't fit the schema dtype are left missing instead of truncated
+        """
+        events = [sample_event(index) for index in range(8)]
+        for event in events[4:]:
+            self.set_value(event, 'temp', event['value']['values'][0]['value'] + .5)
+        # integers fit a float schema
+        for index, event in enumerate(events):
+            self.set_value(event, 'pressure', float(index) if index < 4 else index)
+        dataset = self.publish(events)
+
+        self.assertEqual(dataset.temp.values[:4].tolist(), range(4))
+        self.assertTrue(np.isnan(dataset.temp.values[4:]).all())
+        self.assertEqual(dataset.pressure.values.tolist(), range(8))
+
+    def test_missing_values(self):
+        """
+        Test a variable with only missing values takes its dtype from the first real value
+        """
+        events = [sample_event(index) for index in range(8)]
+        for index, event in enumerate(events):
+            self.set_value(event, 'salinity', None if index < 4 or index == 6 else index * 1.5)
+        dataset = self.publish(events)
+
+        self.assertEqual(dataset.salinity.dtype.kind, 'f')
+        values = dataset.salinity.values
+        self.assertTrue(np.isnan(values[:4]).all())
+        self.assertTrue(np.isnan(values[6]))
+        self.assertEqual(values[[4, 5, 7]].tolist(), [6.0, 7.5, 10.5])
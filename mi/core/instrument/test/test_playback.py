@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_playback
+@file mi/core/instrument/test/test_playback.py
+@brief Test cases for port agent log playback
+"""
+
+__license__ = 'Apache 2.0'
+
+import cPickle as pickle
+import os
+import shutil
+import tempfile
+
+from gevent import monkey
+from mock import patch
+from nose.plugins.attrib import attr
+
+from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.instrument.playback import DatalogReader, BlockDatalogReader, PlaybackWrapper, PlaybackWorker
+from mi.core.instrument.port_agent_client import HEADER, HEADER_SIZE, PortAgentPacket
+from mi.core.instrument.publisher import Publisher
+from mi.core.unit_test import MiUnitTestCase
+
+
+def packet(data, timestamp=3600000000, packet_type=PortAgentPacket.DATA_FROM_INSTRUMENT, length=None):
+    if length is None:
+        length = len(data) + HEADER_SIZE
+    return HEADER.pack(0xa3, 0x9d, 0x7a, packet_type, length, 0, timestamp, 0) + data
+
+
+class FakeProtocol(object):
+    """
+    Publishes a raw and a data particle for each packet, and a state change for each file
+    """
+    def __init__(self, callback):
+        self.callback = callback
+
+    def got_filename(self, filename):
+        self.callback(DriverAsyncEvent.STATE_CHANGE, os.path.basename(filename))
+
+    def got_data(self, pa_packet):
+        for stream in ('raw', 'data'):
+            self.callback(DriverAsyncEvent.SAMPLE, {'stream_name': stream, 'value': pa_packet.get_data()})
+
+
+def create_playback_protocol(callback):
+    return FakeProtocol(callback)
+
+
+class RecordingPublisher(Publisher):
+    ENCODE_EVENTS = False
+
+    def __init__(self):
+        super(RecordingPublisher, self).__init__(None)
+        self.published = []
+
+    def _publish(self, events, headers):
+        for event in events:
+            self.published.append((self._merge_headers(headers)[self.SOURCE], event['type'], event['value']))
+
+
+@attr('UNIT', group='mi')
+class TestBlockDatalogReader(MiUnitTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def write(self, data, name='test.datalog'):
+        path = os.path.join(self.path, name)
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        return path
+
+    def read(self, reader_klass, path, **kwargs):
+        packets = []
+        reader = reader_klass([path], lambda p: packets.append((p.get_timestamp(), p.get_data())), **kwargs)
+        for _ in reader.read():
+            pass
+        return packets
+
+    def test_block_boundary(self):
+        """
+        Test packets spanning block boundaries, and larger than a block, match the byte reader
+        """
+        payloads = ['x' * size for size in (1, 10, 47, 48, 49, 100, 300, 5)]
+        data = ''.join(packet(payload, 3600000000 + index) for index, payload in enumerate(payloads))
+        path = self.write(data)
+        expected = [(3600000000 + index, payload) for index, payload in enumerate(payloads)]
+        self.assertEqual(self.read(DatalogReader, path), expected)
+        for block_size in (16, 64, 128, 1024 * 1024):
+            packets = self.read(BlockDatalogReader, path, block_size=block_size)
+            self.assertEqual(packets, expected)
+            self.assertTrue(all(type(data) is str for _, data in packets))
+
+    def test_resync(self):
+        """
+        Test a corrupt header, or noise between packets, is skipped and reading resumes at the next packet
+        """
+        data = (packet('first') + packet('bad', length=4) + 'noise\xa3\x9d' + packet('second') +
+                packet('long', length=200) + packet('third') +
+                packet('{}', packet_type=PortAgentPacket.PORT_AGENT_CONFIG))
+        path = self.write(data)
+        for block_size in (16, 64, 1024):
+            packets = self.read(BlockDatalogReader, path, block_size=block_size)
+            self.assertEqual([data for _, data in packets], ['first', 'second', 'third', '{}'])
+
+    def test_truncated(self):
+        """
+        Test a packet cut short at the end of the file is discarded
+        """
+        path = self.write(packet('first') + packet('second')[:-3])
+        packets = self.read(BlockDatalogReader, path, block_size=16)
+        self.assertEqual([data for _, data in packets], ['first'])
+
+
+@attr('UNIT', group='mi')
+class TestParallelPlayback(MiUnitTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.files = []
+        for index in range(4):
+            path = os.path.join(self.path, 'file%d.datalog' % index)
+            with open(path, 'wb') as fh:
+                fh.write(''.join(packet('%d-%d' % (index, n)) for n in range(5)))
+            self.files.append(path)
+
+    def playback(self, workers):
+        wrapper = PlaybackWrapper(__name__, 'REFDES', 'log://', 'log://', DatalogReader, None,
+                                  [os.path.join(self.path, '*.datalog')], workers)
+        wrapper.event_publisher = RecordingPublisher()
+        wrapper.particle_publisher = RecordingPublisher()
+        wrapper.playback()
+        return wrapper.event_publisher.published, wrapper.particle_publisher.published
+
+    def test_parallel(self):
+        """
+        Test parallel playback publishes the same events in the same order as serial playback
+        """
+        if monkey.is_module_patched('threading'):
+            # the pool result handler threads don't run under gevent patching done by other tests
+            self.skipTest('gevent monkey patching active')
+        events, particles = self.playback(1)
+        self.assertEqual(len(events), 4)
+        self.assertEqual(len(particles), 20)
+        self.assertEqual(particles[5], (self.files[1], DriverAsyncEvent.SAMPLE,
+                                        {'stream_name': 'data', 'value': '1-0'}))
+
+        with patch.object(PlaybackWorker, 'CHUNK_SIZE', 2):
+            self.assertEqual(self.playback(3), (events, particles))
+        self.assertEqual([name for name in os.listdir(tempfile.gettempdir()) if name.endswith('.spool')], [])
+
+    def test_worker_chunks(self):
+        """
+        Test a worker spools its events in bounded chunks, without raw particles
+        """
+        with patch.object(PlaybackWorker, 'CHUNK_SIZE', 2):
+            filename, path = PlaybackWorker(__name__, DatalogReader, self.files[0]).playback()
+        self.addCleanup(os.remove, path)
+        self.assertEqual(filename, self.files[0])
+        chunks = []
+        with open(path, 'rb') as fh:
+            while True:
+                try:
+                    chunks.append(pickle.load(fh))
+                except EOFError:
+                    break
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 2])
+        self.assertEqual([event['value'] for chunk in chunks for event in chunk],
+                         ['file0.datalog'] + [{'stream_name': 'data', 'value': '0-%d' % n} for n in range(5)])
+
+    def test_columnar_rejected(self):
+        """
+        Test columnar playback is rejected with workers, or for a protocol without particle handlers
+        """
+        with self.assertRaises(SystemExit):
+            PlaybackWrapper(__name__, 'REFDES', 'log://', 'csv://', DatalogReader, None, self.files, 2, True)
+        with self.assertRaises(SystemExit):
+            PlaybackWrapper(__name__, 'REFDES', 'log://', 'csv://', DatalogReader, None, self.files, 1, True)
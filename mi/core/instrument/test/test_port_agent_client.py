@@ -16,8 +16,10 @@ import unittest
 import time
 import datetime
 import array
+import socket
 import struct
 import ctypes
+from mock import patch
 from nose.plugins.attrib import attr
 
 from mi.core.port_agent_process import PortAgentProcess
@@ -33,7 +35,7 @@ from mi.core.instrument.instrument_driver import DriverConnectionState
 from mi.idk.exceptions import IDKException
 from mi.core.instrument.port_agent_client import PortAgentClient, PortAgentPacket, Listener
 from mi.core.instrument.port_agent_client import HEADER_SIZE
-from mi.core.instrument.port_agent_client import py_lrc
+from mi.core import checksum
 from mi.core.exceptions import InstrumentConnectionException
 from mi.instrument.seabird.sbe16plus_v2.ctdpf_jb.driver import InstrumentDriver
 from mi.core.log import get_logger
@@ -308,7 +310,8 @@ class PAClientUnitTestCase(InstrumentDriverUnitTestCase):
     def test_lrc(self):
         test_data = 'this is a test'
 
-        assert lrc(test_data) == py_lrc(test_data)
+        assert lrc(test_data) == checksum.lrc(test_data)
+        assert lrc(test_data * 100) == checksum.lrc(test_data * 100)
 
 
 @attr('UNIT', group='mi')
@@ -388,6 +391,58 @@ class PAClientTestPortAgentPacket(MiUnitTest):
         self.assertEqual(got_timestamp, 1105890970.092212)
         self.assertEqual(self.pap.get_header_recv_checksum(), 3729)
 
+    def test_listener_receive(self):
+        """
+        Test the listener splits a stream into packets, across reads and buffer blocks
+        """
+        sender, receiver = socket.socketpair()
+        receiver.setblocking(0)
+        with patch.object(Listener, 'BLOCK_SIZE', 64):
+            listener = Listener(receiver, None, None, 0, 0)
+        payloads = ['a' * 10, 'b' * 40, 'c' * 200, 'd']
+
+        stream = ''
+        for payload in payloads:
+            packet = PortAgentPacket(PortAgentPacket.DATA_FROM_INSTRUMENT)
+            packet.attach_data(payload)
+            packet.pack_header()
+            stream += packet.get_header() + payload
+
+        sender.sendall(stream)
+        received = [listener._next_packet() for _ in payloads]
+
+        self.assertEqual([p.get_data_view().tobytes() for p in received], payloads)
+        self.assertEqual([p.get_data() for p in received], payloads)
+        self.assertEqual([p.get_header_type() for p in received], [PortAgentPacket.DATA_FROM_INSTRUMENT] * 4)
+        sender.close()
+        receiver.close()
+
+    def test_listener_resync(self):
+        """
+        Test the listener skips a corrupt header or noise mid-stream and resumes at the next sync bytes
+        """
+        sender, receiver = socket.socketpair()
+        receiver.setblocking(0)
+        self.addCleanup(sender.close)
+        self.addCleanup(receiver.close)
+        with patch.object(Listener, 'BLOCK_SIZE', 64):
+            listener = Listener(receiver, None, None, 0, 0)
+
+        def packet(payload):
+            pa_packet = PortAgentPacket(PortAgentPacket.DATA_FROM_INSTRUMENT)
+            pa_packet.attach_data(payload)
+            pa_packet.pack_header()
+            return pa_packet.get_header() + payload
+
+        # header with a length shorter than the header itself
+        corrupt = packet('lost')
+        corrupt = corrupt[:4] + struct.pack('>H', 4) + corrupt[6:]
+        stream = packet('first') + corrupt + 'noise\xa3\x9d' + packet('second') + 'x' * 50 + packet('third')
+        sender.sendall(stream)
+
+        received = [listener._next_packet() for _ in range(3)]
+        self.assertEqual([p.get_data() for p in received], ['first', 'second', 'third'])
+
 
 @attr('INT', group='mi')
 class PAClientIntTestCase(InstrumentDriverTestCase):
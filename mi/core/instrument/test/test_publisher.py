@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_publisher
+@file mi/core/instrument/test/test_publisher.py
+@brief Test cases for the base publisher
+"""
+
+__license__ = 'Apache 2.0'
+
+import json
+import shutil
+import tempfile
+import time
+import zlib
+
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTestCase
+from mi.core.instrument.publisher import CountPublisher, Publisher
+
+
+class ListPublisher(Publisher):
+    """
+    Records each published batch, failing the next batch when fail is set
+    """
+    def __init__(self, *args, **kwargs):
+        super(ListPublisher, self).__init__(*args, **kwargs)
+        self.batches = []
+        self.headers = []
+        self.payloads = []
+        self.fail = False
+
+    def _publish(self, events, headers):
+        if self.fail:
+            self.fail = False
+            return events
+        self.payloads.append(self._payload(events))
+        self.batches.append(events)
+        self.headers.append(headers)
+
+
+def make_event(index):
+    return {'type': 'DRIVER_ASYNC_EVENT_SAMPLE', 'value': index, 'time': time.time()}
+
+
+@attr('UNIT', group='mi')
+class TestUnitPublisher(MiUnitTestCase):
+    def test_publish_batches(self):
+        """
+        Test a deep queue is drained in several batches per publish
+        """
+        publisher = ListPublisher(None, max_events=10)
+        for index in range(25):
+            publisher.enqueue(make_event(index))
+
+        self.assertEqual(publisher.publish(), 25)
+        self.assertEqual([len(batch) for batch in publisher.batches], [10, 10, 5])
+        self.assertEqual([event['value'] for batch in publisher.batches for event in batch], range(25))
+
+        metrics = publisher.get_metrics()
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertEqual(metrics['published'], 25)
+        self.assertEqual(metrics['batches'], 3)
+        self.assertGreaterEqual(metrics['max_latency'], 0)
+
+    def test_publish_failure(self):
+        """
+        Test a failed batch is requeued and ends the cycle
+        """
+        publisher = ListPublisher(None, max_events=10)
+        for index in range(25):
+            publisher.enqueue(make_event(index))
+
+        publisher.fail = True
+        self.assertEqual(publisher.publish(), 0)
+        self.assertEqual(publisher.get_metrics()['queue_depth'], 25)
+        self.assertEqual(publisher.get_metrics()['failed'], 10)
+
+        self.assertEqual(publisher.publish(), 25)
+        self.assertEqual(publisher.batches[0][0]['value'], 0)
+
+    def test_size_trigger(self):
+        """
+        Test the publishing thread wakes up once max_events are queued
+        """
+        publisher = ListPublisher(None, max_events=10, publish_interval=60)
+        publisher.start()
+        try:
+            for index in range(10):
+                publisher.enqueue(make_event(index))
+
+            end = time.time() + 5
+            while not publisher.batches and time.time() < end:
+                time.sleep(.01)
+            self.assertEqual(len(publisher.batches), 1)
+        finally:
+            publisher.stop()
+
+    def test_encode_once(self):
+        """
+        Test batches carry the encoding captured at enqueue and keep their instance on requeue
+        """
+        publisher = ListPublisher(None)
+        events = [make_event(index) for index in range(3)]
+        events[2]['instance'] = 'REFDES'
+        for event in events:
+            publisher.enqueue(event)
+        bad_event = {'value': object(), 'instance': 'REFDES'}
+        publisher.enqueue(bad_event)
+        self.assertEqual(publisher.get_metrics()['queue_depth'], 3)
+        self.assertEqual(bad_event['instance'], 'REFDES')
+
+        publisher.fail = True
+        publisher.publish()
+        publisher.publish()
+        self.assertEqual(len(publisher.batches), 2)
+        batch = [b for b in publisher.batches if len(b) == 2][0]
+        self.assertEqual(batch.payload(), json.dumps(events[:2]))
+        self.assertIn({'sensor': 'REFDES'}, publisher.headers)
+        batch = [b for b in publisher.batches if len(b) == 1][0]
+        self.assertNotIn('instance', json.loads(batch.payload())[0])
+        self.assertEqual(events[2]['instance'], 'REFDES')
+
+    def test_count(self):
+        """
+        Test the count scheme publishes the batches encoded at enqueue
+        """
+        publisher = Publisher.from_url('count://')
+        self.assertIsInstance(publisher, CountPublisher)
+        for index in range(3):
+            publisher.enqueue(make_event(index))
+        self.assertEqual(publisher.publish(), 3)
+        self.assertEqual(publisher.total, 3)
+
+    def test_compress(self):
+        """
+        Test batches are compressed after encoding and the compressor is reported as the content encoding
+        """
+        publisher = ListPublisher(None, compress='zlib')
+        events = [make_event(index) for index in range(50)]
+        for event in events:
+            publisher.enqueue(event)
+        publisher.publish()
+
+        payload, encoding = publisher.payloads[0]
+        self.assertEqual(encoding, 'zlib')
+        self.assertEqual(zlib.decompress(payload), json.dumps(events))
+        metrics = publisher.get_metrics()
+        self.assertEqual(metrics['sent_bytes'], len(payload))
+        self.assertLess(metrics['sent_bytes'], metrics['payload_bytes'])
+
+        self.assertRaises(ValueError, Publisher.from_url, 'log://?compress=gzip')
+
+    def test_spill(self):
+        """
+        Test a backlog over the threshold spills to disk and replays in order, also after a restart
+        """
+        path = tempfile.mkdtemp()
+        try:
+            publisher = ListPublisher(None, max_events=10, spill_dir=path, spill_threshold=15)
+            for index in range(40):
+                publisher.enqueue(make_event(index))
+            metrics = publisher.get_metrics()
+            self.assertEqual(metrics['spilled'], 25)
+            self.assertEqual(metrics['queue_depth'], 40)
+
+            publisher.fail = True
+            publisher.publish()
+
+            # a restarted publisher replays the spilled events
+            restarted = ListPublisher(None, max_events=10, spill_dir=path, spill_threshold=15)
+            self.assertEqual(restarted.get_metrics()['spilled'], 25)
+
+            self.assertEqual(publisher.publish(), 40)
+            self.assertEqual([event['value'] for batch in publisher.batches for event in batch], range(40))
+            restarted = ListPublisher(None, max_events=10, spill_dir=path, spill_threshold=15)
+            self.assertEqual(restarted.get_metrics()['spilled'], 0)
+        finally:
+            shutil.rmtree(path)
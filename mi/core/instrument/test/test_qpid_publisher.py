@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_qpid_publisher
+@file mi/core/instrument/test/test_qpid_publisher.py
+@brief Test cases for the QPID publisher settlement window
+"""
+
+__license__ = 'Apache 2.0'
+
+import json
+import shutil
+import tempfile
+
+import qpid.messaging as qm
+from mock import patch
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTestCase
+from mi.core.instrument.qpid_publisher import QpidPublisher
+from mi.core.instrument.spill_queue import SpillQueue
+from mi.core.instrument.test.test_publisher import make_event
+
+
+class FakeSender(object):
+    """
+    Records sent messages, the broker acknowledges them when settle is called
+    """
+    def __init__(self):
+        self.capacity = None
+        self.sent = []
+        self.acked = 0
+        self.fail = False
+
+    def send(self, message, sync=True, timeout=None):
+        if self.fail:
+            raise qm.ConnectionError('broker gone')
+        self.sent.append(message)
+        if sync:
+            self.acked = len(self.sent)
+
+    def unsettled(self):
+        if self.fail:
+            raise qm.ConnectionError('broker gone')
+        return len(self.sent) - self.acked
+
+
+@attr('UNIT', group='mi')
+class TestUnitQpidPublisher(MiUnitTestCase):
+    def setUp(self):
+        self.senders = []
+        patcher = patch.object(qm, 'Connection')
+        connection = patcher.start()
+        self.addCleanup(patcher.stop)
+        connection.return_value.session.return_value.sender.side_effect = self._new_sender
+
+    def _new_sender(self, address):
+        sender = FakeSender()
+        self.senders.append(sender)
+        return sender
+
+    def test_window(self):
+        """
+        Test batches are sent without waiting and only unsettled batches are requeued on failure
+        """
+        publisher = QpidPublisher('qpid://host', 'queue', {}, None, window=4, max_events=10)
+        self.assertEqual(self.senders[0].capacity, 4)
+        for index in range(30):
+            publisher.enqueue(make_event(index))
+        self.assertEqual(publisher.publish(), 30)
+        self.assertEqual(len(self.senders[0].sent), 3)
+        self.assertEqual(publisher.get_metrics()['in_flight'], 30)
+
+        # the first batch is acknowledged, then the connection drops
+        self.senders[0].acked = 1
+        publisher.publish()
+        self.assertEqual(publisher.get_metrics()['in_flight'], 20)
+        self.senders[0].fail = True
+        self.assertEqual(publisher.publish(), 0)
+        metrics = publisher.get_metrics()
+        self.assertEqual(metrics['queue_depth'], 20)
+        self.assertEqual(metrics['requeued'], 20)
+        self.assertEqual(metrics['published'], 30)
+        self.assertEqual(metrics['failed'], 0)
+
+        publisher.publish()
+        self.assertEqual(len(self.senders), 2)
+        values = [event['value'] for message in self.senders[1].sent for event in json.loads(message.content)]
+        self.assertEqual(values, range(10, 30))
+
+    def test_send_failure(self):
+        """
+        Test a failed send requeues the batch after the unsettled ones, without qpid.messaging reconnecting
+        """
+        publisher = QpidPublisher('qpid://host', 'queue', {}, None, window=4, max_events=10)
+        self.assertFalse(qm.Connection.call_args[1]['reconnect'])
+        for index in range(20):
+            publisher.enqueue(make_event(index))
+        self.assertEqual(publisher.publish(), 20)
+
+        for index in range(20, 30):
+            publisher.enqueue(make_event(index))
+        self.senders[0].fail = True
+        self.assertEqual(publisher.publish(), 0)
+        metrics = publisher.get_metrics()
+        self.assertEqual((metrics['published'], metrics['failed'], metrics['requeued']), (20, 10, 20))
+
+        self.assertEqual(publisher.publish(), 30)
+        values = [event['value'] for message in self.senders[1].sent for event in json.loads(message.content)]
+        self.assertEqual(values, range(30))
+
+    def test_spill_settled(self):
+        """
+        Test the spill checkpoint only moves past events once the broker has settled them
+        """
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        def spilled():
+            queue = SpillQueue(path)
+            queue.close()
+            return len(queue)
+
+        publisher = QpidPublisher('qpid://host', 'queue', {}, None, window=4, max_events=10,
+                                  spill_dir=path, spill_threshold=5)
+        for index in range(30):
+            publisher.enqueue(make_event(index))
+        self.assertEqual(publisher.publish(), 30)
+        self.assertEqual(len(self.senders[0].sent), 4)
+        self.assertEqual(spilled(), 25)
+
+        # the in memory batch and the first spilled batch are settled
+        self.senders[0].acked = 2
+        publisher.publish()
+        self.assertEqual(spilled(), 15)
+
+        self.senders[0].acked = 4
+        publisher.publish()
+        self.assertEqual(spilled(), 0)
+
+    def test_sync(self):
+        """
+        Test a failed blocking send requeues the batch and reconnects on the next publish
+        """
+        publisher = QpidPublisher('qpid://host', 'queue', {}, None)
+        publisher.enqueue(make_event(0))
+        self.senders[0].fail = True
+        self.assertEqual(publisher.publish(), 0)
+        self.assertEqual(publisher.get_metrics()['queue_depth'], 1)
+        self.assertEqual(publisher.publish(), 1)
+        self.assertEqual(len(self.senders[1].sent), 1)
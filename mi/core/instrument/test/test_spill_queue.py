@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_spill_queue
+@file mi/core/instrument/test/test_spill_queue.py
+@brief Test cases for the publisher spill queue
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import shutil
+import tempfile
+
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTestCase
+from mi.core.instrument.spill_queue import SpillQueue
+
+
+@attr('UNIT', group='mi')
+class TestUnitSpillQueue(MiUnitTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_segments(self):
+        """
+        Test items are read in order across segments and read segments are removed on commit
+        """
+        queue = SpillQueue(self.path, segment_bytes=100)
+        for index in range(20):
+            queue.append((None, {'value': index}, None))
+        self.assertEqual(len(queue), 20)
+        self.assertGreater(len(queue._segments()), 1)
+
+        items = queue.read(15) + queue.read(15)
+        self.assertEqual([event['value'] for _, event, _ in items], range(20))
+        self.assertEqual(len(queue), 0)
+
+        queue.commit()
+        self.assertEqual(len(queue._segments()), 1)
+        queue.close()
+
+    def test_read_past_end(self):
+        """
+        Test a count ahead of the segment contents stops the read instead of failing
+        """
+        queue = SpillQueue(self.path)
+        queue.append(0)
+        queue.append(1)
+        queue.count += 1
+        self.assertEqual(queue.read(5), [0, 1])
+        queue.close()
+
+    def test_replay(self):
+        """
+        Test a reopened queue replays everything after the checkpoint and drops a partial item
+        """
+        queue = SpillQueue(self.path)
+        for index in range(10):
+            queue.append(index)
+        queue.read(4)
+        queue.commit()
+        queue.read(2)
+        queue.close()
+
+        segment = os.path.join(self.path, '%012d.seg' % 0)
+        with open(segment, 'ab') as fh:
+            fh.write('\x00\x00\x01')
+
+        queue = SpillQueue(self.path)
+        self.assertEqual(len(queue), 6)
+        queue.append(10)
+        self.assertEqual(queue.read(10), range(4, 11))
+        queue.close()
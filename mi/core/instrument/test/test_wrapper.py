@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_wrapper
+@file mi/core/instrument/test/test_wrapper.py
+@brief Test cases for the driver wrapper command server
+"""
+
+__license__ = 'Apache 2.0'
+
+import json
+import threading
+import time
+
+import zmq
+from gevent import monkey
+from nose.plugins.attrib import attr
+
+from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.instrument.wrapper import CommandServer, CommandPriority, Commands, EventKeys, LatencyStats
+from mi.core.unit_test import MiUnitTestCase
+
+
+class FakeDriver(object):
+    """
+    Driver whose commands block until released
+    """
+    def __init__(self):
+        self.release = threading.Event()
+        self.executed = []
+        self.config = {'param': 1}
+        self.config_reads = 0
+
+    def get_resource_state(self):
+        return 'DRIVER_STATE_COMMAND'
+
+    def get_resource_capabilities(self):
+        return [[], []]
+
+    def get_config_metadata(self):
+        return {}
+
+    def get_cached_config(self):
+        self.config_reads += 1
+        return dict(self.config)
+
+    def get_init_params(self):
+        return {}
+
+    def execute_resource(self, command):
+        self.release.wait(5)
+        self.executed.append(command)
+        return command
+
+
+class FakeWrapper(object):
+    def __init__(self):
+        self.driver = FakeDriver()
+        self.events = []
+        self.server = None
+
+    def send_event(self, event):
+        self.events.append(event)
+
+    def stop_messaging(self):
+        self.server.stop()
+
+
+@attr('UNIT', group='mi')
+class CommandServerUnitTest(MiUnitTestCase):
+    def setUp(self):
+        if monkey.is_module_patched('threading'):
+            # the server threads block in zmq calls, which stall every greenlet under gevent patching
+            self.skipTest('gevent monkey patching active')
+        self.wrapper = FakeWrapper()
+        self.driver = self.wrapper.driver
+        self.server = self.wrapper.server = CommandServer(self.wrapper, max_queued=4)
+        self.thread = threading.Thread(target=self.server.run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.addCleanup(self.stop)
+
+    def stop(self):
+        self.driver.release.set()
+        self.server.stop()
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+
+    def client(self):
+        sock = zmq.Context.instance().socket(zmq.REQ)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.setsockopt(zmq.RCVTIMEO, 5000)
+        sock.connect('tcp://localhost:%d' % self.server.port)
+        self.addCleanup(sock.close)
+        return sock
+
+    def send(self, sock, command, *args, **kwargs):
+        priority = kwargs.pop('priority', None)
+        msg = {EventKeys.COMMAND: command, EventKeys.ARGS: args, EventKeys.KWARGS: kwargs}
+        if priority is not None:
+            msg[EventKeys.PRIORITY] = priority
+        sock.send(json.dumps(msg))
+
+    def command(self, command, *args, **kwargs):
+        sock = self.client()
+        self.send(sock, command, *args, **kwargs)
+        return json.loads(sock.recv())
+
+    def wait_queued(self, count):
+        """
+        Wait until count commands are waiting behind the running one
+        """
+        end = time.time() + 5
+        while (self.server._queued, self.server._queue.qsize()) != (count + 1, count) and time.time() < end:
+            time.sleep(.01)
+
+    def test_read_only_during_driver_command(self):
+        """
+        Test read only queries are answered while a driver command is running
+        """
+        slow = self.client()
+        self.send(slow, 'execute_resource', 'SLOW')
+        for _ in range(20):
+            reply = self.command(Commands.OVERALL_STATE)
+            self.assertEqual(reply[EventKeys.TYPE], DriverAsyncEvent.RESULT)
+            self.assertEqual(reply[EventKeys.VALUE]['state'], 'DRIVER_STATE_COMMAND')
+        self.assertEqual(self.command(Commands.GET_RESOURCE_STATE)[EventKeys.VALUE], 'DRIVER_STATE_COMMAND')
+        self.assertIn('ping from wrapper', self.command(Commands.PING)[EventKeys.VALUE])
+        self.assertEqual(self.driver.executed, [])
+
+        self.driver.release.set()
+        self.assertEqual(json.loads(slow.recv())[EventKeys.VALUE], 'SLOW')
+
+        metrics = self.command(Commands.COMMAND_METRICS)[EventKeys.VALUE]
+        self.assertEqual(metrics['queued']['count'], 1)
+        self.assertEqual(metrics['immediate']['count'], 22)
+        self.assertLessEqual(metrics['immediate']['p99'], metrics['queued']['max'])
+
+    def test_priority_and_busy(self):
+        """
+        Test queued driver commands run by priority then arrival, and BUSY once the queue is full
+        """
+        first = self.client()
+        self.send(first, 'execute_resource', 'FIRST')
+        # wait for the worker to take the first command
+        self.wait_queued(0)
+
+        clients = [self.client() for _ in range(3)]
+        self.send(clients[0], 'execute_resource', 'LOW', priority=CommandPriority.LOW)
+        self.wait_queued(1)
+        self.send(clients[1], 'execute_resource', 'NORMAL')
+        self.wait_queued(2)
+        self.send(clients[2], 'execute_resource', 'HIGH', priority=CommandPriority.HIGH)
+        self.wait_queued(3)
+        busy = self.client()
+        self.send(busy, 'execute_resource', 'REJECTED')
+        self.assertEqual(json.loads(busy.recv()), 'BUSY')
+
+        self.driver.release.set()
+        for sock in [first] + clients:
+            sock.recv()
+        self.assertEqual(self.driver.executed, ['FIRST', 'HIGH', 'NORMAL', 'LOW'])
+        self.assertEqual(self.server.get_metrics()['busy'], 1)
+
+    def test_overall_state_snapshot(self):
+        """
+        Test overall state is rebuilt only once invalidated and its version changes with its content
+        """
+        state = self.command(Commands.OVERALL_STATE)[EventKeys.VALUE]
+        self.assertEqual(state['parameters'], {'param': 1})
+        version = state['version']
+        for _ in range(5):
+            self.assertEqual(self.command(Commands.OVERALL_STATE)[EventKeys.VALUE], state)
+        self.assertEqual(self.command(Commands.OVERALL_STATE, version=version)[EventKeys.VALUE],
+                         {'version': version, 'unchanged': True})
+        self.assertEqual(self.driver.config_reads, 1)
+
+        # invalidated without a change, the version is kept
+        self.server.handler.invalidate()
+        self.assertEqual(self.command(Commands.OVERALL_STATE)[EventKeys.VALUE]['version'], version)
+        self.assertEqual(self.driver.config_reads, 2)
+
+        # a driver command invalidates the snapshot
+        self.driver.config['param'] = 2
+        self.driver.release.set()
+        self.command('execute_resource', 'SET')
+        state = self.command(Commands.OVERALL_STATE, version=version)[EventKeys.VALUE]
+        self.assertNotEqual(state['version'], version)
+        self.assertEqual(state['parameters'], {'param': 2})
+
+    def test_overall_state_restart(self):
+        """
+        Test a version from a previous driver process is never reported unchanged
+        """
+        version = self.command(Commands.OVERALL_STATE)[EventKeys.VALUE]['version']
+        self.stop()
+        self.setUp()
+        state = self.command(Commands.OVERALL_STATE, version=version)[EventKeys.VALUE]
+        self.assertNotIn('unchanged', state)
+        self.assertNotEqual(state['version'], version)
+        self.assertEqual(state['parameters'], {'param': 1})
+
+    def test_unknown_command(self):
+        reply = self.command('no_such_command')
+        self.assertEqual(reply[EventKeys.TYPE], DriverAsyncEvent.ERROR)
+
+    def test_stop_driver(self):
+        self.command(Commands.STOP_DRIVER)
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+
+
+@attr('UNIT', group='mi')
+class LatencyStatsUnitTest(MiUnitTestCase):
+    def test_summary(self):
+        stats = LatencyStats(size=100)
+        self.assertEqual(stats.summary()['p50'], 0.0)
+        for value in range(200):
+            stats.record(value)
+        summary = stats.summary()
+        self.assertEqual(summary['count'], 200)
+        self.assertEqual(summary['p50'], 149)
+        self.assertEqual(summary['p99'], 198)
+        self.assertEqual(summary['max'], 199)
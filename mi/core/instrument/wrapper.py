@@ -12,21 +12,44 @@ Usage:
 Options:
     -h, --help          Show this screen.
 
+The publisher codec (json, ujson or msgpack) is taken from a codec parameter
+in the event/particle url or a top level codec key in the config file.
+Commands are answered in the codec they were received in. Broker payloads
+are compressed when the url has a compress parameter (zlib, lz4 or zstd).
+A spill_dir parameter keeps a broker outage backlog beyond spill_threshold
+events (default 50000) on disk, replayed in order once publishing recovers.
+
+Commands are received by a single polling loop. Read only queries (ping,
+overall_state, get_resource_state) and wrapper commands are answered by the
+loop itself, so they never wait on the driver. Driver commands are queued by
+priority and run one at a time by a worker thread, a client gets BUSY while
+max_queued driver commands are outstanding. command_metrics reports the latency
+percentiles of both.
+
+overall_state is served from a snapshot rebuilt only after a state, config or
+driver config event or a driver command, its version changes with the content
+and is unique to the driver process. A client passing version=<its last version>
+gets {'version': v, 'unchanged': True} while nothing has changed.
+
 """
 import base64
 
 import importlib
-import json
+import itertools
 import os
 import signal
 import threading
 import time
+import uuid
+from collections import deque
+from Queue import PriorityQueue
 
 import yaml
 import zmq
 
 from docopt import docopt
 from logging import _levelNames
+from mi.core.codec import detect_codec
 from mi.core.common import BaseEnum
 from mi.core.exceptions import UnexpectedError, InstrumentCommandException, InstrumentException
 from mi.core.instrument.instrument_driver import DriverAsyncEvent
@@ -47,7 +70,8 @@ class Commands(BaseEnum):
     TEST_EVENTS = 'test_events'
     PING = 'process_echo'
     OVERALL_STATE = 'overall_state'
-    STOP_WORKER = 'stop_worker'
+    GET_RESOURCE_STATE = 'get_resource_state'
+    COMMAND_METRICS = 'command_metrics'
     DEFAULT = 'default'
     SET_LOG_LEVEL = 'set_log_level'
 
@@ -59,10 +83,30 @@ class EventKeys(BaseEnum):
     COMMAND = 'cmd'
     ARGS = 'args'
     KWARGS = 'kwargs'
+    PRIORITY = 'priority'
+
+
+class CommandPriority(BaseEnum):
+    """
+    Order in which queued driver commands are run, lowest first
+    """
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
 
 
-# semaphore to prevent multiple simultaneous commands into the driver
-COMMAND_SEM = threading.BoundedSemaphore(1)
+# driver commands which jump the queue unless the client sets a priority
+COMMAND_PRIORITIES = {
+    'execute_direct': CommandPriority.HIGH,
+    'stop_direct': CommandPriority.HIGH,
+    'disconnect': CommandPriority.HIGH,
+}
+
+STOP = 'STOP'
+
+# driver events after which the overall state snapshot is rebuilt
+INVALIDATING_EVENTS = (DriverAsyncEvent.STATE_CHANGE, DriverAsyncEvent.CONFIG_CHANGE,
+                       DriverAsyncEvent.DRIVER_CONFIG)
 
 
 def encode_exception(exception):
@@ -115,24 +159,65 @@ def build_event(event_type, value, command=None, args=None, kwargs=None):
     return event
 
 
-class CommandHandler(threading.Thread):
-    def __init__(self, wrapper, worker_url):
-        super(CommandHandler, self).__init__()
+class LatencyStats(object):
+    """
+    Latency of the most recent commands
+    """
+    def __init__(self, size=1000):
+        self._samples = deque(maxlen=size)
+        self.count = 0
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        """
+        @retval dictionary of the command count and the latency percentiles (seconds)
+        of the most recent commands
+        """
+        samples = sorted(self._samples)
+        summary = {'count': self.count}
+        for name, percentile in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)):
+            summary[name] = samples[(len(samples) - 1) * percentile // 100] if samples else 0.0
+        return summary
+
+
+class CommandHandler(object):
+    """
+    Executes commands for the CommandServer. Wrapper commands are routed to the
+    methods below, anything else is sent to the driver.
+    """
+    def __init__(self, wrapper, server):
         self.wrapper = wrapper
+        self.server = server
         self.driver = wrapper.driver
         self.send_event = wrapper.send_event
-        self.worker_url = worker_url
-        self._stop = False
+        # overall state snapshot, only touched by the polling loop
+        self._state = None
+        self._snapshot = None
+        # a restarted process must not reuse the versions of the previous one
+        self._instance = uuid.uuid4().hex[:12]
+        self._changes = 0
+        self._version = None
+        self._stale = True
 
         self._routes = {
             Commands.SET_LOG_LEVEL: self._set_log_level,
             Commands.OVERALL_STATE: self._overall_state,
+            Commands.GET_RESOURCE_STATE: self._get_resource_state,
             Commands.PING: self._ping,
             Commands.TEST_EVENTS: self._test_events,
             Commands.STOP_DRIVER: self._stop_driver,
-            Commands.STOP_WORKER: self._stop_worker,
+            Commands.COMMAND_METRICS: self._command_metrics,
         }
 
+    def is_immediate(self, command):
+        """
+        @retval True if command is answered without queueing, it does not touch the instrument
+        """
+        return _transform(command) in self._routes
+
     def _execute(self, raw_command, raw_args, raw_kwargs):
         # check for b64 encoded values
         # decode them prior to processing this command
@@ -191,14 +276,46 @@ class CommandHandler(threading.Thread):
         self.wrapper.stop_messaging()
         return 'Stopped driver process'
 
-    def _stop_worker(self, *args, **kwargs):
-        self._stop = True
-        return 'Stopping worker thread'
-
     def _ping(self, *args, **kwargs):
         return 'ping from wrapper pid:%s, resource:%s' % (os.getpid(), self.driver)
 
+    def _command_metrics(self, *args, **kwargs):
+        return self.server.get_metrics()
+
+    def _get_resource_state(self, *args, **kwargs):
+        return self.driver.get_resource_state()
+
+    def invalidate(self):
+        """
+        Rebuild the overall state snapshot on the next request, safe to call from any thread
+        """
+        self._stale = True
+
     def _overall_state(self, *args, **kwargs):
+        """
+        @param version version of the overall state the client already has
+        @retval the overall state with its version, only the version and unchanged
+        if it matches the client version
+        """
+        if self._stale:
+            # cleared first, an event arriving during the build invalidates it again
+            self._stale = False
+            try:
+                state = self._build_overall_state()
+            except Exception:
+                self._stale = True
+                raise
+            if state != self._state:
+                self._changes += 1
+                self._version = '%s-%d' % (self._instance, self._changes)
+                self._state = state
+                self._snapshot = dict(state, version=self._version)
+
+        if kwargs.get('version') == self._version:
+            return {'version': self._version, 'unchanged': True}
+        return self._snapshot
+
+    def _build_overall_state(self):
         direct_config = {}
         if hasattr(self.driver, 'get_direct_config'):
             direct_config = self.driver.get_direct_config()
@@ -210,21 +327,15 @@ class CommandHandler(threading.Thread):
                 'init_params': self.driver.get_init_params()}
 
     def _send_command(self, command, *args, **kwargs):
-        if not COMMAND_SEM.acquire(False):
-            return 'BUSY'
-
-        try:
-            cmd_func = getattr(self.driver, command, None)
-
-            if cmd_func and callable(cmd_func):
-                reply = cmd_func(*args, **kwargs)
-            else:
-                raise InstrumentCommandException('Unknown driver command.')
+        cmd_func = getattr(self.driver, command, None)
 
-            return reply
+        if cmd_func and callable(cmd_func):
+            try:
+                return cmd_func(*args, **kwargs)
+            finally:
+                self.invalidate()
 
-        finally:
-            COMMAND_SEM.release()
+        raise InstrumentCommandException('Unknown driver command.')
 
     def cmd_driver(self, msg):
         """
@@ -237,101 +348,127 @@ class CommandHandler(threading.Thread):
 
         return self._execute(command, args, kwargs)
 
-    def run(self):
-        """
-        Await commands on a ZMQ REP socket, forwarding them to the
-        driver for processing and returning the result.
-        """
-        context = zmq.Context.instance()
-        sock = context.socket(zmq.REQ)
-        sock.connect(self.worker_url)
-        sock.send('READY')
-        address = None
 
-        while not self._stop:
-            try:
-                address, _, request = sock.recv_multipart()
-                msg = json.loads(request)
-                log.info('received message: %r', msg)
-                reply = _decode(self.cmd_driver(msg))
-                sock.send_multipart([address, '', json.dumps(reply)])
-            except zmq.ContextTerminated:
-                log.info('ZMQ Context terminated, exiting worker thread')
-                break
-            except zmq.ZMQError:
-                # If we have an error on the socket we'll need to restart it
-                sock = context.socket(zmq.REQ)
-                sock.connect(self.worker_url)
-                sock.send('READY')
-            except Exception as e:
-                log.error('Exception in command loop: %r', e)
-                if address is not None:
-                    event = build_event(DriverAsyncEvent.ERROR, repr(e))
-                    sock.send_multipart([address, '', event])
-
-        sock.close()
-
-
-class LoadBalancer(object):
+class CommandServer(object):
     """
-    The load balancer creates two router connections.
-    Workers and clients create REQ sockets to connect. A worker will
-    send 'READY' upon initialization and subsequent "requests" will be
-    the results from the previous command.
+    Clients connect with REQ (or DEALER) sockets to a ROUTER socket polled by run().
+    Immediate commands are answered in the polling loop. Driver commands go to
+    a priority queue served by one worker thread, which hands the encoded reply
+    back to the loop through an inproc PUSH/PULL pair.
     """
+    max_queued = 10
 
-    def __init__(self, wrapper, num_workers, worker_url='inproc://workers'):
-        self.wrapper = wrapper
-        self.num_workers = num_workers
-        self.worker_url = worker_url
+    def __init__(self, wrapper, max_queued=None):
+        self.handler = CommandHandler(wrapper, self)
+        if max_queued is not None:
+            self.max_queued = max_queued
         self.context = zmq.Context.instance()
         self.frontend = self.context.socket(zmq.ROUTER)
-        self.backend = self.context.socket(zmq.ROUTER)
         self.port = self.frontend.bind_to_random_port('tcp://*')
-        self.backend.bind(worker_url)
-        self._start_workers()
+        self.reply_url = 'inproc://command-replies-%x' % id(self)
+        self.replies = self.context.socket(zmq.PULL)
+        self.replies.bind(self.reply_url)
+
+        self._queue = PriorityQueue()
+        # keeps commands of the same priority in arrival order
+        self._sequence = itertools.count()
+        self._queued = 0
+        self._metrics = {'immediate': LatencyStats(), 'queued': LatencyStats(), 'busy': 0}
         self.running = True
 
+        self._worker = threading.Thread(target=self._work)
+        self._worker.setDaemon(True)
+        self._worker.start()
+
+    def _priority(self, msg):
+        priority = msg.get(EventKeys.PRIORITY)
+        if priority is None:
+            priority = COMMAND_PRIORITIES.get(msg.get(EventKeys.COMMAND), CommandPriority.NORMAL)
+        return priority
+
+    def _handle_request(self, client, request, received):
+        codec = None
+        try:
+            codec = detect_codec(request)
+            msg = codec.decode(request)
+            log.info('received message: %r', msg)
+            if self.handler.is_immediate(msg.get(EventKeys.COMMAND, '')):
+                self._reply(client, codec.encode(_decode(self.handler.cmd_driver(msg))), received, 'immediate')
+            elif self._queued >= self.max_queued:
+                self._metrics['busy'] += 1
+                self._reply(client, codec.encode('BUSY'), received, 'immediate')
+            else:
+                self._queued += 1
+                self._queue.put((self._priority(msg), next(self._sequence), client, codec, msg, received))
+        except Exception as e:
+            log.error('Exception in command loop: %r', e)
+            codec = codec or detect_codec('')
+            self._reply(client, codec.encode(build_event(DriverAsyncEvent.ERROR, repr(e))), received, 'immediate')
+
+    def _reply(self, client, reply, received, kind):
+        self.frontend.send_multipart([client, '', reply])
+        self._metrics[kind].record(time.time() - received)
+
+    def _work(self):
+        """
+        Run the queued driver commands one at a time, highest priority first
+        """
+        sock = self.context.socket(zmq.PUSH)
+        sock.connect(self.reply_url)
+        while True:
+            _, _, client, codec, msg, received = self._queue.get()
+            if client is None:
+                break
+            try:
+                reply = codec.encode(_decode(self.handler.cmd_driver(msg)))
+            except Exception as e:
+                log.error('Exception in command worker: %r', e)
+                reply = codec.encode(build_event(DriverAsyncEvent.ERROR, repr(e)))
+            sock.send_multipart([client, reply, repr(received)])
+        sock.close()
+
     def run(self):
-        workers = []
         poller = zmq.Poller()
-
-        poller.register(self.backend, zmq.POLLIN)
+        poller.register(self.frontend, zmq.POLLIN)
+        poller.register(self.replies, zmq.POLLIN)
         while self.running:
             try:
-                sockets = dict(poller.poll(100))
-
-                if self.backend in sockets:
-                    request = self.backend.recv_multipart()
-                    worker, _, client = request[:3]
-                    if not workers:
-                        poller.register(self.frontend, zmq.POLLIN)
+                sockets = dict(poller.poll())
 
-                    workers.append(worker)
-                    if client != 'READY' and len(request) > 3:
-                        _, reply = request[3:]
-                        self.frontend.send_multipart([client, '', reply])
+                if self.replies in sockets:
+                    reply = self.replies.recv_multipart()
+                    if reply[0] != STOP:
+                        client, reply, received = reply
+                        self._queued -= 1
+                        self._reply(client, reply, float(received), 'queued')
 
                 if self.frontend in sockets:
                     client, _, request = self.frontend.recv_multipart()
-                    worker = workers.pop(0)
-
-                    self.backend.send_multipart([worker, '', client, '', request])
-                    if not workers:
-                        poller.unregister(self.frontend)
+                    self._handle_request(client, request, time.time())
 
             except zmq.ContextTerminated:
-                log.info('ZMQ Context terminated, exiting load balancer loop')
+                log.info('ZMQ Context terminated, exiting command loop')
                 break
 
-    def _start_workers(self):
-        for _ in xrange(self.num_workers):
-            t = CommandHandler(self.wrapper, self.worker_url)
-            t.setDaemon(True)
-            t.start()
+        self._queue.put((-1, -1, None, None, None, None))
+
+    def get_metrics(self):
+        """
+        @retval dictionary of the queue depth, BUSY replies and the latency summary
+        of immediate and queued commands, see LatencyStats.summary
+        """
+        return {'queue_depth': self._queued,
+                'busy': self._metrics['busy'],
+                'immediate': self._metrics['immediate'].summary(),
+                'queued': self._metrics['queued'].summary()}
 
     def stop(self):
         self.running = False
+        # wake the polling loop, from whichever thread stop is called
+        sock = self.context.socket(zmq.PUSH)
+        sock.connect(self.reply_url)
+        sock.send_multipart([STOP])
+        sock.close()
 
 
 class DriverWrapper(object):
@@ -341,13 +478,13 @@ class DriverWrapper(object):
     for messaging implementation subclasses.
     """
     __metaclass__ = META_LOGGER
-    worker_url = "inproc://workers"
-    num_workers = 5
+    max_queued = 10
 
-    def __init__(self, driver_module, driver_class, refdes, event_url, particle_url, init_params):
+    def __init__(self, driver_module, driver_class, refdes, event_url, particle_url, init_params, codec=None):
         """
         @param driver_module The python module containing the driver code.
         @param driver_class The python driver class.
+        @param codec Publisher codec name, None for the default (json)
         """
         self.driver_module = driver_module
         self.driver_class = driver_class
@@ -360,15 +497,15 @@ class DriverWrapper(object):
         self.port = None
         self.init_params = init_params
 
-        self.load_balancer = None
+        self.command_server = None
         self.status_thread = None
         self.particle_count = 0
         self.version = self.get_version(driver_module)
 
         headers = {'sensor': self.refdes, 'deliveryType': 'streamed', 'version': self.version, 'module': driver_module}
         log.info('Publish headers set to: %r', headers)
-        self.event_publisher = Publisher.from_url(self.event_url, headers)
-        self.particle_publisher = Publisher.from_url(self.particle_url, headers)
+        self.event_publisher = Publisher.from_url(self.event_url, headers, codec=codec)
+        self.particle_publisher = Publisher.from_url(self.particle_url, headers, codec=codec)
 
     @staticmethod
     def get_version(driver_module):
@@ -404,6 +541,9 @@ class DriverWrapper(object):
         if evt[EventKeys.TYPE] == DriverAsyncEvent.ERROR:
             log.error(evt)
 
+        if evt[EventKeys.TYPE] in INVALIDATING_EVENTS and self.command_server is not None:
+            self.command_server.handler.invalidate()
+
         if evt[EventKeys.TYPE] == DriverAsyncEvent.SAMPLE:
             if evt[EventKeys.VALUE].get('stream_name') == 'raw':
                 # don't publish raw
@@ -433,30 +573,29 @@ class DriverWrapper(object):
     def start_threads(self):
         """
         Initialize and start messaging resources for the driver, blocking
-        until messaging terminates. This ZMQ implementation starts and
-        joins command and event threads, managing nonblocking send/recv calls
-        on REP and PUB sockets, respectively. Terminate loops and close
-        sockets when stop flag is set in driver process.
+        until messaging terminates. This ZMQ implementation starts the
+        publishers and runs the command server loop until stop_messaging
+        is called.
         """
         self.event_publisher.start()
         self.particle_publisher.start()
 
-        self.load_balancer = LoadBalancer(self, self.num_workers)
-        self.port = self.load_balancer.port
+        self.command_server = CommandServer(self, self.max_queued)
+        self.port = self.command_server.port
 
         # now that we have a port, start our status thread
         self.status_thread = ConsulServiceRegistry.create_health_thread(self.refdes, self.port)
         self.status_thread.setDaemon(True)
         self.status_thread.start()
 
-        self.load_balancer.run()
+        self.command_server.run()
 
     def stop_messaging(self):
         """
         Close messaging resource for the driver. Set flags to cause
         command and event threads to close sockets and conclude.
         """
-        self.load_balancer.stop()
+        self.command_server.stop()
 
 
 def main():
@@ -473,8 +612,9 @@ def main():
         init_params = yaml.load(open(config_file))
     else:
         init_params = {}
+    codec = init_params.pop('codec', None)
 
-    wrapper = DriverWrapper(module, klass, refdes, event_url, particle_url, init_params)
+    wrapper = DriverWrapper(module, klass, refdes, event_url, particle_url, init_params, codec=codec)
     wrapper.run()
 
 
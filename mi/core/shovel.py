@@ -6,13 +6,30 @@
 @brief Move messages from rabbitMQ to QPID
 
 Usage:
-    shovel <rabbit_url> <rabbit_queue> <qpid_url> <qpid_queue>
+    shovel [options] <rabbit_url> <rabbit_queue> <qpid_url> <qpid_queue>
 
 Options:
     -h, --help          Show this screen.
+    --batch=<n>         Forward up to this many messages per QPID batch [default: 100]
+    --batch-ms=<ms>     Forward a partial batch once its oldest message is this old [default: 200]
+    --workers=<n>       Number of forwarding worker processes [default: 1]
+    --max-workers=<n>   Add workers, up to this many, while the RabbitMQ backlog grows
 
+Messages are acknowledged in RabbitMQ, all at once, after QPID has settled the
+whole batch. If QPID stays unavailable through a few retries the batch is
+returned to RabbitMQ for redelivery, so a message may be delivered twice but
+is never dropped.
+
+<rabbit_queue> may be a comma separated list of queues. With more than one
+worker the messages are sharded over the worker processes by their sensor
+header, preserving the order of each instrument's messages.
 """
+import Queue as queue_module
+import multiprocessing
 import time
+import zlib
+from collections import deque
+from functools import partial
 
 import os
 from docopt import docopt
@@ -21,64 +38,441 @@ from kombu import Connection, Queue, Exchange
 import qpid.messaging as qm
 
 from ooi.logging import log
+from mi.core.codec import COMPRESSORS, COMPRESSION_HEADER
+from mi.core.instrument.qpid_publisher import CONTENT_ENCODING
 from mi.core.log import LoggerManager
 
 LoggerManager()
 
 
 class QpidProducer(object):
+    SYNC_TIMEOUT = 30
+
     def __init__(self, url, queue, username='guest', password='guest'):
         self.url = url
         self.username = username
         self.password = password
         self.queue = queue
+        self.connection = None
         self.sender = None
 
     def connect(self):
-        delay = 1
-        max_delay = 60
-        while True:
+        """
+        Connect to QPID once, raising qm.ConnectError on failure. Retries are left to
+        send_with_retry, so a QPID outage can't block the caller forever.
+        """
+        self.connection = qm.Connection(self.url, reconnect=False,
+                                        username=self.username, password=self.password)
+        self.connection.open()
+        session = self.connection.session()
+        self.sender = session.sender('%s; {create: always, node: {type: queue, durable: true}}' % self.queue)
+        log.info('Shovel connected to QPID')
+
+    def disconnect(self):
+        connection, self.connection, self.sender = self.connection, None, None
+        if connection is not None:
             try:
-                connection = qm.Connection(self.url, reconnect=False, username=self.username, password=self.password)
-                connection.open()
-                session = connection.session()
-                self.sender = session.sender('%s; {create: always, node: {type: queue, durable: true}}' % self.queue)
-                log.info('Shovel connected to QPID')
-                return
-            except qm.ConnectError:
-                log.error('Shovel QPID connection error. Sleep %d seconds', delay)
-                time.sleep(delay)
-                delay = min(max_delay, delay*2)
+                connection.close(timeout=1)
+            except Exception as e:
+                log.debug('Error closing QPID connection: %r', e)
+
+    @staticmethod
+    def _message(message, headers, content_type='text/plain', content_encoding=None):
+        if content_encoding in COMPRESSORS:
+            headers = dict(headers, **{CONTENT_ENCODING: content_encoding})
+        return qm.Message(content=message, content_type=content_type, durable=True,
+                          properties=headers, user_id='guest')
+
+    def send(self, message, headers, content_type='text/plain', content_encoding=None):
+        if self.sender is None:
+            self.connect()
+        self.sender.send(self._message(message, headers, content_type, content_encoding), sync=False)
 
-    def send(self, message, headers):
+    def send_batch(self, messages):
+        """
+        Pipeline a batch of messages and wait until QPID has settled all of them
+        @param messages list of (body, headers, content_type, content_encoding)
+        """
         if self.sender is None:
             self.connect()
-        message = qm.Message(content=message, content_type='text/plain', durable=True,
-                             properties=headers, user_id='guest')
-        self.sender.send(message, sync=False)
+        for message in messages:
+            self.sender.send(self._message(*message), sync=False)
+        self.sender.sync(timeout=self.SYNC_TIMEOUT)
+
+
+def send_with_retry(qpid, batch, max_delay=60, max_attempts=None):
+    """
+    Send a batch to QPID, reconnecting with exponential backoff until it is settled
+    @param qpid QpidProducer
+    @param batch list of (body, headers, content_type, content_encoding)
+    @param max_attempts give up after this many attempts, None to retry forever
+    @retval True if the batch was settled
+    """
+    delay = 1
+    attempts = 0
+    while True:
+        try:
+            qpid.send_batch(batch)
+            return True
+        except Exception as e:
+            qpid.disconnect()
+            attempts += 1
+            if max_attempts is not None and attempts >= max_attempts:
+                log.error('Exception forwarding %d messages to QPID, giving up after %d attempts: %r',
+                          len(batch), attempts, e)
+                return False
+            log.error('Exception forwarding %d messages to QPID, retrying in %d seconds: %r',
+                      len(batch), delay, e)
+            time.sleep(delay)
+            delay = min(max_delay, delay * 2)
 
 
 class RabbitConsumer(ConsumerMixin):
-    def __init__(self, url, queue, qpid):
+    DEFAULT_BATCH = 100
+    DEFAULT_BATCH_MS = 200
+    MAX_DELAY = 60
+    # retries block the consumer loop, keep them short and let RabbitMQ redeliver instead
+    MAX_ATTEMPTS = 4
+    REPORT_INTERVAL = 60
+
+    def __init__(self, url, queue, qpid, batch_size=None, batch_ms=None):
+        """
+        @param queue queue name, a list or comma separated string for several queues
+        """
+        if isinstance(queue, basestring):
+            queue = queue.split(',')
         self.connection = Connection(hostname=url)
         self.exchange = Exchange(name='amq.direct', type='direct', channel=self.connection)
-        self.queue = Queue(name=queue, exchange=self.exchange, routing_key=queue,
-                           channel=self.connection, durable=True)
+        self.queues = [Queue(name=name, exchange=self.exchange, routing_key=name,
+                             channel=self.connection, durable=True) for name in queue]
         self.qpid = qpid
+        self.batch_size = int(batch_size) if batch_size else self.DEFAULT_BATCH
+        self.batch_ms = int(batch_ms) if batch_ms else self.DEFAULT_BATCH_MS
+        # messages received but not yet settled by QPID
+        self.pending = []
+        self.pending_since = None
+        self.metrics = {'forwarded': 0, 'batches': 0, 'rate': 0.0, 'queue_depth': None, 'requeued': 0}
+        self._report_time = time.time()
+        self._report_count = 0
 
     def get_consumers(self, Consumer, channel):
-        c = Consumer([self.queue], callbacks=[self.on_message])
-        c.qos(prefetch_count=100)
+        # take the raw message, with callbacks kombu decodes the body first and acks and drops
+        # anything it can't decode (msgpack, compressed payloads), the shovel only forwards the body
+        c = Consumer(self.queues, on_message=self.on_raw_message)
+        c.qos(prefetch_count=self.prefetch_count())
         return [c]
 
+    def on_raw_message(self, message):
+        self.on_message(message.body, message)
+
+    def prefetch_count(self):
+        # keep the next batch arriving while the current one is forwarded
+        return max(100, self.batch_size * 2)
+
+    def on_consume_ready(self, connection, channel, consumers, **kwargs):
+        if self.pending:
+            log.warn('RabbitMQ channel reopened, returning %d pending messages', len(self.pending))
+            self.requeue(self.pending)
+            self.pending = []
+            self.pending_since = None
+
+    def requeue(self, messages):
+        """
+        Return unacknowledged messages to RabbitMQ. If their channel is already gone
+        RabbitMQ redelivers them anyway.
+        """
+        errors = self.connection.connection_errors + self.connection.channel_errors
+        for message in messages:
+            try:
+                message.requeue()
+            except errors as e:
+                log.warn('Unable to requeue messages, RabbitMQ redelivers them with the lost channel: %r', e)
+                return
+
     def on_message(self, body, message):
+        if not self.pending:
+            self.pending_since = time.time()
+        self.pending.append(message)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def on_iteration(self):
+        now = time.time()
+        if self.pending and (now - self.pending_since) * 1000 >= self.batch_ms:
+            self.flush()
+        if now - self._report_time >= self.REPORT_INTERVAL:
+            self.report(now)
+
+    def flush(self):
+        """
+        Forward the pending messages to QPID as one batch, retrying with backoff until
+        QPID settles it, then acknowledge them all in RabbitMQ. If QPID is still failing
+        after MAX_ATTEMPTS the messages are returned to RabbitMQ.
+        """
+        batch = [self.forward_item(m) for m in self.pending]
+        if not send_with_retry(self.qpid, batch, self.MAX_DELAY, self.MAX_ATTEMPTS):
+            self.requeue(self.pending)
+            self.pending = []
+            self.pending_since = None
+            self.metrics['requeued'] += len(batch)
+            return
+
         try:
-            self.qpid.send(str(body), message.headers)
-            message.ack()
+            self.pending[-1].ack(multiple=True)
+        except self.connection.connection_errors + self.connection.channel_errors as e:
+            log.error('Unable to acknowledge %d forwarded messages, expect redelivery: %r', len(batch), e)
+
+        self.pending = []
+        self.pending_since = None
+        self.metrics['forwarded'] += len(batch)
+        self.metrics['batches'] += 1
+
+    @staticmethod
+    def forward_item(message):
+        # forward the raw body so non-JSON codecs and compressed payloads pass through undecoded,
+        # the compressor named in the header becomes the QPID content encoding
+        headers = dict(message.headers or {})
+        content_encoding = headers.pop(COMPRESSION_HEADER, None) or message.content_encoding
+        return str(message.body), headers, message.content_type or 'text/plain', content_encoding
+
+    def queue_depth(self):
+        """
+        @retval number of messages waiting in the RabbitMQ queues, None if unknown
+        """
+        try:
+            channel = self.connection.default_channel
+            return sum(q(channel).queue_declare(passive=True).message_count for q in self.queues)
         except Exception as e:
-            log.exception('Exception while publishing message to QPID, requeueing')
-            message.requeue()
-            self.qpid.sender = None
+            log.debug('Unable to read RabbitMQ queue depth: %r', e)
+
+    def report(self, now=None):
+        """
+        Log the forwarding rate and the backlog left in RabbitMQ
+        """
+        now = now or time.time()
+        forwarded = self.metrics['forwarded']
+        self.metrics['rate'] = (forwarded - self._report_count) / max(now - self._report_time, 1e-6)
+        self._report_time = now
+        self._report_count = forwarded
+        self.metrics['queue_depth'] = self.queue_depth()
+        log.info('Shovel forwarded %d messages (%.1f msgs/s), %d pending, %s queued in RabbitMQ',
+                 forwarded, self.metrics['rate'], len(self.pending), self.metrics['queue_depth'])
+
+
+def run_worker(producer_factory, inbox, results, batch_size, batch_ms):
+    """
+    Worker process loop. Forwards batches of (key, body, headers, content_type, content_encoding)
+    items from inbox and puts the keys of each settled batch on results. Ends at a None item.
+    """
+    qpid = producer_factory()
+    running = True
+    while running:
+        item = inbox.get()
+        batch = []
+        deadline = time.time() + batch_ms / 1000.0
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                break
+            try:
+                item = inbox.get(timeout=max(0, deadline - time.time()))
+            except queue_module.Empty:
+                break
+
+        running = item is not None
+        if batch:
+            send_with_retry(qpid, [x[1:] for x in batch])
+            results.put([x[0] for x in batch])
+    qpid.disconnect()
+
+
+class ShovelWorker(object):
+    def __init__(self, producer_factory, results, batch_size, batch_ms):
+        self.inbox = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=run_worker,
+                                               args=(producer_factory, self.inbox, results, batch_size, batch_ms))
+        self.process.daemon = True
+        self.process.start()
+
+    def stop(self, timeout=10):
+        if self.process.is_alive():
+            self.inbox.put(None)
+            self.process.join(timeout)
+        if self.process.is_alive():
+            log.error('Shovel worker did not stop in %d seconds, terminating', timeout)
+            self.process.terminate()
+        # don't block exit on items left for a dead worker
+        self.inbox.cancel_join_thread()
+
+
+class ShovelSupervisor(RabbitConsumer):
+    """
+    Consumes the RabbitMQ queues and hands each message to one of several forwarding worker
+    processes, chosen by the sensor header so every instrument's messages stay in order.
+    Messages are acknowledged, in delivery order, once their worker reports them settled.
+    Workers are added or removed with the RabbitMQ backlog, after draining the outstanding
+    messages so no sensor is forwarded by two workers at once. The other workers keep
+    running, with their QPID connections.
+
+    The producer factory is passed to the worker processes, so it must be picklable, e.g.
+    a module level function or a functools.partial of one.
+    """
+    SCALE_INTERVAL = 30
+    DEPTH_PER_WORKER = 10000
+    # longest wait for the outstanding messages before a resize, runs inside the consumer callback
+    DRAIN_TIMEOUT = 5
+
+    def __init__(self, url, queue, producer_factory, workers=1, max_workers=None, batch_size=None, batch_ms=None):
+        super(ShovelSupervisor, self).__init__(url, queue, None, batch_size, batch_ms)
+        self.producer_factory = producer_factory
+        self.min_workers = workers
+        self.max_workers = max(max_workers or workers, workers)
+        self.results = multiprocessing.Queue()
+        self.workers = []
+        # delivery tags restart on a new channel, keys are (generation, delivery tag)
+        self.generation = 0
+        self.outstanding = {}
+        self.order = deque()
+        self.settled = set()
+        self._resize_to = None
+        self._scale_time = time.time()
+        self.start_workers(workers)
+
+    def prefetch_count(self):
+        return min(0xffff, max(100, self.batch_size * self.max_workers * 2))
+
+    def start_workers(self, count):
+        """
+        Add or remove workers until there are count
+        """
+        while len(self.workers) > count:
+            self.workers.pop().stop()
+        while len(self.workers) < count:
+            self.workers.append(self.new_worker())
+        self.metrics['workers'] = count
+
+    def new_worker(self):
+        return ShovelWorker(self.producer_factory, self.results, self.batch_size, self.batch_ms)
+
+    def stop_workers(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+
+    def shard(self, sensor):
+        return (zlib.crc32(str(sensor)) & 0xffffffff) % len(self.workers)
+
+    def on_consume_ready(self, connection, channel, consumers, **kwargs):
+        if self.outstanding:
+            # still forwarded by the workers, RabbitMQ redelivers them as well
+            log.warn('RabbitMQ channel reopened, returning %d outstanding messages', len(self.outstanding))
+            self.requeue([self.outstanding[key][0] for key in self.order])
+        self.generation += 1
+        self.outstanding.clear()
+        self.order.clear()
+        self.settled.clear()
+
+    def on_message(self, body, message):
+        if self._resize_to is not None:
+            self.drain(self.DRAIN_TIMEOUT)
+            if self.outstanding:
+                # a worker is still retrying QPID, decide again at the next scale check
+                log.warn('Shovel workers did not settle %d messages in %d seconds, postponing resize',
+                         len(self.outstanding), self.DRAIN_TIMEOUT)
+                self._resize_to = None
+            else:
+                self.resize()
+
+        key = (self.generation, message.delivery_tag)
+        shard = self.shard((message.headers or {}).get('sensor'))
+        item = (key,) + self.forward_item(message)
+        self.outstanding[key] = (message, shard, item)
+        self.order.append(key)
+        self.workers[shard].inbox.put(item)
+
+    def on_iteration(self):
+        self.collect()
+        self.check_workers()
+
+        now = time.time()
+        if now - self._scale_time >= self.SCALE_INTERVAL:
+            self._scale_time = now
+            self.scale(self.queue_depth())
+        if self._resize_to is not None and not self.outstanding:
+            self.resize()
+        if now - self._report_time >= self.REPORT_INTERVAL:
+            self.report(now)
+
+    def collect(self, timeout=None):
+        """
+        Record the keys settled by the workers and acknowledge the settled prefix of the delivery order
+        @param timeout seconds to wait for a first result, None to only take those already available
+        """
+        try:
+            while True:
+                if timeout is None:
+                    keys = self.results.get_nowait()
+                else:
+                    keys = self.results.get(timeout=timeout)
+                    timeout = None
+                self.settled.update(key for key in keys if key in self.outstanding)
+        except queue_module.Empty:
+            pass
+
+        last = None
+        while self.order and self.order[0] in self.settled:
+            key = self.order.popleft()
+            self.settled.remove(key)
+            last = self.outstanding.pop(key)[0]
+            self.metrics['forwarded'] += 1
+
+        if last is not None:
+            try:
+                last.ack(multiple=True)
+            except self.connection.connection_errors + self.connection.channel_errors as e:
+                log.error('Unable to acknowledge forwarded messages, expect redelivery: %r', e)
+
+    def check_workers(self):
+        """
+        Replace dead workers, resending the messages they had not settled
+        """
+        for index, worker in enumerate(self.workers):
+            if worker.process.is_alive():
+                continue
+            log.error('Shovel worker %d exited with %r, restarting', index, worker.process.exitcode)
+            worker.inbox.cancel_join_thread()
+            self.workers[index] = worker = self.new_worker()
+            for key in self.order:
+                _, shard, item = self.outstanding[key]
+                if shard == index and key not in self.settled:
+                    worker.inbox.put(item)
+
+    def scale(self, depth):
+        """
+        Choose the number of workers for a RabbitMQ backlog, applied once outstanding messages are settled
+        """
+        if depth is None:
+            return
+        count = max(self.min_workers, min(self.max_workers, 1 + depth // self.DEPTH_PER_WORKER))
+        if count != len(self.workers):
+            log.info('Shovel backlog %d messages, scaling from %d to %d workers', depth, len(self.workers), count)
+            self._resize_to = count
+        else:
+            self._resize_to = None
+
+    def drain(self, timeout=None):
+        """
+        Wait until every outstanding message is settled and acknowledged
+        """
+        end = time.time() + timeout if timeout else None
+        while self.outstanding and (end is None or time.time() < end):
+            self.collect(timeout=1)
+            self.check_workers()
+
+    def resize(self):
+        # sensors are sharded by worker count, so the outstanding messages were drained first
+        self.start_workers(self._resize_to)
+        self._resize_to = None
 
 
 def main():
@@ -87,11 +481,25 @@ def main():
     qpid_queue = options['<qpid_queue>']
     rabbit_url = options['<rabbit_url>']
     rabbit_queue = options['<rabbit_queue>']
+    batch_size = int(options['--batch'])
+    batch_ms = int(options['--batch-ms'])
+    workers = int(options['--workers'])
+    max_workers = int(options['--max-workers'] or workers)
+
+    if max_workers > 1:
+        factory = partial(QpidProducer, qpid_url, qpid_queue)
+        supervisor = ShovelSupervisor(rabbit_url, rabbit_queue, factory, workers, max_workers, batch_size, batch_ms)
+        try:
+            supervisor.run(safety_interval=min(1, batch_ms / 1000.0))
+        finally:
+            supervisor.stop_workers()
+        return
 
     qpid = QpidProducer(qpid_url, qpid_queue)
-    rabbit = RabbitConsumer(rabbit_url, rabbit_queue, qpid)
-    rabbit.run()
+    rabbit = RabbitConsumer(rabbit_url, rabbit_queue, qpid, batch_size, batch_ms)
+    # wake up often enough to flush partial batches on time
+    rabbit.run(safety_interval=min(1, batch_ms / 1000.0))
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.benchmark_checksum
+@file mi/core/test/benchmark_checksum.py
+@brief Compare the cost of the shared checksums with the per-byte implementations
+
+Usage:
+    python -m mi.core.test.benchmark_checksum
+"""
+
+__license__ = 'Apache 2.0'
+
+import functools
+import timeit
+
+from mi.core.test.test_checksum import PAIRS, random_data
+
+
+def main():
+    for size in (32, 1024, 65536):
+        data = random_data(size)
+        number = max(10, 100000 / size)
+        for func, ref in PAIRS:
+            fast = timeit.timeit(functools.partial(func, data), number=number) / number
+            slow = timeit.timeit(functools.partial(ref, data), number=number) / number
+            print '%-10s %6d bytes: %8.1f us (per-byte %8.1f us, x%.1f)' % (
+                func.__name__, size, fast * 1e6, slow * 1e6, slow / fast)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_checksum
+@file mi/core/test/test_checksum.py
+@brief Test cases for the shared checksums
+"""
+
+__license__ = 'Apache 2.0'
+
+import random
+import struct
+
+from nose.plugins.attrib import attr
+
+from mi.core import checksum
+from mi.core.unit_test import MiUnitTest
+
+
+# per-byte reference implementations, as previously used by the drivers
+def ref_lrc(data, seed=0):
+    for val in bytearray(data):
+        seed ^= val
+    return seed
+
+
+def ref_sum16(data):
+    return sum(bytearray(data)) & 0xffff
+
+
+def ref_nortek_sum(data):
+    return (0xb58c + sum(struct.unpack_from('<%dH' % (len(data) // 2), data))) & 0xffff
+
+
+def ref_crc_kermit(buf):
+    crcta = [0, 4225, 8450, 12675, 16900, 21125, 25350, 29575,
+             33800, 38025, 42250, 46475, 50700, 54925, 59150, 63375]
+    crctb = [0, 4489, 8978, 12955, 17956, 22445, 25910, 29887,
+             35912, 40385, 44890, 48851, 51820, 56293, 59774, 63735]
+    crc = 0
+    for val in bytearray(buf):
+        c = crc ^ val
+        crc = (crc >> 8) ^ (crcta[(c & 240) >> 4] ^ crctb[c & 15])
+    return crc
+
+
+PAIRS = [
+    (checksum.lrc, ref_lrc),
+    (checksum.sum16, ref_sum16),
+    (checksum.nortek_sum, ref_nortek_sum),
+    (checksum.crc_kermit, ref_crc_kermit),
+]
+
+
+def random_data(size):
+    return ''.join(chr(random.randint(0, 255)) for _ in xrange(size))
+
+
+@attr('UNIT', group='mi')
+class TestChecksum(MiUnitTest):
+    def test_reference(self):
+        """
+        Test both the short and the vectorized paths match the per-byte implementations
+        """
+        sizes = [0, 1, 2, 7, 8, 9, checksum.SMALL - 1, checksum.SMALL, checksum.SMALL + 1,
+                 checksum.KERMIT_BLOCK + 1, 3 * checksum.KERMIT_BLOCK + 2, 5000]
+        for size in sizes:
+            data = random_data(size)
+            for func, ref in PAIRS:
+                expected = ref(data)
+                for buf in (data, bytearray(data), memoryview(data)):
+                    self.assertEqual(func(buf), expected, '%s(%d bytes)' % (func.__name__, size))
+
+    def test_seed(self):
+        """
+        Test checksums can be continued across pieces of a message
+        """
+        data = random_data(3000)
+        for split in (1, 100, 2999):
+            self.assertEqual(checksum.lrc(data[split:], checksum.lrc(data[:split])), ref_lrc(data))
+            self.assertEqual(checksum.crc_kermit(data[split:], checksum.crc_kermit(data[:split])),
+                             ref_crc_kermit(data))
+
+    def test_known(self):
+        """
+        Test against the CRC-16/KERMIT check value and a port agent sync header
+        """
+        self.assertEqual(checksum.crc_kermit('123456789'), 0x2189)
+        self.assertEqual(checksum.lrc('\xa3\x9d\x7a\x02\x00\x14'), 0xa3 ^ 0x9d ^ 0x7a ^ 0x02 ^ 0x14)
+
+    def test_nortek_words(self):
+        """
+        Test the Nortek checksum over a leading part of a record, which must be present
+        """
+        data = random_data(48)
+        self.assertEqual(checksum.nortek_sum(data, 22), ref_nortek_sum(data[:44]))
+        self.assertRaises(ValueError, checksum.nortek_sum, data, 25)
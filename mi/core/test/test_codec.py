@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_codec
+@file mi/core/test/test_codec.py
+@brief Test cases for the serialization codecs
+"""
+
+__license__ = 'Apache 2.0'
+
+import json
+
+from nose.plugins.attrib import attr
+
+from mi.core.codec import get_codec, detect_codec, get_compressor, CODECS, COMPRESSORS
+from mi.core.unit_test import MiUnitTest
+
+
+EVENTS = [{'type': 'DRIVER_ASYNC_EVENT_SAMPLE', 'value': {'values': [1, 2.5, u'x']}, 'time': index}
+          for index in range(20)]
+
+
+@attr('UNIT', group='mi')
+class TestCodec(MiUnitTest):
+    def test_json_join(self):
+        """
+        Test joined fragments match json.dumps of the whole list
+        """
+        codec = get_codec()
+        self.assertEqual(codec.name, 'json')
+        self.assertEqual(codec.content_type, 'text/plain')
+        self.assertEqual(codec.join([codec.encode(e) for e in EVENTS]), json.dumps(EVENTS))
+
+    def test_roundtrip(self):
+        """
+        Test every installed codec decodes its joined fragments back to the original list
+        """
+        for name, (_, module) in CODECS.iteritems():
+            if module is None:
+                continue
+            codec = get_codec(name)
+            for events in (EVENTS[:3], EVENTS):
+                payload = codec.join([codec.encode(e) for e in events])
+                self.assertEqual(codec.decode(payload), events)
+                self.assertEqual(detect_codec(payload).decode(payload), events)
+
+    def test_compressors(self):
+        """
+        Test every installed compressor round trips a payload
+        """
+        payload = get_codec().join([get_codec().encode(e) for e in EVENTS])
+        self.assertIsNone(get_compressor(None))
+        for name, (_, module) in COMPRESSORS.iteritems():
+            if module is None:
+                continue
+            compressor = get_compressor(name)
+            self.assertEqual(compressor.decompress(compressor.compress(payload)), payload)
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, get_codec, 'pickle')
+        self.assertRaises(ValueError, get_compressor, 'gzip')
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_shovel
+@file mi/core/test/test_shovel.py
+@brief Test cases for the RabbitMQ to QPID shovel
+"""
+
+__license__ = 'Apache 2.0'
+
+import json
+import multiprocessing
+import zlib
+from functools import partial
+
+import msgpack
+from gevent import monkey
+from kombu import Producer
+from mock import Mock, patch
+from nose.plugins.attrib import attr
+
+from mi.core.codec import COMPRESSION_HEADER
+from mi.core.instrument.kombu_publisher import KombuPublisher
+from mi.core.instrument.test.test_publisher import make_event
+from mi.core.shovel import RabbitConsumer, ShovelSupervisor, QpidProducer, send_with_retry
+from mi.core.unit_test import MiUnitTest
+
+
+class FakeProducer(object):
+    """
+    Records forwarded batches, failing the next fail_count sends
+    """
+    def __init__(self):
+        self.batches = []
+        self.fail_count = 0
+
+    def send_batch(self, messages):
+        if self.fail_count:
+            self.fail_count -= 1
+            raise IOError('qpid gone')
+        self.batches.append(messages)
+
+    def disconnect(self):
+        pass
+
+
+class QueueProducer(FakeProducer):
+    """
+    Local stand-in for QPID in worker processes, forwarded messages are put on a queue
+    """
+    def __init__(self, forwarded):
+        super(QueueProducer, self).__init__()
+        self.forwarded = forwarded
+
+    def send_batch(self, messages):
+        for body, headers, _, _ in messages:
+            self.forwarded.put((headers.get('sensor'), body))
+
+
+def make_message(index, sensor='REFDES'):
+    return Mock(body='[%d]' % index, headers={'sensor': sensor}, content_type='text/plain',
+                content_encoding='utf-8', delivery_tag=index + 1)
+
+
+@attr('UNIT', group='mi')
+class TestShovel(MiUnitTest):
+    def setUp(self):
+        # stand in for the RabbitMQ connection, the consumer callbacks are driven directly
+        patcher = patch('mi.core.shovel.Connection')
+        connection = patcher.start()
+        self.addCleanup(patcher.stop)
+        connection.return_value.connection_errors = (IOError,)
+        connection.return_value.channel_errors = ()
+
+        self.qpid = FakeProducer()
+        self.consumer = RabbitConsumer('localhost', 'queue', self.qpid, batch_size=10, batch_ms=50)
+
+    def test_batch_size(self):
+        """
+        Test a full batch is forwarded at once and acknowledged with a single multiple ack
+        """
+        messages = [make_message(i) for i in range(25)]
+        for message in messages:
+            self.consumer.on_message(None, message)
+        self.assertEqual([len(batch) for batch in self.qpid.batches], [10, 10])
+        self.assertEqual(self.qpid.batches[0][0], ('[0]', {'sensor': 'REFDES'}, 'text/plain', 'utf-8'))
+        messages[9].ack.assert_called_once_with(multiple=True)
+        messages[19].ack.assert_called_once_with(multiple=True)
+        self.assertFalse(messages[0].ack.called)
+        self.assertEqual(len(self.consumer.pending), 5)
+
+        # the partial batch goes out once its oldest message is batch_ms old
+        self.consumer.on_iteration()
+        self.assertEqual(len(self.qpid.batches), 2)
+        self.consumer.pending_since -= 1
+        self.consumer.on_iteration()
+        self.assertEqual(len(self.qpid.batches[2]), 5)
+        self.assertEqual(self.consumer.metrics['forwarded'], 25)
+
+    @patch('mi.core.shovel.time.sleep')
+    def test_retry(self, sleep):
+        """
+        Test a QPID failure keeps the batch and resends it with backoff
+        """
+        self.qpid.fail_count = 3
+        messages = [make_message(i) for i in range(10)]
+        for message in messages:
+            self.consumer.on_message(None, message)
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [1, 2, 4])
+        self.assertEqual(len(self.qpid.batches), 1)
+        self.assertEqual(len(self.qpid.batches[0]), 10)
+        messages[9].ack.assert_called_once_with(multiple=True)
+
+    @patch('mi.core.shovel.time.sleep')
+    def test_retry_give_up(self, sleep):
+        """
+        Test a batch QPID keeps failing is returned to RabbitMQ instead of blocking the consumer
+        """
+        self.qpid.fail_count = 10
+        messages = [make_message(i) for i in range(10)]
+        for message in messages:
+            self.consumer.on_message(None, message)
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [1, 2, 4])
+        self.assertEqual(self.qpid.batches, [])
+        for message in messages:
+            message.requeue.assert_called_once_with()
+            self.assertFalse(message.ack.called)
+        self.assertEqual(self.consumer.pending, [])
+        self.assertEqual(self.consumer.metrics['requeued'], 10)
+
+    @patch('mi.core.shovel.time.sleep')
+    @patch('mi.core.shovel.qm')
+    def test_connect_give_up(self, qm, sleep):
+        """
+        Test a QPID connection which keeps failing counts against the send attempts
+        """
+        qm.ConnectError = IOError
+        qm.Connection.return_value.open.side_effect = IOError('connection refused')
+        qpid = QpidProducer('localhost', 'queue')
+        self.assertFalse(send_with_retry(qpid, [('[0]', {}, 'text/plain', None)], max_attempts=3))
+        self.assertEqual(qm.Connection.return_value.open.call_count, 3)
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [1, 2])
+        self.assertIsNone(qpid.sender)
+
+    def test_consume_ready(self):
+        """
+        Test pending messages are returned to RabbitMQ when the channel is reopened
+        """
+        messages = [make_message(i) for i in range(3)]
+        for message in messages:
+            self.consumer.on_message(None, message)
+        # the old channel is gone, RabbitMQ redelivers the rest on its own
+        messages[1].requeue.side_effect = IOError
+        self.consumer.on_consume_ready(None, None, [])
+        messages[0].requeue.assert_called_once_with()
+        self.assertFalse(messages[2].requeue.called)
+        self.assertEqual(self.consumer.pending, [])
+        self.assertIsNone(self.consumer.pending_since)
+
+    def test_supervisor(self):
+        """
+        Test messages are sharded over worker processes in per sensor order and acknowledged once settled
+        """
+        if monkey.is_module_patched('threading'):
+            # multiprocessing queue feeder threads don't run under gevent patching done by other tests
+            self.skipTest('gevent monkey patching active')
+        forwarded = multiprocessing.Queue()
+        supervisor = ShovelSupervisor('localhost', 'a,b', partial(QueueProducer, forwarded),
+                                      workers=2, max_workers=4, batch_size=5, batch_ms=10)
+        self.assertEqual(len(supervisor.queues), 2)
+        try:
+            messages = [make_message(i, 'SENSOR%d' % (i % 7)) for i in range(60)]
+            for message in messages:
+                supervisor.on_message(None, message)
+            supervisor.drain(timeout=10)
+            self.assertEqual(supervisor.outstanding, {})
+            messages[-1].ack.assert_called_with(multiple=True)
+            self.assertEqual(supervisor.metrics['forwarded'], 60)
+
+            received = [forwarded.get(timeout=1) for _ in range(60)]
+            for sensor in set(sensor for sensor, _ in received):
+                bodies = [int(body[1:-1]) for s, body in received if s == sensor]
+                self.assertEqual(bodies, sorted(bodies))
+
+            # a dead worker is replaced
+            supervisor.workers[0].process.terminate()
+            supervisor.workers[0].process.join()
+            supervisor.check_workers()
+            self.assertTrue(supervisor.workers[0].process.is_alive())
+
+            # scaling drains the outstanding messages first, then only adds or removes workers
+            running = list(supervisor.workers)
+            supervisor.scale(25000)
+            self.assertEqual(supervisor._resize_to, 3)
+            supervisor.on_message(None, make_message(60, 'SENSOR0'))
+            self.assertEqual(len(supervisor.workers), 3)
+            self.assertEqual(supervisor.workers[:2], running)
+            messages[-1].ack.assert_called_with(multiple=True)
+            supervisor.drain(timeout=10)
+            self.assertEqual(forwarded.get(timeout=1), ('SENSOR0', '[60]'))
+            supervisor.scale(0)
+            supervisor.on_iteration()
+            self.assertEqual(supervisor.workers, running)
+
+            # a message without headers goes to the shard of a None sensor
+            supervisor.on_message(None, Mock(body='[61]', headers=None, content_type='text/plain',
+                                             content_encoding='utf-8', delivery_tag=62))
+            supervisor.drain(timeout=10)
+            self.assertEqual(forwarded.get(timeout=1), (None, '[61]'))
+
+            # a resize is postponed when the outstanding messages don't settle in time
+            with patch.object(supervisor, 'collect'), patch.object(supervisor, 'DRAIN_TIMEOUT', .1):
+                supervisor.on_message(None, make_message(62, 'SENSOR0'))
+                supervisor.scale(25000)
+                supervisor.on_message(None, make_message(63, 'SENSOR0'))
+            self.assertIsNone(supervisor._resize_to)
+            self.assertEqual(supervisor.workers, running)
+            supervisor.drain(timeout=10)
+            self.assertEqual(supervisor.outstanding, {})
+        finally:
+            supervisor.stop_workers()
+
+
+@attr('UNIT', group='mi')
+class TestShovelKombu(MiUnitTest):
+    """
+    Runs the consumer against kombu's in memory transport
+    """
+    def setUp(self):
+        self.qpid = FakeProducer()
+        self.consumer = RabbitConsumer('memory://', 'shovel_%s' % self.id(), self.qpid, batch_size=2, batch_ms=10)
+        channel = self.consumer.connection.default_channel
+        # kombu never declares amq.* exchanges, a broker has them already
+        channel.exchange_declare(exchange='amq.direct', type='direct')
+        self.queue = self.consumer.queues[0]
+        self.producer = Producer(channel, exchange=self.queue.exchange, routing_key=self.queue.routing_key)
+        self.addCleanup(self.consumer.connection.release)
+
+    def publish(self, body, content_type, content_encoding, **headers):
+        self.producer.publish(body, content_type=content_type, content_encoding=content_encoding,
+                              headers=dict(headers, sensor='REFDES'), declare=[self.queue])
+
+    def consume(self, count):
+        for _ in self.consumer.consume(limit=count, timeout=1):
+            self.consumer.on_iteration()
+
+    def test_forward_raw(self):
+        """
+        Test message bodies kombu can't decode are forwarded as is rather than dropped
+        """
+        packed = msgpack.packb([{'value': 1}])
+        self.publish(packed, 'application/x-msgpack', 'binary')
+        self.publish('[2]', 'text/plain', 'utf-8')
+        self.consume(2)
+        self.assertEqual(self.consumer.metrics['forwarded'], 2)
+        self.assertEqual([item[:3] for batch in self.qpid.batches for item in batch],
+                         [(packed, {'sensor': 'REFDES'}, 'application/x-msgpack'),
+                          ('[2]', {'sensor': 'REFDES'}, 'text/plain')])
+        # acknowledged, nothing left to redeliver
+        self.assertEqual(self.queue(self.consumer.connection.default_channel).queue_declare().message_count, 0)
+
+    def test_forward_compressed(self):
+        """
+        Test the compressor travels in a header and is forwarded as the QPID content encoding
+        """
+        publisher = KombuPublisher('memory://', self.queue.name, {'sensor': 'REFDES'}, None, compress='zlib')
+        self.addCleanup(publisher.connection.release)
+        events = [make_event(index) for index in range(3)]
+        for event in events:
+            publisher.enqueue(event)
+        publisher.publish()
+        self.publish('[3]', 'text/plain', 'utf-8')
+        self.consume(2)
+
+        (body, headers, content_type, content_encoding), _ = self.qpid.batches[0]
+        self.assertEqual(content_encoding, 'zlib')
+        self.assertNotIn(COMPRESSION_HEADER, headers)
+        self.assertEqual(json.loads(zlib.decompress(body)), events)
@@ -338,77 +338,44 @@ class Protocol(CommandResponseInstrumentProtocol):
                 self._direct_commands[label] = command
 
 
-    @staticmethod
-    def sieve_function(raw_data):
-        """
-        Sort data in the chunker...
-        @param raw_data: Data to be searched for samples
-        @return: list of (start,end) tuples
-        """
-        matchers = []
-        return_list = []
-
-        matchers.append(particles.HeatSampleParticle.regex_compiled())
-        matchers.append(particles.IrisSampleParticle.regex_compiled())
-        matchers.append(particles.NanoSampleParticle.regex_compiled())
-        matchers.append(particles.LilySampleParticle.regex_compiled())
-        matchers.append(particles.LilyLevelingParticle.regex_compiled())
-
-        for matcher in matchers:
-            for match in matcher.finditer(raw_data):
-                return_list.append((match.start(), match.end()))
-
-        return return_list
-
-    def _got_chunk(self, chunk, ts):
-        """
-        Process chunk output by the chunker.  Generate samples and (possibly) react
+    # Chunk dispatch, samples may trigger a reaction once the protocol state is known
+    _particle_handlers = {
+        'heat': (particles.HeatSampleParticle.regex_compiled(), particles.HeatSampleParticle, None),
+        'iris': (particles.IrisSampleParticle.regex_compiled(), particles.IrisSampleParticle, None),
+        'nano': (particles.NanoSampleParticle.regex_compiled(), particles.NanoSampleParticle, '_check_pps_sync'),
+        'lily': (particles.LilySampleParticle.regex_compiled(), particles.LilySampleParticle,
+                 '_check_for_autolevel'),
+        'leveling': (particles.LilyLevelingParticle.regex_compiled(), particles.LilyLevelingParticle,
+                     '_check_completed_leveling'),
+    }
+
+    # Sort data in the chunker, single pass over all sample regexes
+    sieve_function = staticmethod(StringChunker.compile_regex_sieve(
+        {pattern_id: regex for pattern_id, (regex, _, _) in _particle_handlers.iteritems()}))
+
+    def _got_particle_chunk(self, chunk, timestamp, pattern_id):
+        """
+        Overridden to skip the post hooks until the protocol state has been discovered
         @param chunk: data
-        @param ts: ntp timestamp
+        @param timestamp: ntp timestamp
+        @param pattern_id: key of the matching particle handler
         @return sample
         @throws InstrumentProtocolException
         """
-        possible_particles = [
-            (particles.LilySampleParticle, self._check_for_autolevel),
-            (particles.LilyLevelingParticle, self._check_completed_leveling),
-            (particles.HeatSampleParticle, None),
-            (particles.IrisSampleParticle, None),
-            (particles.NanoSampleParticle, self._check_pps_sync),
-        ]
+        if self.get_current_state() == ProtocolState.UNKNOWN and self._particle_batch is None:
+            _, particle_class, _ = self._get_particle_handler(chunk, pattern_id)
+            return self._generate_particle(particle_class, chunk, timestamp)
+        return super(Protocol, self)._got_particle_chunk(chunk, timestamp, pattern_id)
 
-        for particle_type, func in possible_particles:
-            sample = self._extract_sample(particle_type, particle_type.regex_compiled(), chunk, ts)
-            if sample:
-                if func and self.get_current_state() != ProtocolState.UNKNOWN:
-                    func(sample)
-                return sample
-
-        raise InstrumentProtocolException(u'unhandled chunk received by _got_chunk: [{0!r:s}]'.format(chunk))
-
-    def _extract_sample(self, particle_class, regex, line, timestamp, publish=True):
+    def _particle_kwargs(self, particle_class):
         """
         Overridden to set the quality flag for LILY particles that are out of range.
         @param particle_class: Class type for particle
-        @param regex: regular expression to verify data
-        @param line: data
-        @param timestamp: ntp timestamp
-        @param publish: boolean to indicate if sample should be published
-        @return: extracted sample
+        @return: particle keyword arguments
         """
-        if regex.match(line):
-            if particle_class == particles.LilySampleParticle and self._param_dict.get(Parameter.LEVELING_FAILED):
-                particle = particle_class(line, port_timestamp=timestamp, quality_flag=DataParticleValue.OUT_OF_RANGE)
-            else:
-                particle = particle_class(line, port_timestamp=timestamp)
-            parsed_sample = particle.generate()
-
-            # Add an entry to the particle dictionary, with the particle class as the key
-            self._particle_dict[particle.data_particle_type()] = parsed_sample
-
-            if publish and self._driver_event:
-                self._driver_event(DriverAsyncEvent.SAMPLE, parsed_sample)
-
-            return parsed_sample
+        if particle_class == particles.LilySampleParticle and self._param_dict.get(Parameter.LEVELING_FAILED):
+            return {'quality_flag': DataParticleValue.OUT_OF_RANGE}
+        return {}
 
     def _filter_capabilities(self, events):
         """
@@ -9,16 +9,21 @@ Release notes:
 import re
 import time
 
+import ntplib
+import numpy as np
+
 from mi.core.common import BaseEnum
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, CommonDataParticleType
 from mi.core.exceptions import SampleException
-from mi.core.log import get_logging_metaclass
+from mi.core.log import get_logger, get_logging_metaclass
 from mi.core.time_tools import timegm_to_float
 
 
 __author__ = 'Pete Cable'
 __license__ = 'Apache 2.0'
 
+log = get_logger()
+
 METALOGGER = get_logging_metaclass('trace')
 
 NEWLINE = '\n'
@@ -307,6 +312,60 @@ class NanoSampleParticle(BotptDataParticle):
             self._encode_value(NanoSampleParticleKey.PPS_SYNC, self.match.group('pps_sync'), str),
         ]
 
+    @classmethod
+    def build_columns(cls, records, **kwargs):
+        """
+        Vectorized batch generation for the high rate NANO stream.
+        Falls back to per-record generation if any field fails to convert, or for particle arguments.
+        @param records: list of (raw_data, port_timestamp) tuples
+        @param kwargs: particle arguments, e.g. quality_flag
+        @return: dict of numpy arrays, see DataParticle.build_columns
+        """
+        if kwargs:
+            return super(NanoSampleParticle, cls).build_columns(records, **kwargs)
+
+        regex = cls.regex_compiled()
+        groups = []
+        port_timestamps = []
+        template = None
+        for raw_data, port_timestamp in records:
+            match = regex.match(raw_data)
+            if match is None:
+                log.error('No regex match of parsed sample data: [%r]', raw_data)
+                continue
+            if template is None:
+                # constant particle fields come from a regular instance
+                template = cls(raw_data).contents
+            groups.append(match.group('pps_sync', 'date_time', 'pressure', 'temp'))
+            port_timestamps.append(port_timestamp)
+
+        if template is None:
+            return {}
+
+        pps_sync, date_time, pressure, temp = (np.array(column) for column in zip(*groups))
+        try:
+            iso = np.char.replace(np.char.replace(np.char.strip(date_time), '/', '-'), ' ', 'T')
+            unix_time = (iso.astype('datetime64[us]') - np.datetime64(0, 'us')).astype(np.int64) / 1e6
+            pressure = pressure.astype(float)
+            temp = temp.astype(float)
+        except ValueError:
+            return super(NanoSampleParticle, cls).build_columns(records)
+
+        rows = len(groups)
+        columns = {key: np.array([value] * rows) for key, value in template.iteritems()
+                   if key not in (DataParticleKey.PORT_TIMESTAMP, DataParticleKey.INTERNAL_TIMESTAMP)}
+        columns.update({
+            DataParticleKey.PORT_TIMESTAMP: cls._column_array(port_timestamps),
+            DataParticleKey.INTERNAL_TIMESTAMP: ntplib.system_to_ntp_time(unix_time),
+            DataParticleKey.STREAM_NAME: np.array([cls._data_particle_type] * rows),
+            NanoSampleParticleKey.SENSOR_ID: np.array(['NANO'] * rows),
+            NanoSampleParticleKey.TIME: date_time,
+            NanoSampleParticleKey.PRESSURE: pressure,
+            NanoSampleParticleKey.TEMP: temp,
+            NanoSampleParticleKey.PPS_SYNC: pps_sync,
+        })
+        return columns
+
 
 # ##############################################################################
 # Leveling Particles
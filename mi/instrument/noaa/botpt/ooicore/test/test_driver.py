@@ -29,6 +29,7 @@ from mi.idk.unit_test import DriverTestMixin
 from mi.idk.unit_test import ParameterTestConfigKey
 from mi.idk.unit_test import AgentCapabilityType
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.data_particle import DataParticle, DataParticleKey, DataParticleValue, ParticleBatch
 from mi.core.instrument.instrument_driver import DriverConfigKey
 from mi.core.instrument.instrument_driver import ResourceAgentState
 from mi.core.exceptions import InstrumentDataException, SampleException, InstrumentProtocolException
@@ -463,6 +464,36 @@ class DriverUnitTest(InstrumentDriverUnitTestCase, BotptTestMixinSub):
             with self.assertRaises(SampleException):
                 p_type(sample).generate()
 
+    def test_nano_build_columns(self):
+        """
+        Verify the vectorized NANO batch matches per-record generation
+        """
+        ts = self.get_ntp_timestamp()
+        records = [(samples.NANO_VALID_SAMPLE_01, ts),
+                   (samples.INVALID_SAMPLE, ts),
+                   (samples.NANO_VALID_SAMPLE_02, ts + 1)]
+        columns = particles.NanoSampleParticle.build_columns(records)
+        expected = DataParticle.build_columns.__func__(particles.NanoSampleParticle, records)
+
+        self.assertEqual(set(columns), set(expected))
+        for key in columns:
+            if key != DataParticleKey.DRIVER_TIMESTAMP:
+                self.assertEqual(list(columns[key]), list(expected[key]))
+
+    def test_batch_quality_flag(self):
+        """
+        Verify LILY particles deferred to a particle batch keep the out of range flag while leveling failed
+        """
+        driver = self.test_connect()
+        driver._protocol._particle_batch = ParticleBatch()
+        self._send_port_agent_packet(driver, samples.LILY_VALID_SAMPLE_01 + samples.NEWLINE)
+        driver._protocol._param_dict.set_value(Parameter.LEVELING_FAILED, True)
+        self._send_port_agent_packet(driver, samples.LILY_VALID_SAMPLE_02 + samples.NEWLINE)
+
+        columns = driver._protocol._particle_batch.flush()
+        self.assertEqual([list(each[DataParticleKey.QUALITY_FLAG]) for each in columns],
+                         [[DataParticleValue.OK], [DataParticleValue.OUT_OF_RANGE]])
+
     def test_status_particle(self):
         """
         This particle is not generated via the chunker (because it may contain embedded samples)
@@ -90,21 +90,9 @@ class Protocol(NortekInstrumentProtocol):
     ########################################################################
     # overridden superclass methods
     ########################################################################
-    @staticmethod
-    def sieve_function(raw_data):
-        """
-        The method that detects data sample structures from instrument
-        Should be in the format [[structure_sync_bytes, structure_len]*]
-        """
-        return_list = []
-        sieve_matchers = common.NORTEK_COMMON_REGEXES + [VELOCITY_DATA_REGEX]
-
-        for matcher in sieve_matchers:
-            for match in matcher.finditer(raw_data):
-                return_list.append((match.start(), match.end()))
-                log.debug("sieve_function: regex found %r", raw_data[match.start():match.end()])
-
-        return return_list
+    # detects data sample structures from instrument, single pass over all structure regexes
+    sieve_function = staticmethod(StringChunker.compile_regex_sieve(common.NORTEK_COMMON_REGEXES +
+                                                                    [VELOCITY_DATA_REGEX]))
 
     def _got_chunk(self, structure, timestamp):
         """
@@ -22,6 +22,7 @@ from mi.core.exceptions import InstrumentParameterException
 from mi.core.exceptions import InstrumentProtocolException
 from mi.core.exceptions import InstrumentStateException
 from mi.core.exceptions import InstrumentTimeoutException
+from mi.core.instrument.chunker import StringChunker
 from mi.core.instrument.driver_dict import DriverDict, DriverDictKey
 from mi.core.instrument.instrument_driver import DriverAsyncEvent
 from mi.core.instrument.instrument_driver import DriverConfigKey
@@ -434,21 +435,8 @@ class NortekInstrumentProtocol(CommandResponseInstrumentProtocol):
             else:
                 self._direct_commands[label] = command + common.NEWLINE
 
-    @staticmethod
-    def sieve_function(raw_data):
-        """
-        The method that detects data sample structures from instrument
-        Should be in the format [[structure_sync_bytes, structure_len]*]
-        """
-        return_list = []
-        sieve_matchers = common.NORTEK_COMMON_REGEXES
-
-        for matcher in sieve_matchers:
-            for match in matcher.finditer(raw_data):
-                return_list.append((match.start(), match.end()))
-                log.debug("sieve_function: regex found %r", raw_data[match.start():match.end()])
-
-        return return_list
+    # detects data sample structures from instrument, single pass over all structure regexes
+    sieve_function = staticmethod(StringChunker.compile_regex_sieve(common.NORTEK_COMMON_REGEXES))
 
     ########################################################################
     # overridden superclass methods
@@ -5,6 +5,7 @@ from datetime import datetime
 
 import re
 
+from mi.core.checksum import nortek_sum
 from mi.core.common import BaseEnum
 from mi.core.exceptions import SampleException
 from mi.core.instrument.data_particle import DataParticle, CommonDataParticleType, DataParticleKey, DataParticleValue
@@ -21,9 +22,7 @@ namedtuple_store = {}
 
 def validate_checksum(str_struct, raw_data, offset=-2):
     checksum = struct.unpack_from('<H', raw_data, offset)[0]
-    if (0xb58c + sum(struct.unpack_from(str_struct, raw_data))) & 0xffff != checksum:
-        return False
-    return True
+    return nortek_sum(raw_data, struct.calcsize(str_struct) / 2) == checksum
 
 
 def unpack_from_format(name, unpack_format, data):
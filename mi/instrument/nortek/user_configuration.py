@@ -8,6 +8,7 @@ from ctypes import c_ubyte, c_ushort, c_char, memmove
 from io import BytesIO
 from pprint import pformat
 
+from mi.core.checksum import nortek_sum
 from mi.core.common import BaseEnum
 
 
@@ -338,7 +339,7 @@ class UserConfiguration(LittleEndianStructure):
 
     @staticmethod
     def generate_checksum(data):
-        return 0xb58c + sum(struct.unpack_from('<255H', data)) & 0xffff
+        return nortek_sum(data, 255)
 
     def __repr__(self):
         base = buffer(self)[:-2]
@@ -1166,26 +1166,19 @@ class Protocol(SeaBirdProtocol):
         self._add_scheduler_event(ScheduledJob.CALIBRATION_COEFFICIENTS, ProtocolEvent.ACQUIRE_CONFIGURATION)
         self._add_scheduler_event(ScheduledJob.CLOCK_SYNC, ProtocolEvent.SCHEDULED_CLOCK_SYNC)
 
-    @staticmethod
-    def sieve_function(raw_data):
-        """
-        Chunker sieve method to help the chunker identify chunks.
-        @returns a list of chunks identified, if any.  The chunks are all the same type.
-        """
-        sieve_matchers = [TS_REGEX_MATCHER,
-                          TIDE_REGEX_MATCHER,
-                          WAVE_REGEX_MATCHER,
-                          STATS_REGEX_MATCHER,
-                          DS_REGEX_MATCHER,
-                          DC_REGEX_MATCHER]
-
-        return_list = []
-
-        for matcher in sieve_matchers:
-            for match in matcher.finditer(raw_data):
-                return_list.append((match.start(), match.end()))
-
-        return return_list
+    # Chunk dispatch, each sample regex with the particle it produces
+    _particle_handlers = {
+        'ts': (TS_REGEX_MATCHER, SBE26plusTideSampleDataParticle, None),
+        'tide': (TIDE_REGEX_MATCHER, SBE26plusTideSampleDataParticle, None),
+        'wave': (WAVE_REGEX_MATCHER, SBE26plusWaveBurstDataParticle, None),
+        'stats': (STATS_REGEX_MATCHER, SBE26plusStatisticsDataParticle, None),
+        'ds': (DS_REGEX_MATCHER, SBE26plusDeviceStatusDataParticle, None),
+        'dc': (DC_REGEX_MATCHER, SBE26plusDeviceCalibrationDataParticle, None),
+    }
+
+    # Chunker sieve to help the chunker identify chunks, single pass over all sample regexes
+    sieve_function = staticmethod(StringChunker.compile_regex_sieve(
+        {pattern_id: regex for pattern_id, (regex, _, _) in _particle_handlers.iteritems()}))
 
     def _filter_capabilities(self, events):
         """
@@ -2632,20 +2625,6 @@ class Protocol(SeaBirdProtocol):
         log.debug("_parse_ts_response RETURNING RESULT=" + str(result))
         return result
 
-    def _got_chunk(self, chunk, timestamp):
-        """
-        The base class got_data has gotten a chunk from the chunker.  Pass it to extract_sample
-        with the appropriate particle objects and REGEXes.
-        @param: chunk - byte sequence that we want to create a particle from
-        @param: timestamp - port agent timestamp to include in the chunk
-        """
-        if self._extract_sample(SBE26plusTideSampleDataParticle, TS_REGEX_MATCHER, chunk, timestamp): return
-        if self._extract_sample(SBE26plusTideSampleDataParticle, TIDE_REGEX_MATCHER, chunk, timestamp): return
-        if self._extract_sample(SBE26plusWaveBurstDataParticle, WAVE_REGEX_MATCHER, chunk, timestamp): return
-        if self._extract_sample(SBE26plusStatisticsDataParticle, STATS_REGEX_MATCHER, chunk, timestamp): return
-        if self._extract_sample(SBE26plusDeviceCalibrationDataParticle, DC_REGEX_MATCHER, chunk, timestamp): return
-        if self._extract_sample(SBE26plusDeviceStatusDataParticle, DS_REGEX_MATCHER, chunk, timestamp): return
-
     ########################################################################
     # Static helpers to format set commands.
     ########################################################################
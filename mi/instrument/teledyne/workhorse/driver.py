@@ -12,6 +12,7 @@ import struct
 import re
 from contextlib import contextmanager
 
+from mi.core.checksum import sum16
 from mi.core.log import get_logger
 from mi.core.common import Units, Prefixes
 from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
@@ -873,9 +874,9 @@ class WorkhorseProtocol(CommandResponseInstrumentProtocol):
         self._chunker = StringChunker(self.sieve_function)
         self.initialize_scheduler()
 
-        # dictionary to store last transmitted metadata particle values
+        # dictionary to store the fingerprint of the last transmitted metadata particles
         # so we can not send updates when nothing changed
-        self._last_values = {}
+        self._last_fingerprints = {}
 
         self._display_name = 'VADCP'
         self._direct_commands['Wake Up'] = NEWLINE
@@ -940,7 +941,7 @@ class WorkhorseProtocol(CommandResponseInstrumentProtocol):
                     # if they match we have a PD0 record
                     if len(raw_data) > end_index + 1:
                         checksum = struct.unpack_from('<H', raw_data, end_index)[0]
-                        calculated = sum(bytearray(raw_data[match.start():end_index])) & 0xffff
+                        calculated = sum16(buffer(raw_data, match.start(), length))
                         if checksum == calculated:
                             # include the checksum in our match... (2 bytes)
                             return_list.append((match.start(), end_index + 2))
@@ -973,15 +974,24 @@ class WorkhorseProtocol(CommandResponseInstrumentProtocol):
     # #######################################################################
     # Private helpers.
     # #######################################################################
-    def _changed(self, particle):
-        stream = particle.get('stream_name')
-        values = particle.get('values')
-        last_values = self._last_values.get(stream)
-        if values == last_values:
-            return False
+    def _generate_changed(self, particle_class, record, timestamp):
+        """
+        Compare the fingerprint of the record fields a metadata particle is built from
+        with the last one sent, so unchanged particles are never generated
+        @param particle_class particle class with a fingerprint method
+        @param record AdcpPd0Record
+        @param timestamp port agent timestamp
+        @retval the generated particle, None if unchanged
+        """
+        stream = particle_class._data_particle_type
+        fingerprint = particle_class.fingerprint(record)
+        if fingerprint == self._last_fingerprints.get(stream):
+            return None
 
-        self._last_values[stream] = values
-        return True
+        particle = particle_class(record, port_timestamp=timestamp).generate()
+        # only recorded once generated, a particle which failed is tried again with the next record
+        self._last_fingerprints[stream] = fingerprint
+        return particle
 
     def _got_chunk(self, chunk, timestamp):
         """
@@ -999,14 +1009,11 @@ class WorkhorseProtocol(CommandResponseInstrumentProtocol):
             else:
                 raise SampleException('Received unknown coordinate transform type: %s' % transform)
 
-            # generate the particles
-
-            config = AdcpPd0ConfigParticle(pd0, port_timestamp=timestamp).generate()
-            engineering = AdcpPd0EngineeringParticle(pd0, port_timestamp=timestamp).generate()
-
+            # generate the metadata particles only when their fields changed
             out_particles = [science]
-            for particle in [config, engineering]:
-                if self._changed(particle):
+            for particle_class in [AdcpPd0ConfigParticle, AdcpPd0EngineeringParticle]:
+                particle = self._generate_changed(particle_class, pd0, timestamp)
+                if particle is not None:
                     out_particles.append(particle)
 
             for particle in out_particles:
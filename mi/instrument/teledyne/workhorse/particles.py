@@ -1,6 +1,7 @@
 import re
 import time
 from datetime import datetime
+from operator import attrgetter
 
 from mi.core.log import get_logger
 from mi.core.common import BaseEnum
@@ -317,6 +318,14 @@ class VadcpBeamSlaveParticle(Pd0VelocityParticle):
         return [{DataParticleKey.VALUE_ID: key, DataParticleKey.VALUE: value} for key, value in fields]
 
 
+# variable leader fields of the engineering particle
+engineering_variable_fields = attrgetter(
+    'speed_of_sound', 'mpt_minutes', 'mpt_seconds', 'mpt_hundredths', 'heading_standard_deviation',
+    'pitch_standard_deviation', 'roll_standard_deviation', 'transmit_current', 'transmit_voltage',
+    'ambient_temperature', 'pressure_positive', 'pressure_negative', 'attitude_temperature', 'attitude',
+    'contamination_sensor', 'pressure_variance', 'bit_result', 'error_status_word')
+
+
 class AdcpPd0EngineeringParticle(Pd0DataParticle):
     """
     ADCP PD0 data particle
@@ -324,6 +333,13 @@ class AdcpPd0EngineeringParticle(Pd0DataParticle):
     """
     _data_particle_type = WorkhorseDataParticleType.ADCP_PD0_ENGINEERING
 
+    @staticmethod
+    def fingerprint(record):
+        """
+        @retval the record fields this particle is built from, compared to decide if it changed
+        """
+        return record.fixed_data.transmit_pulse_length, engineering_variable_fields(record.variable_data)
+
     def _build_parsed_values(self):
         """
         Parse the base portion of the particle
@@ -364,6 +380,13 @@ class AdcpPd0ConfigParticle(Pd0DataParticle):
     """
     _data_particle_type = WorkhorseDataParticleType.ADCP_PD0_CONFIG
 
+    @staticmethod
+    def fingerprint(record):
+        """
+        @retval the fixed leader, every field of this particle (bitmaps included) derives from it
+        """
+        return record.fixed_data
+
     def _build_parsed_values(self):
         """
         Parse the base portion of the particle
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+"""
+@package mi.instrument.teledyne.workhorse.pd0_array
+@file mi/instrument/teledyne/workhorse/pd0_array.py
+@brief numpy decoder for ADCP PD0 data
+Release notes:
+
+The ensemble layout (block offsets and number of cells) is turned into a numpy
+structured dtype, the ensemble bytes are then viewed through it without copying.
+Cell data comes out as (cells, 4) arrays. decode_ensembles/decode_file apply the
+same dtype to every ensemble of a file sharing that layout, giving arrays with a
+leading ensemble axis.
+"""
+import numpy as np
+
+from mi.core.checksum import sum16
+from mi.instrument.teledyne.workhorse.pd0_parser import BlockId, HEADER_FORMAT, FIXED_FORMAT, VARIABLE_FORMAT, \
+    BOTTOM_TRACK_FORMAT, InsufficientDataException, ChecksumException, UnhandledBlockException, PD0ParsingException
+
+HEADER_SIZE = 6
+
+# struct format characters used by the PD0 formats
+NUMPY_TYPES = {'B': 'u1', 'b': 'i1', 'H': '<u2', 'h': '<i2', 'I': '<u4', 'i': '<i4', 'Q': '<u8'}
+
+
+def format_dtype(formatter):
+    """
+    @param formatter sequence of (name, struct format character)
+    @retval packed little endian structured dtype
+    """
+    return np.dtype([(name, NUMPY_TYPES[code]) for name, code in formatter])
+
+HEADER_DTYPE = format_dtype(HEADER_FORMAT)
+FIXED_DTYPE = format_dtype(FIXED_FORMAT)
+VARIABLE_DTYPE = format_dtype(VARIABLE_FORMAT)
+BOTTOM_TRACK_DTYPE = format_dtype(BOTTOM_TRACK_FORMAT)
+
+# block id: (field name, dtype or cell type)
+BLOCKS = {
+    BlockId.FIXED_DATA: ('fixed_data', FIXED_DTYPE),
+    BlockId.VARIABLE_DATA: ('variable_data', VARIABLE_DTYPE),
+    BlockId.BOTTOM_TRACK: ('bottom_track', BOTTOM_TRACK_DTYPE),
+    BlockId.VELOCITY_DATA: ('velocities', '<i2'),
+    BlockId.CORRELATION_DATA: ('correlation_magnitudes', 'u1'),
+    BlockId.ECHO_INTENSITY_DATA: ('echo_intensity', 'u1'),
+    BlockId.PERCENT_GOOD_DATA: ('percent_good', 'u1'),
+}
+CELL_BLOCKS = (BlockId.VELOCITY_DATA, BlockId.CORRELATION_DATA, BlockId.ECHO_INTENSITY_DATA,
+               BlockId.PERCENT_GOOD_DATA)
+IGNORED_BLOCKS = (BlockId.AUV_NAV_DATA, BlockId.STATUS_DATA_ID)
+
+FIELDS = [name for name, _ in BLOCKS.itervalues()]
+
+_dtype_store = {}
+
+
+def _as_array(data):
+    if isinstance(data, np.ndarray):
+        return data.view(np.uint8)
+    if isinstance(data, memoryview):
+        data = np.asarray(data)
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def layout_key(array, start=0):
+    """
+    @param array uint8 array holding the ensemble
+    @param start byte offset of the ensemble
+    @retval the header and offset table of the ensemble, which with its number of cells
+            determines the layout
+    """
+    if len(array) < start + HEADER_SIZE:
+        raise InsufficientDataException('Insufficient data in PD0 header')
+    return array[start:start + HEADER_SIZE + 2 * int(array[start + 5])].tostring()
+
+
+def ensemble_dtype(data, start=0):
+    """
+    Build the structured dtype of the ensemble at start, including its checksum
+    @param data buffer holding the ensemble
+    @param start byte offset of the ensemble
+    @retval numpy dtype, itemsize is the size of the ensemble
+    """
+    array = _as_array(data)[start:]
+    if len(array) < HEADER_SIZE:
+        raise InsufficientDataException('Insufficient data in PD0 header')
+    header = array[:HEADER_SIZE].view(HEADER_DTYPE)[0]
+    num_bytes = int(header['num_bytes'])
+    num_data_types = int(header['num_data_types'])
+    if len(array) < num_bytes + 2:
+        raise InsufficientDataException('Insufficient data in PD0 record (expected %d bytes, found %d)' %
+                                        (num_bytes + 2, len(array)))
+    offsets = array[HEADER_SIZE:HEADER_SIZE + 2 * num_data_types].view('<u2').tolist()
+
+    key = (layout_key(array), num_bytes)
+    cells = None
+    blocks = []
+    for offset in offsets:
+        if offset + 2 > num_bytes:
+            raise PD0ParsingException('PD0 block offset %d beyond the end of the ensemble' % offset)
+        block_id = int(array[offset:offset + 2].view('<u2')[0])
+        if block_id == BlockId.FIXED_DATA:
+            cells = int(array[offset:offset + FIXED_DTYPE.itemsize].view(FIXED_DTYPE)[0]['number_of_cells'])
+        elif block_id not in BLOCKS and block_id not in IGNORED_BLOCKS:
+            raise UnhandledBlockException('Found unhandled data type id: %d' % block_id)
+        blocks.append((block_id, offset))
+
+    key += (cells,)
+    if key in _dtype_store:
+        return _dtype_store[key]
+
+    names, formats, field_offsets = ['header', 'offsets'], [HEADER_DTYPE, ('<u2', num_data_types)], [0, HEADER_SIZE]
+    for block_id, offset in blocks:
+        if block_id in IGNORED_BLOCKS:
+            continue
+        name, dtype = BLOCKS[block_id]
+        if block_id in CELL_BLOCKS:
+            if cells is None:
+                raise PD0ParsingException('PD0 cell data without a fixed leader')
+            # skip the block id, the cells follow as (cells, beams)
+            dtype, offset = (dtype, (cells, 4)), offset + 2
+        size = np.dtype(dtype).itemsize
+        if offset + size > num_bytes:
+            raise PD0ParsingException('PD0 block %d overruns the ensemble' % block_id)
+        names.append(name)
+        formats.append(dtype)
+        field_offsets.append(offset)
+
+    names.append('checksum')
+    formats.append('<u2')
+    field_offsets.append(num_bytes)
+    dtype = np.dtype({'names': names, 'formats': formats, 'offsets': field_offsets, 'itemsize': num_bytes + 2})
+    _dtype_store[key] = dtype
+    return dtype
+
+
+class AdcpPd0Array(object):
+    """
+    numpy counterpart of AdcpPd0Record. The blocks are numpy records and the cell data
+    (cells, 4) arrays, all views on the ensemble data.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.dtype = ensemble_dtype(data)
+        array = _as_array(data)[:self.dtype.itemsize]
+        self.record = array.view(self.dtype)[0]
+        self.header = self.record['header']
+        self.offsets = self.record['offsets']
+        self.stored_checksum = int(self.record['checksum'])
+        calculated_checksum = sum16(array[:-2])
+        if calculated_checksum != self.stored_checksum:
+            raise ChecksumException('Checksum failure in PD0 data (expected %d, calculated %d' %
+                                    (self.stored_checksum, calculated_checksum))
+
+        for name in FIELDS:
+            setattr(self, name, self.record[name] if name in self.dtype.names else None)
+
+
+class AdcpPd0Ensembles(object):
+    """
+    Ensembles sharing one layout, each attribute of AdcpPd0Array stacked along a
+    leading ensemble axis
+    """
+    def __init__(self, records, starts):
+        """
+        @param records structured array of ensembles
+        @param starts byte offset of each ensemble in the decoded data
+        """
+        self.records = records
+        self.starts = starts
+        self.header = records['header']
+        self.offsets = records['offsets']
+        self.stored_checksum = records['checksum']
+        for name in FIELDS:
+            setattr(self, name, records[name] if name in records.dtype.names else None)
+
+    def __len__(self):
+        return len(self.records)
+
+
+def find_ensembles(data):
+    """
+    Locate the valid ensembles, every sync is tested at once and the checksums are
+    computed with a single reduceat over the data
+    @param data buffer
+    @retval array of (start, size) for each ensemble, in order
+    """
+    array = _as_array(data)
+    if len(array) < HEADER_SIZE:
+        return np.empty((0, 2), dtype=np.int64)
+
+    starts = np.flatnonzero((array[:-1] == 0x7f) & (array[1:] == 0x7f))
+    starts = starts[starts + HEADER_SIZE <= len(array)]
+    num_bytes = array[starts + 2].astype(np.int64) | (array[starts + 3].astype(np.int64) << 8)
+    fits = (num_bytes > HEADER_SIZE) & (starts + num_bytes + 2 <= len(array))
+    starts, num_bytes = starts[fits], num_bytes[fits]
+    if not len(starts):
+        return np.empty((0, 2), dtype=np.int64)
+
+    ends = starts + num_bytes
+    bounds = np.empty(2 * len(starts), dtype=np.int64)
+    bounds[0::2] = starts
+    bounds[1::2] = ends
+    sums = np.add.reduceat(array, bounds, dtype=np.uint64)[0::2] & 0xffff
+    stored = array[ends].astype(np.uint64) | (array[ends + 1].astype(np.uint64) << 8)
+    valid = sums == stored
+    starts, sizes = starts[valid], num_bytes[valid] + 2
+
+    # a sync pattern inside a valid ensemble is not another ensemble
+    keep = []
+    end = 0
+    for index, start in enumerate(starts.tolist()):
+        if start >= end:
+            keep.append(index)
+            end = start + sizes[index]
+    return np.column_stack((starts[keep], sizes[keep]))
+
+
+def decode_ensembles(data):
+    """
+    Decode every valid ensemble in data
+    @param data buffer holding any number of ensembles, possibly with noise between them
+    @retval list of AdcpPd0Ensembles, a new one starts whenever the layout changes
+    """
+    array = _as_array(data)
+    ensembles = find_ensembles(array)
+    starts = ensembles[:, 0].tolist()
+    sizes = ensembles[:, 1].tolist()
+    keys = [layout_key(array, start) for start in starts]
+
+    groups = []
+    runs = []
+    index = 0
+    while index < len(starts):
+        start, size, key = starts[index], sizes[index], keys[index]
+        if not runs or (key, size) != (keys[runs[-1][0]], sizes[runs[-1][0]]):
+            if runs:
+                groups.append(runs)
+            runs = []
+
+        # extend the run over the following contiguous ensembles with the same layout
+        count = 1
+        while (index + count < len(starts) and starts[index + count] == start + count * size and
+               sizes[index + count] == size and keys[index + count] == key):
+            count += 1
+        runs.append((index, count))
+        index += count
+    if runs:
+        groups.append(runs)
+
+    decoded = []
+    for runs in groups:
+        first = starts[runs[0][0]]
+        dtype = ensemble_dtype(array, first)
+        records = [array[starts[index]:starts[index] + count * dtype.itemsize].view(dtype) for index, count in runs]
+        records = records[0] if len(records) == 1 else np.concatenate(records)
+        decoded.append(AdcpPd0Ensembles(records, np.array([starts[index + n] for index, count in runs
+                                                           for n in range(count)])))
+    return decoded
+
+
+def decode_file(path):
+    """
+    Decode a file of PD0 ensembles, the file is memory mapped
+    @param path file name
+    @retval list of AdcpPd0Ensembles
+    """
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    if not len(data):
+        return []
+    return decode_ensembles(data)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+@package mi.instrument.teledyne.workhorse.pd0_index
+@file mi/instrument/teledyne/workhorse/pd0_index.py
+@brief Sidecar ensemble index for PD0 files and port agent datalogs
+
+Usage:
+    pd0_index raw <files>...
+    pd0_index datalog <files>...
+
+Options:
+    -h, --help          Show this screen
+
+Each file is scanned once and an index is saved next to it as <file>.idx.npy with one
+row per ensemble: the byte offset to start reading at (the ensemble itself in a raw
+file, the port agent packet holding its first byte in a datalog), the ensemble length,
+the ensemble number and its RTC time. seek_time and byte_ranges use the index to start
+playback at a given time or to split a file between processes.
+
+    To run without installing:
+    python -m mi.instrument.teledyne.workhorse.pd0_index ...
+"""
+import mmap
+import os
+from contextlib import closing
+from datetime import datetime
+
+import numpy as np
+from docopt import docopt
+
+from mi.core.instrument.port_agent_client import HEADER, HEADER_SIZE, LENGTH_INDEX, TYPE_INDEX, \
+    TIMESTAMP_UPPER_INDEX, TIMESTAMP_LOWER_INDEX, PortAgentPacket
+from mi.instrument.teledyne.workhorse.pd0_array import decode_ensembles
+from ooi.logging import log
+
+NTP_DIFF = (datetime(1970, 1, 1) - datetime(1900, 1, 1)).total_seconds()
+PORT_AGENT_SYNC = '\xa3\x9d\x7a'
+SUFFIX = '.idx.npy'
+
+INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),           # where to start reading in the file
+    ('length', '<u4'),           # ensemble size in bytes, checksum included
+    ('ensemble_number', '<u4'),  # roll over included
+    ('time', '<f8'),             # RTC time, NTP seconds
+    ('port_time', '<f8'),        # port agent timestamp of the first packet, datalogs only
+])
+
+
+def rtc_time(variable_data):
+    """
+    @param variable_data structured array of variable leaders
+    @retval array of the Y2K RTC times as NTP seconds
+    """
+    years = variable_data['rtc_y2k_century'].astype(np.int64) * 100 + variable_data['rtc_y2k_year']
+    months = ((years - 1970) * 12 + variable_data['rtc_y2k_month'] - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (variable_data['rtc_y2k_day'].astype(np.int64) - 1)
+    seconds = (days.astype('datetime64[s]').astype(np.int64) +
+               variable_data['rtc_y2k_hour'].astype(np.int64) * 3600 +
+               variable_data['rtc_y2k_minute'].astype(np.int64) * 60 +
+               variable_data['rtc_y2k_seconds'])
+    return seconds + variable_data['rtc_y2k_hundredths'] / 100.0 + NTP_DIFF
+
+
+def index_ensembles(data):
+    """
+    @param data buffer of PD0 ensembles
+    @retval index array, offsets are positions in data
+    """
+    groups = decode_ensembles(data)
+    index = np.zeros(sum(len(group) for group in groups), dtype=INDEX_DTYPE)
+    position = 0
+    for group in groups:
+        rows = index[position:position + len(group)]
+        variable_data = group.variable_data
+        rows['offset'] = group.starts
+        rows['length'] = group.records.dtype.itemsize
+        rows['ensemble_number'] = ((variable_data['ensemble_roll_over'].astype(np.uint32) << 16) +
+                                   variable_data['ensemble_number'])
+        rows['time'] = rtc_time(variable_data)
+        position += len(group)
+
+    index.sort(order='offset', kind='mergesort')
+    return index
+
+
+def read_datalog(data):
+    """
+    Extract the instrument data from a port agent datalog
+    @param data buffer holding the datalog, a memory mapped file or a string
+    @retval (instrument data array, file offset of each packet, its position in the instrument data,
+             its port agent timestamp)
+    """
+    offsets, lengths, positions, times = [], [], [], []
+    position = 0
+    start = data.find(PORT_AGENT_SYNC)
+    while start != -1 and start + HEADER_SIZE <= len(data):
+        header = HEADER.unpack_from(data, start)
+        length = header[LENGTH_INDEX]
+        if length < HEADER_SIZE or start + length > len(data):
+            start = data.find(PORT_AGENT_SYNC, start + 1)
+            continue
+
+        if header[TYPE_INDEX] == PortAgentPacket.DATA_FROM_INSTRUMENT:
+            offsets.append(start)
+            lengths.append(length - HEADER_SIZE)
+            positions.append(position)
+            times.append(header[TIMESTAMP_UPPER_INDEX] + header[TIMESTAMP_LOWER_INDEX] / 2.0 ** 32)
+            position += length - HEADER_SIZE
+
+        start += length
+        if data[start:start + len(PORT_AGENT_SYNC)] != PORT_AGENT_SYNC:
+            start = data.find(PORT_AGENT_SYNC, start)
+
+    # copy the payloads straight from the file into the one stream array
+    source = np.frombuffer(data, dtype=np.uint8)
+    stream = np.empty(position, dtype=np.uint8)
+    for start, length, position in zip(offsets, lengths, positions):
+        stream[position:position + length] = source[start + HEADER_SIZE:start + HEADER_SIZE + length]
+
+    return stream, np.array(offsets, dtype=np.uint64), np.array(positions, dtype=np.int64), np.array(times)
+
+
+def build_index(path, datalog=False):
+    """
+    Scan a file and index its ensembles, the file is memory mapped
+    @param path raw PD0 file or port agent datalog
+    @param datalog True if path is a port agent datalog
+    @retval index array
+    """
+    if not os.path.getsize(path):
+        return np.zeros(0, dtype=INDEX_DTYPE)
+
+    if not datalog:
+        return index_ensembles(np.memmap(path, dtype=np.uint8, mode='r'))
+
+    with open(path, 'rb') as fh, closing(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)) as data:
+        stream, packet_offsets, packet_positions, packet_times = read_datalog(data)
+    index = index_ensembles(stream)
+    # the packet holding the first byte of each ensemble
+    packets = np.searchsorted(packet_positions, index['offset'].astype(np.int64), side='right') - 1
+    index['offset'] = packet_offsets[packets]
+    index['port_time'] = packet_times[packets]
+    return index
+
+
+def index_path(path):
+    return path + SUFFIX
+
+
+def write_index(path, datalog=False):
+    """
+    Build the index of a file and save it next to the file
+    @retval index array
+    """
+    index = build_index(path, datalog)
+    # write through a temporary file so readers never see a partial index
+    tmp_path = index_path(path) + '.tmp'
+    with open(tmp_path, 'wb') as fh:
+        np.save(fh, index)
+    os.rename(tmp_path, index_path(path))
+    log.info('Indexed %d ensembles in %s', len(index), path)
+    return index
+
+
+def load_index(path, datalog=False):
+    """
+    Load the index of a file, building it if it is missing or older than the file
+    @retval index array
+    """
+    sidecar = index_path(path)
+    if os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(path):
+        return np.load(sidecar)
+    return write_index(path, datalog)
+
+
+def seek_time(index, time):
+    """
+    @param index index array
+    @param time NTP seconds
+    @retval byte offset to start reading at to get every ensemble from time on,
+            None if all ensembles are older
+    """
+    later = np.flatnonzero(index['time'] >= time)
+    if not len(later):
+        return None
+    return int(index['offset'][later].min())
+
+
+def byte_ranges(index, parts, size=None):
+    """
+    Split a file into byte ranges of about the same number of ensembles, each range
+    starting at an ensemble so it can be processed on its own
+    @param index index array
+    @param parts number of ranges
+    @param size end of the last range, None for the end of the file
+    @retval list of (start, end)
+    """
+    if not len(index):
+        return []
+    starts = np.unique(index['offset'][np.linspace(0, len(index), parts, endpoint=False).astype(np.int64)])
+    ends = [int(end) for end in starts[1:]] + [size]
+    return [(int(start), end) for start, end in zip(starts, ends)]
+
+
+def main():
+    options = docopt(__doc__)
+    for path in options['<files>']:
+        write_index(path, datalog=options['datalog'])
+
+if __name__ == '__main__':
+    main()
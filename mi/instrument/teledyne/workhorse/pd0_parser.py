@@ -12,6 +12,8 @@ import struct
 
 import sys
 
+from mi.core.checksum import sum16
+
 namedtuple_store = {}
 bitmapped_namedtuple_store = {}
 
@@ -44,6 +46,164 @@ class BlockId(object):
     AUV_NAV_DATA = 8192
 
 
+HEADER_FORMAT = (
+    ('id', 'B'),
+    ('data_source', 'B'),
+    ('num_bytes', 'H'),
+    ('spare', 'B'),
+    ('num_data_types', 'B')
+)
+
+FIXED_FORMAT = (
+    ('id', 'H'),
+    ('cpu_firmware_version', 'B'),
+    ('cpu_firmware_revision', 'B'),
+    ('system_configuration', 'H'),
+    ('simulation_data_flag', 'B'),
+    ('lag_length', 'B'),
+    ('number_of_beams', 'B'),
+    ('number_of_cells', 'B'),
+    ('pings_per_ensemble', 'H'),
+    ('depth_cell_length', 'H'),
+    ('blank_after_transmit', 'H'),
+    ('signal_processing_mode', 'B'),
+    ('low_corr_threshold', 'B'),
+    ('num_code_reps', 'B'),
+    ('minimum_percentage', 'B'),
+    ('error_velocity_max', 'H'),
+    ('tpp_minutes', 'B'),
+    ('tpp_seconds', 'B'),
+    ('tpp_hundredths', 'B'),
+    ('coord_transform', 'B'),
+    ('heading_alignment', 'H'),
+    ('heading_bias', 'H'),
+    ('sensor_source', 'B'),
+    ('sensor_available', 'B'),
+    ('bin_1_distance', 'H'),
+    ('transmit_pulse_length', 'H'),
+    ('starting_depth_cell', 'B'),
+    ('ending_depth_cell', 'B'),
+    ('false_target_threshold', 'B'),
+    ('spare1', 'B'),
+    ('transmit_lag_distance', 'H'),
+    ('cpu_board_serial_number', 'Q'),
+    ('system_bandwidth', 'H'),
+    ('system_power', 'B'),
+    ('spare2', 'B'),
+    ('serial_number', 'I'),
+    ('beam_angle', 'B')
+)
+
+VARIABLE_FORMAT = (
+    ('id', 'H'),
+    ('ensemble_number', 'H'),
+    ('rtc_year', 'B'),
+    ('rtc_month', 'B'),
+    ('rtc_day', 'B'),
+    ('rtc_hour', 'B'),
+    ('rtc_minute', 'B'),
+    ('rtc_second', 'B'),
+    ('rtc_hundredths', 'B'),
+    ('ensemble_roll_over', 'B'),
+    ('bit_result', 'H'),
+    ('speed_of_sound', 'H'),
+    ('depth_of_transducer', 'H'),
+    ('heading', 'H'),
+    ('pitch', 'h'),
+    ('roll', 'h'),
+    ('salinity', 'H'),
+    ('temperature', 'h'),
+    ('mpt_minutes', 'B'),
+    ('mpt_seconds', 'B'),
+    ('mpt_hundredths', 'B'),
+    ('heading_standard_deviation', 'B'),
+    ('pitch_standard_deviation', 'B'),
+    ('roll_standard_deviation', 'B'),
+    ('transmit_current', 'B'),
+    ('transmit_voltage', 'B'),
+    ('ambient_temperature', 'B'),
+    ('pressure_positive', 'B'),
+    ('pressure_negative', 'B'),
+    ('attitude_temperature', 'B'),
+    ('attitude', 'B'),
+    ('contamination_sensor', 'B'),
+    ('error_status_word', 'I'),
+    ('reserved', 'H'),
+    ('pressure', 'I'),
+    ('pressure_variance', 'I'),
+    ('spare', 'B'),
+    ('rtc_y2k_century', 'B'),
+    ('rtc_y2k_year', 'B'),
+    ('rtc_y2k_month', 'B'),
+    ('rtc_y2k_day', 'B'),
+    ('rtc_y2k_hour', 'B'),
+    ('rtc_y2k_minute', 'B'),
+    ('rtc_y2k_seconds', 'B'),
+    ('rtc_y2k_hundredths', 'B')
+)
+
+BOTTOM_TRACK_FORMAT = (
+    ('id', 'H'),
+    ('pings_per_ensemble', 'H'),
+    ('delay_before_reacquire', 'H'),
+    ('correlation_mag_min', 'B'),
+    ('eval_amplitude_min', 'B'),
+    ('percent_good_minimum', 'B'),
+    ('mode', 'B'),
+    ('error_velocity_max', 'H'),
+    ('reserved', 'I'),
+    ('range_1', 'H'),
+    ('range_2', 'H'),
+    ('range_3', 'H'),
+    ('range_4', 'H'),
+    ('velocity_1', 'h'),
+    ('velocity_2', 'h'),
+    ('velocity_3', 'h'),
+    ('velocity_4', 'h'),
+    ('corr_1', 'B'),
+    ('corr_2', 'B'),
+    ('corr_3', 'B'),
+    ('corr_4', 'B'),
+    ('amp_1', 'B'),
+    ('amp_2', 'B'),
+    ('amp_3', 'B'),
+    ('amp_4', 'B'),
+    ('pcnt_1', 'B'),
+    ('pcnt_2', 'B'),
+    ('pcnt_3', 'B'),
+    ('pcnt_4', 'B'),
+    ('ref_layer_min', 'H'),
+    ('ref_layer_near', 'H'),
+    ('ref_layer_far', 'H'),
+    ('ref_velocity_1', 'h'),
+    ('ref_velocity_2', 'h'),
+    ('ref_velocity_3', 'h'),
+    ('ref_velocity_4', 'h'),
+    ('ref_corr_1', 'B'),
+    ('ref_corr_2', 'B'),
+    ('ref_corr_3', 'B'),
+    ('ref_corr_4', 'B'),
+    ('ref_amp_1', 'B'),
+    ('ref_amp_2', 'B'),
+    ('ref_amp_3', 'B'),
+    ('ref_amp_4', 'B'),
+    ('ref_pcnt_1', 'B'),
+    ('ref_pcnt_2', 'B'),
+    ('ref_pcnt_3', 'B'),
+    ('ref_pcnt_4', 'B'),
+    ('max_depth', 'H'),
+    ('rssi_1', 'B'),
+    ('rssi_2', 'B'),
+    ('rssi_3', 'B'),
+    ('rssi_4', 'B'),
+    ('gain', 'B'),
+    ('range_msb_1', 'B'),
+    ('range_msb_2', 'B'),
+    ('range_msb_3', 'B'),
+    ('range_msb_4', 'B'),
+)
+
+
 def count_zero_bits(bitmask):
     if not bitmask:
         return 0
@@ -139,7 +299,7 @@ class AdcpPd0Record(object):
                 'Insufficient data in PD0 record (expected %d bytes, found %d)' %
                 (self.header.num_bytes + 2, len(self.data)))
 
-        calculated_checksum = sum(bytearray(self.data[:-2])) & 65535
+        calculated_checksum = sum16(buffer(self.data, 0, len(self.data) - 2))
         self.stored_checksum = struct.unpack_from('<H', self.data, self.header.num_bytes)[0]
 
         if calculated_checksum != self.stored_checksum:
@@ -157,14 +317,7 @@ class AdcpPd0Record(object):
         self._parse_error_word()
 
     def _process_header(self):
-        header_format = (
-            ('id', 'B'),
-            ('data_source', 'B'),
-            ('num_bytes', 'H'),
-            ('spare', 'B'),
-            ('num_data_types', 'B')
-        )
-        self.header = self._unpack_from_format('header', header_format, 0)
+        self.header = self._unpack_from_format('header', HEADER_FORMAT, 0)
         self.data = self.data[:self.header.num_bytes + 2]
 
     def _parse_offset_data(self):
@@ -194,96 +347,10 @@ class AdcpPd0Record(object):
                 raise UnhandledBlockException('Found unhandled data type id: %d' % block_id)
 
     def _parse_fixed(self, offset):
-        fixed_format = (
-            ('id', 'H'),
-            ('cpu_firmware_version', 'B'),
-            ('cpu_firmware_revision', 'B'),
-            ('system_configuration', 'H'),
-            ('simulation_data_flag', 'B'),
-            ('lag_length', 'B'),
-            ('number_of_beams', 'B'),
-            ('number_of_cells', 'B'),
-            ('pings_per_ensemble', 'H'),
-            ('depth_cell_length', 'H'),
-            ('blank_after_transmit', 'H'),
-            ('signal_processing_mode', 'B'),
-            ('low_corr_threshold', 'B'),
-            ('num_code_reps', 'B'),
-            ('minimum_percentage', 'B'),
-            ('error_velocity_max', 'H'),
-            ('tpp_minutes', 'B'),
-            ('tpp_seconds', 'B'),
-            ('tpp_hundredths', 'B'),
-            ('coord_transform', 'B'),
-            ('heading_alignment', 'H'),
-            ('heading_bias', 'H'),
-            ('sensor_source', 'B'),
-            ('sensor_available', 'B'),
-            ('bin_1_distance', 'H'),
-            ('transmit_pulse_length', 'H'),
-            ('starting_depth_cell', 'B'),
-            ('ending_depth_cell', 'B'),
-            ('false_target_threshold', 'B'),
-            ('spare1', 'B'),
-            ('transmit_lag_distance', 'H'),
-            ('cpu_board_serial_number', 'Q'),
-            ('system_bandwidth', 'H'),
-            ('system_power', 'B'),
-            ('spare2', 'B'),
-            ('serial_number', 'I'),
-            ('beam_angle', 'B')
-        )
-        self.fixed_data = self._unpack_from_format('fixed', fixed_format, offset)
+        self.fixed_data = self._unpack_from_format('fixed', FIXED_FORMAT, offset)
 
     def _parse_variable(self, offset):
-        variable_format = (
-            ('id', 'H'),
-            ('ensemble_number', 'H'),
-            ('rtc_year', 'B'),
-            ('rtc_month', 'B'),
-            ('rtc_day', 'B'),
-            ('rtc_hour', 'B'),
-            ('rtc_minute', 'B'),
-            ('rtc_second', 'B'),
-            ('rtc_hundredths', 'B'),
-            ('ensemble_roll_over', 'B'),
-            ('bit_result', 'H'),
-            ('speed_of_sound', 'H'),
-            ('depth_of_transducer', 'H'),
-            ('heading', 'H'),
-            ('pitch', 'h'),
-            ('roll', 'h'),
-            ('salinity', 'H'),
-            ('temperature', 'h'),
-            ('mpt_minutes', 'B'),
-            ('mpt_seconds', 'B'),
-            ('mpt_hundredths', 'B'),
-            ('heading_standard_deviation', 'B'),
-            ('pitch_standard_deviation', 'B'),
-            ('roll_standard_deviation', 'B'),
-            ('transmit_current', 'B'),
-            ('transmit_voltage', 'B'),
-            ('ambient_temperature', 'B'),
-            ('pressure_positive', 'B'),
-            ('pressure_negative', 'B'),
-            ('attitude_temperature', 'B'),
-            ('attitude', 'B'),
-            ('contamination_sensor', 'B'),
-            ('error_status_word', 'I'),
-            ('reserved', 'H'),
-            ('pressure', 'I'),
-            ('pressure_variance', 'I'),
-            ('spare', 'B'),
-            ('rtc_y2k_century', 'B'),
-            ('rtc_y2k_year', 'B'),
-            ('rtc_y2k_month', 'B'),
-            ('rtc_y2k_day', 'B'),
-            ('rtc_y2k_hour', 'B'),
-            ('rtc_y2k_minute', 'B'),
-            ('rtc_y2k_seconds', 'B'),
-            ('rtc_y2k_hundredths', 'B')
-        )
-        self.variable_data = self._unpack_from_format('variable', variable_format, offset)
+        self.variable_data = self._unpack_from_format('variable', VARIABLE_FORMAT, offset)
 
     def _parse_velocity(self, offset):
         self.velocities = self._unpack_cell_data('velocity', 'h', offset)
@@ -298,67 +365,7 @@ class AdcpPd0Record(object):
         self.percent_good = self._unpack_cell_data('percent_good', 'B', offset)
 
     def _parse_bottom_track(self, offset):
-        bottom_track_format = (
-            ('id', 'H'),
-            ('pings_per_ensemble', 'H'),
-            ('delay_before_reacquire', 'H'),
-            ('correlation_mag_min', 'B'),
-            ('eval_amplitude_min', 'B'),
-            ('percent_good_minimum', 'B'),
-            ('mode', 'B'),
-            ('error_velocity_max', 'H'),
-            ('reserved', 'I'),
-            ('range_1', 'H'),
-            ('range_2', 'H'),
-            ('range_3', 'H'),
-            ('range_4', 'H'),
-            ('velocity_1', 'h'),
-            ('velocity_2', 'h'),
-            ('velocity_3', 'h'),
-            ('velocity_4', 'h'),
-            ('corr_1', 'B'),
-            ('corr_2', 'B'),
-            ('corr_3', 'B'),
-            ('corr_4', 'B'),
-            ('amp_1', 'B'),
-            ('amp_2', 'B'),
-            ('amp_3', 'B'),
-            ('amp_4', 'B'),
-            ('pcnt_1', 'B'),
-            ('pcnt_2', 'B'),
-            ('pcnt_3', 'B'),
-            ('pcnt_4', 'B'),
-            ('ref_layer_min', 'H'),
-            ('ref_layer_near', 'H'),
-            ('ref_layer_far', 'H'),
-            ('ref_velocity_1', 'h'),
-            ('ref_velocity_2', 'h'),
-            ('ref_velocity_3', 'h'),
-            ('ref_velocity_4', 'h'),
-            ('ref_corr_1', 'B'),
-            ('ref_corr_2', 'B'),
-            ('ref_corr_3', 'B'),
-            ('ref_corr_4', 'B'),
-            ('ref_amp_1', 'B'),
-            ('ref_amp_2', 'B'),
-            ('ref_amp_3', 'B'),
-            ('ref_amp_4', 'B'),
-            ('ref_pcnt_1', 'B'),
-            ('ref_pcnt_2', 'B'),
-            ('ref_pcnt_3', 'B'),
-            ('ref_pcnt_4', 'B'),
-            ('max_depth', 'H'),
-            ('rssi_1', 'B'),
-            ('rssi_2', 'B'),
-            ('rssi_3', 'B'),
-            ('rssi_4', 'B'),
-            ('gain', 'B'),
-            ('range_msb_1', 'B'),
-            ('range_msb_2', 'B'),
-            ('range_msb_3', 'B'),
-            ('range_msb_4', 'B'),
-        )
-        self.bottom_track = self._unpack_from_format('bottom_track', bottom_track_format, offset)
+        self.bottom_track = self._unpack_from_format('bottom_track', BOTTOM_TRACK_FORMAT, offset)
 
     def _parse_sysconfig(self):
         """
@@ -8,20 +8,22 @@ Generic test Driver for ADCPS-K, ADCPS-I, ADCPT-B and ADCPT-DE
 """
 import time
 import copy
+import struct
 
 import ntplib
+from mi.core.checksum import sum16
 from mi.core.instrument.data_particle import CommonDataParticleType
 
 from mi.core.instrument.port_agent_client import PortAgentPacket
 
-from mi.core.exceptions import InstrumentCommandException
+from mi.core.exceptions import InstrumentCommandException, SampleException
 from mi.core.time_tools import timegm_to_float
 from mi.core.log import get_logger
 
 log = get_logger()
 
 from nose.plugins.attrib import attr
-from mock import Mock
+from mock import Mock, patch
 
 from mi.core.instrument.instrument_driver import ResourceAgentState
 from mi.core.instrument.chunker import StringChunker
@@ -57,6 +59,7 @@ from mi.instrument.teledyne.workhorse.particles import AdcpSystemConfigurationKe
 from mi.instrument.teledyne.workhorse.particles import AdcpPd0ParsedKey
 from mi.instrument.teledyne.workhorse.particles import AdcpAncillarySystemDataKey
 from mi.instrument.teledyne.workhorse.particles import AdcpTransmitPathKey
+from mi.instrument.teledyne.workhorse.particles import AdcpPd0ConfigParticle
 from mi.instrument.teledyne.workhorse.adcp.driver import InstrumentDriver
 
 __author__ = 'Sung Ahn'
@@ -651,6 +654,27 @@ class ADCPTMixin(DriverTestMixin):
         self.assert_data_particle_header(data_particle, WorkhorseDataParticleType.ADCP_TRANSMIT_PATH)
         self.assert_data_particle_parameters(data_particle, self._pt4_dict, verify_values)
 
+    def publish_pd0(self, driver, changes=None):
+        """
+        Send the RSN sample through got_data with some bytes changed and the checksum fixed
+        @param changes dict of byte offset: value
+        @retval sorted stream names of the published particles, except raw
+        """
+        sample = bytearray(RSN_SAMPLE_RAW_DATA)
+        for index, value in (changes or {}).iteritems():
+            sample[index] = value
+        sample[-2:] = struct.pack('<H', sum16(sample[:-2]))
+
+        port_agent_packet = PortAgentPacket()
+        port_agent_packet.attach_data(str(sample))
+        port_agent_packet.attach_timestamp(ntplib.system_to_ntp_time(time.time()))
+        port_agent_packet.pack_header()
+
+        self.clear_data_particle_queue()
+        driver._protocol.got_data(port_agent_packet)
+        return sorted(p.get('stream_name') for p in self._data_particle_received
+                      if p.get('stream_name') != CommonDataParticleType.RAW)
+
     def assert_pd0_particles_published(self, driver, sample_data, verify_values=False):
         """
         Verify that we can send data through the port agent and the the correct particles
@@ -748,6 +772,28 @@ class WorkhorseDriverUnitTest(InstrumentDriverUnitTestCase, ADCPTMixin):
         self.assert_pd0_particles_published(driver, RSN_SAMPLE_RAW_DATA, True)
         self.assert_pd0_particles_published(driver, rsn_sample_raw_data_earth, True)
 
+    def test_metadata_changed(self):
+        """
+        Verify config and engineering particles are only published when their fields change
+        """
+        driver = self._driver_class(self._got_data_event_callback)
+        self.assert_initialize_driver(driver)
+
+        beam = WorkhorseDataParticleType.ADCP_PD0_PARSED_BEAM
+        self.assertEqual(self.publish_pd0(driver), [WorkhorseDataParticleType.ADCP_PD0_CONFIG,
+                                                    WorkhorseDataParticleType.ADCP_PD0_ENGINEERING, beam])
+        # next ensemble number (variable leader offset 77)
+        self.assertEqual(self.publish_pd0(driver, {79: 2}), [beam])
+        # transmit current
+        self.assertEqual(self.publish_pd0(driver, {111: 99}), [WorkhorseDataParticleType.ADCP_PD0_ENGINEERING, beam])
+        # pings per ensemble (fixed leader offset 18)
+        self.assertEqual(self.publish_pd0(driver, {111: 99, 28: 2}), [WorkhorseDataParticleType.ADCP_PD0_CONFIG, beam])
+
+        # a particle which fails to generate is sent with the next record, not dropped until the fields change
+        with patch.object(AdcpPd0ConfigParticle, 'generate', side_effect=SampleException('bad config')):
+            self.assertRaises(SampleException, self.publish_pd0, driver, {111: 99, 28: 3})
+        self.assertEqual(self.publish_pd0(driver, {111: 99, 28: 3}), [WorkhorseDataParticleType.ADCP_PD0_CONFIG, beam])
+
     def test_recover_autosample(self):
         driver = self._driver_class(self._got_data_event_callback)
         self.assert_initialize_driver(driver)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""
+@package mi.instrument.teledyne.workhorse.test.test_pd0_array
+@file mi/instrument/teledyne/workhorse/test/test_pd0_array.py
+@brief Test cases for the numpy PD0 decoder
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import tempfile
+
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTestCase
+from mi.instrument.teledyne.workhorse.pd0_array import AdcpPd0Array, decode_ensembles, decode_file
+from mi.instrument.teledyne.workhorse.pd0_parser import AdcpPd0Record, ChecksumException, InsufficientDataException
+from mi.instrument.teledyne.workhorse.test.test_data import RSN_SAMPLE_RAW_DATA
+
+CELL_FIELDS = ('velocities', 'correlation_magnitudes', 'echo_intensity', 'percent_good')
+
+
+@attr('UNIT', group='mi')
+class Pd0ArrayUnitTest(MiUnitTestCase):
+    def assert_matches_record(self, array, record):
+        for name in ('fixed_data', 'variable_data'):
+            for key, value in getattr(record, name)._asdict().iteritems():
+                self.assertEqual(getattr(array, name)[key], value, '%s.%s' % (name, key))
+        for name in CELL_FIELDS:
+            cells = getattr(record, name)
+            self.assertEqual(getattr(array, name).T.tolist(), [cells.beam1, cells.beam2, cells.beam3, cells.beam4])
+
+    def test_ensemble(self):
+        """
+        Test the decoded ensemble matches AdcpPd0Record and the cell data is a view on the input
+        """
+        array = AdcpPd0Array(RSN_SAMPLE_RAW_DATA)
+        record = AdcpPd0Record(RSN_SAMPLE_RAW_DATA)
+        self.assert_matches_record(array, record)
+        self.assertEqual(tuple(array.offsets), record.offsets)
+        self.assertEqual(array.stored_checksum, record.stored_checksum)
+        self.assertEqual(array.velocities.shape, (100, 4))
+        self.assertFalse(array.velocities.flags.owndata)
+        self.assertIsNone(array.bottom_track)
+
+    def test_invalid(self):
+        corrupt = RSN_SAMPLE_RAW_DATA[:100] + chr(ord(RSN_SAMPLE_RAW_DATA[100]) ^ 1) + RSN_SAMPLE_RAW_DATA[101:]
+        self.assertRaises(ChecksumException, AdcpPd0Array, corrupt)
+        self.assertRaises(InsufficientDataException, AdcpPd0Array, RSN_SAMPLE_RAW_DATA[:-1])
+
+    def test_bulk(self):
+        """
+        Test ensembles are found among noise and stacked along a leading axis
+        """
+        size = len(RSN_SAMPLE_RAW_DATA)
+        data = 'xx\x7f\x7fjunk' + RSN_SAMPLE_RAW_DATA * 3 + 'noise\x7f\x7f' + RSN_SAMPLE_RAW_DATA + \
+               RSN_SAMPLE_RAW_DATA[:100]
+        groups = decode_ensembles(data)
+        self.assertEqual(len(groups), 1)
+        ensembles = groups[0]
+        self.assertEqual(len(ensembles), 4)
+        self.assertEqual(ensembles.starts.tolist(), [8, 8 + size, 8 + 2 * size, 15 + 3 * size])
+        self.assertEqual(ensembles.velocities.shape, (4, 100, 4))
+        record = AdcpPd0Record(RSN_SAMPLE_RAW_DATA)
+        velocities = AdcpPd0Array(RSN_SAMPLE_RAW_DATA).velocities.tolist()
+        for index in range(4):
+            self.assert_matches_record(AdcpPd0Array(data[ensembles.starts[index]:]), record)
+            self.assertEqual(ensembles.velocities[index].tolist(), velocities)
+        self.assertEqual(ensembles.variable_data['ensemble_number'].tolist(),
+                         [record.variable_data.ensemble_number] * 4)
+
+    def test_file(self):
+        fd, path = tempfile.mkstemp(suffix='.pd0')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(RSN_SAMPLE_RAW_DATA * 10)
+        groups = decode_file(path)
+        self.assertEqual([len(group) for group in groups], [10])
+        self.assertEqual(groups[0].fixed_data['number_of_cells'].tolist(), [100] * 10)
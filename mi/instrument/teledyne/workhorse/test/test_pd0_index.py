@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""
+@package mi.instrument.teledyne.workhorse.test.test_pd0_index
+@file mi/instrument/teledyne/workhorse/test/test_pd0_index.py
+@brief Test cases for the PD0 ensemble index
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import shutil
+import struct
+import tempfile
+
+from nose.plugins.attrib import attr
+
+from mi.core.checksum import sum16
+from mi.core.instrument.port_agent_client import HEADER, HEADER_SIZE, PortAgentPacket
+from mi.core.unit_test import MiUnitTestCase
+from mi.instrument.teledyne.workhorse.pd0_index import write_index, load_index, index_path, seek_time, byte_ranges
+from mi.instrument.teledyne.workhorse.pd0_parser import AdcpPd0Record
+from mi.instrument.teledyne.workhorse.particles import AdcpPd0ConfigParticle
+from mi.instrument.teledyne.workhorse.test.test_data import RSN_SAMPLE_RAW_DATA
+
+# variable leader at offset 77, ensemble number and Y2K RTC seconds
+ENSEMBLE_NUMBER_OFFSET = 79
+RTC_SECONDS_OFFSET = 77 + 63
+
+
+def ensemble(number):
+    """
+    The RSN sample with the ensemble number and RTC seconds set to number
+    """
+    sample = bytearray(RSN_SAMPLE_RAW_DATA)
+    sample[ENSEMBLE_NUMBER_OFFSET:ENSEMBLE_NUMBER_OFFSET + 2] = struct.pack('<H', number)
+    sample[RTC_SECONDS_OFFSET] = number
+    sample[-2:] = struct.pack('<H', sum16(sample[:-2]))
+    return str(sample)
+
+
+def packet(data, timestamp, packet_type=PortAgentPacket.DATA_FROM_INSTRUMENT):
+    return HEADER.pack(0xa3, 0x9d, 0x7a, packet_type, len(data) + HEADER_SIZE, 0, timestamp, 0) + data
+
+
+@attr('UNIT', group='mi')
+class Pd0IndexUnitTest(MiUnitTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.base_time = AdcpPd0ConfigParticle(AdcpPd0Record(ensemble(0))).contents['internal_timestamp']
+
+    def write(self, name, data):
+        path = os.path.join(self.path, name)
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        return path
+
+    def test_raw(self):
+        """
+        Test the index of a raw file, seeking by time and splitting into byte ranges
+        """
+        size = len(RSN_SAMPLE_RAW_DATA)
+        path = self.write('adcp.pd0', 'noise' + ''.join(ensemble(n) for n in range(10)))
+        index = write_index(path)
+        self.assertTrue(os.path.exists(index_path(path)))
+        self.assertEqual(index['offset'].tolist(), [5 + n * size for n in range(10)])
+        self.assertEqual(index['length'].tolist(), [size] * 10)
+        self.assertEqual(index['ensemble_number'].tolist(), range(10))
+        self.assertAlmostEqual(index['time'][3], self.base_time + 3, places=3)
+        self.assertEqual(load_index(path).tolist(), index.tolist())
+
+        self.assertEqual(seek_time(index, self.base_time + 6.5), 5 + 7 * size)
+        self.assertIsNone(seek_time(index, self.base_time + 20))
+        self.assertEqual(byte_ranges(index, 2), [(5, 5 + 5 * size), (5 + 5 * size, None)])
+
+        # an empty file can't be memory mapped
+        self.assertEqual(len(write_index(self.write('empty.pd0', ''))), 0)
+        self.assertEqual(len(write_index(self.write('empty.datalog', ''), datalog=True)), 0)
+
+    def test_datalog(self):
+        """
+        Test ensembles split across port agent packets are indexed at the packet holding their first byte
+        """
+        data = ensemble(0) + ensemble(1)
+        split = len(RSN_SAMPLE_RAW_DATA) + 100
+        packets = [packet(data[:split], 1000), packet('{}', 1001, PortAgentPacket.PORT_AGENT_CONFIG),
+                   packet(data[split:], 1002)]
+        path = self.write('adcp.datalog', ''.join(packets))
+        index = write_index(path, datalog=True)
+        self.assertEqual(index['offset'].tolist(), [0, 0])
+        self.assertEqual(index['port_time'].tolist(), [1000, 1000])
+        self.assertEqual(index['ensemble_number'].tolist(), [0, 1])
+
+        data = ensemble(2) + ensemble(3)
+        path = self.write('adcp2.datalog', packet(data[:10], 1000) + packet(data[10:], 1001))
+        index = write_index(path, datalog=True)
+        self.assertEqual(index['offset'].tolist(), [0, 10 + HEADER_SIZE])
@@ -611,16 +611,15 @@ class Protocol(WorkhorseProtocol):
 
             if connection == SlaveProtocol.FOURBEAM:
                 science = particles.VadcpBeamMasterParticle(pd0, port_timestamp=timestamp).generate()
-                config = particles.AdcpPd0ConfigParticle(pd0, port_timestamp=timestamp).generate()
-                engineering = particles.AdcpPd0EngineeringParticle(pd0, port_timestamp=timestamp).generate()
+                metadata = [particles.AdcpPd0ConfigParticle, particles.AdcpPd0EngineeringParticle]
             else:
                 science = particles.VadcpBeamSlaveParticle(pd0, port_timestamp=timestamp).generate()
-                config = particles.VadcpConfigSlaveParticle(pd0, port_timestamp=timestamp).generate()
-                engineering = particles.VadcpEngineeringSlaveParticle(pd0, port_timestamp=timestamp).generate()
+                metadata = [particles.VadcpConfigSlaveParticle, particles.VadcpEngineeringSlaveParticle]
 
             out_particles = [science]
-            for particle in [config, engineering]:
-                if self._changed(particle):
+            for particle_class in metadata:
+                particle = self._generate_changed(particle_class, pd0, timestamp)
+                if particle is not None:
                     out_particles.append(particle)
 
             for particle in out_particles:
@@ -927,6 +927,26 @@ class VadcpDriverUnitTest(WorkhorseDriverUnitTest, VADCPMixin):
 
         self.assert_vadcp_pd0_particles_published(driver, RSN_SAMPLE_RAW_DATA, True)
 
+    def test_metadata_changed(self):
+        """
+        Verify config and engineering particles are only published when they change, per beam set
+        """
+        driver = self._driver_class(self._got_data_event_callback)
+        self.assert_initialize_driver(driver, initial_protocol_state=WorkhorseProtocolState.AUTOSAMPLE)
+        got_data = driver._protocol.got_data
+
+        driver._protocol.got_data = functools.partial(got_data, connection=SlaveProtocol.FOURBEAM)
+        beam = VADCPDataParticleType.VADCP_PD0_BEAM_MASTER
+        self.assertEqual(self.publish_pd0(driver), [WorkhorseDataParticleType.ADCP_PD0_CONFIG,
+                                                    WorkhorseDataParticleType.ADCP_PD0_ENGINEERING, beam])
+        self.assertEqual(self.publish_pd0(driver, {79: 2}), [beam])
+
+        driver._protocol.got_data = functools.partial(got_data, connection=SlaveProtocol.FIFTHBEAM)
+        beam = VADCPDataParticleType.VADCP_PD0_BEAM_SLAVE
+        self.assertEqual(self.publish_pd0(driver), [VADCPDataParticleType.VADCP_PD0_CONFIG_SLAVE,
+                                                    VADCPDataParticleType.VADCP_PD0_ENGINEERING_SLAVE, beam])
+        self.assertEqual(self.publish_pd0(driver, {111: 99}), [VADCPDataParticleType.VADCP_PD0_ENGINEERING_SLAVE, beam])
+
     def test_driver_parameters(self):
         """
         Verify the set of parameters known by the driver
@@ -16,6 +16,7 @@ from datetime import datetime
 import os
 import re
 
+from mi.core.checksum import sum16
 from mi.core.log import get_logger
 from mi.core.common import BaseEnum
 from mi.core.exceptions import SampleException
@@ -362,7 +363,7 @@ class Protocol(CommandResponseInstrumentProtocol):
                 if (start + packet_length + SIZE_OF_CHECKSUM_PLUS_PAD) <= raw_data_len:
                     # validate the checksum, if valid add to the return list
                     checksum = struct.unpack_from('>H', raw_data, start + packet_length)[0]
-                    calulated_checksum = sum(bytearray(raw_data[start:start + packet_length])) & 0xffff
+                    calulated_checksum = sum16(buffer(raw_data, start, packet_length))
                     if checksum == calulated_checksum:
                         return_list.append((match.start(), match.start() + packet_length + SIZE_OF_CHECKSUM_PLUS_PAD))
 